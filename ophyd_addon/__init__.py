@@ -1,14 +1,19 @@
-import intake
+import functools
 
 from ._version import get_versions
+from .catalog_util import LazyCatalog, mongo_normalized_catalog
 
 __version__ = get_versions()["version"]
 del get_versions
 
-# Look up a driver class by its name in the registry.
-catalog_class = intake.registry["bluesky-mongo-normalized-catalog"]
-
-mab_catalog_instance = catalog_class(
-    metadatastore_db="mongodb://localhost:27017/md",
-    asset_registry_db="mongodb://localhost:27017/ar",
+# The catalog is not built until it is used, so importing ophyd_addon
+# (for example in the simulated IOC process) does not import databroker
+# or connect to mongo.
+mab_catalog_instance = LazyCatalog(
+    functools.partial(
+        mongo_normalized_catalog,
+        mongo_uri="mongodb://localhost:27017",
+        metadatastore_db="md",
+        asset_registry_db="ar",
+    )
 )
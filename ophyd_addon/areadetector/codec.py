@@ -0,0 +1,49 @@
+import numpy as np
+
+from ophyd_addon.codec import decompress
+
+
+def decode_array(data, codec, shape, dtype):
+    """
+    Return the frame published by a Codec plugin as a read-only array.
+
+    The array is a view of the decompressed bytes, so a frame is not copied
+    after it is decompressed. Frames sent without compression are a view of
+    data itself.
+
+        array_data, codec, size_x, size_y, data_type = client.get_pvs(
+            "Sim[det1]:Codec1:ArrayData",
+            "Sim[det1]:Codec1:Codec_RBV",
+            "Sim[det1]:Codec1:ArraySize0_RBV",
+            "Sim[det1]:Codec1:ArraySize1_RBV",
+            "Sim[det1]:Codec1:DataType_RBV",
+        )
+        frame = decode_array(
+            array_data.read().data,
+            codec.read().data.tobytes().decode(),
+            shape=(size_y.read().data[0], size_x.read().data[0]),
+            dtype=list(ND_DATA_TYPES.values())[data_type.read().data[0]],
+        )
+
+    Parameters
+    ----------
+    data: bytes-like
+        the compressed bytes, such as the uint8 array read from ArrayData
+    codec: str
+        Codec_RBV, the codec the frame was compressed with
+    shape: tuple of int
+        (ArraySize1_RBV, ArraySize0_RBV)
+    dtype: numpy.dtype
+        the little-endian data type of the frame pixels
+    """
+    dtype = np.dtype(dtype).newbyteorder("<")
+    frame_bytes = int(np.prod(shape)) * dtype.itemsize
+    frame = np.frombuffer(decompress(codec, data, frame_bytes), dtype=dtype)
+    if frame.nbytes != frame_bytes:
+        raise ValueError(
+            f"{codec} data decompressed to {frame.nbytes} bytes, "
+            f"not the {frame_bytes} bytes of a {dtype} frame of shape {shape}"
+        )
+    frame = frame.reshape(shape)
+    frame.flags.writeable = False
+    return frame
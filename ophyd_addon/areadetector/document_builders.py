@@ -5,60 +5,89 @@ from pathlib import Path
 from event_model import compose_resource
 from ophyd import BlueskyInterface, Component as Cpt, DeviceStatus, Kind
 from ophyd.areadetector import plugins, SingleTrigger
+from ophyd.areadetector.base import ADComponent as ADCpt, EpicsSignalWithRBV
+from ophyd.areadetector.cam import PerkinElmerDetectorCam
 from ophyd.areadetector.detectors import PerkinElmerDetector
-from ophyd.areadetector.filestore_mixins import FileStoreTIFFIterativeWrite
+from ophyd.areadetector.filestore_mixins import (
+    FileStoreHDF5,
+    FileStoreTIFF,
+    new_short_uid,
+)
 from ophyd.status import SubscriptionStatus
 
 
-class TiffWriter(plugins.TIFFPlugin, FileStoreTIFFIterativeWrite):
+class TiffWriter(plugins.TIFFPlugin, FileStoreTIFF):
     """
     A combination of areadetector TIFFPlugin and a bluesky document builder
 
     This is not a good name.
     BlueskyTiffPlugin? not great
+
+    Staging sets FilePath, FileName, FileNumber=0 and AutoIncrement=Yes, so
+    every WriteFile writes the next file without any further puts. It also
+    sets FileWriteMode=Single and AutoSave=No, so files are only written by
+    WriteFile, one for each trigger. Each datum refers to the file the next
+    WriteFile will write, its point_number is FileNumber_RBV when the datum
+    is generated.
     """
 
+    # the WriteFile put completes when the file has been written
+    write_file = ADCpt(EpicsSignalWithRBV, "WriteFile", put_complete=True)
+
     def __init__(self, *args, resource_root_path, relative_write_path, **kwargs):
         # TODO: write_path_template=resource_root_path is not quite right
         super().__init__(*args, write_path_template=resource_root_path, **kwargs)
 
         self.resource_root_path = resource_root_path
         self.relative_write_path = relative_write_path
-
-        # for FileStoreTIFFIterativeWrite
-        self._asset_docs_cache = deque()
+        # FileName is this prefix followed by a short uid
+        self.file_name_prefix = ""
 
         # bluesky document building
         self._resource_document = None
         self._datum_factory = None
         self._asset_docs_cache = None
 
+        # FileStoreTIFF stages AutoSave=Yes, which would write every frame
+        # of a trigger to its own file ahead of the WriteFile the datum
+        # refers to
+        self.stage_sigs["auto_save"] = "No"
+
         self.logger = logging.getLogger("TiffWriter")
 
     def get_full_file_path(self):
-        full_file_path = (
-            self.resource_root_path / self.relative_write_path / self.file_name.get()
-        )
-        return full_file_path
+        """
+        Return the path of the last file written, from FullFileName_RBV.
+        """
+        return type(self.resource_root_path)(self.full_file_name.get())
+
+    def make_filename(self):
+        """
+        Called by stage() to choose FileName and FilePath.
+        """
+        write_path = str(self.resource_root_path / self.relative_write_path)
+        return self.file_name_prefix + new_short_uid(), write_path, write_path
 
     def stage(self):
-        # for FileStoreTIFFIterativeWrite
+        # for FileStoreTIFF
         self._asset_docs_cache = deque()
         super().stage()
         self.logger.debug("stage")
         print(f"stage TiffWriter")
-        resource_root_path = str(self.resource_root_path)
-        resource_relative_path = str(
-            self.relative_write_path / Path(self.file_name.get())
-        )
+        # the IOC expands FileTemplate with FilePath, FileName and FileNumber,
+        # the AD_TIFF handler does the same with these resource kwargs
         self._resource_document, self._datum_factory, _ = compose_resource(
             start={
                 "uid": "must be a string now but will be replaced by the RunEngine with a real uid"
             },
-            spec="ADC_TIFF",
-            root=resource_root_path,
-            resource_path=resource_relative_path,
-            resource_kwargs={},
+            spec="AD_TIFF",
+            root=str(self.resource_root_path),
+            resource_path=str(self.relative_write_path),
+            resource_kwargs={
+                "template": self.file_template.get(),
+                "filename": self.file_name.get(),
+                "frame_per_point": 1,
+            },
         )
         self._resource_document.pop("run_start")
 
@@ -66,6 +95,9 @@ class TiffWriter(plugins.TIFFPlugin, FileStoreTIFFIterativeWrite):
         self._asset_docs_cache.append(("resource", self._resource_document))
 
     def generate_datum(self, key, timestamp, datum_kwargs):
+        datum_kwargs = dict(datum_kwargs or {})
+        # the next WriteFile writes FileNumber_RBV
+        datum_kwargs["point_number"] = self.file_number.get()
         datum = super().generate_datum(key, timestamp, datum_kwargs)
         print("TiffWriter got generate_datum!")
         return datum
@@ -77,6 +109,99 @@ class TiffWriter(plugins.TIFFPlugin, FileStoreTIFFIterativeWrite):
         self._datum_factory = None
 
 
+class HDF5Writer(plugins.HDF5Plugin, FileStoreHDF5):
+    """
+    A combination of areadetector HDF5Plugin and a bluesky document builder
+
+    Staging sets FilePath, FileName, FileNumber=0, FileWriteMode=Stream and
+    Capture=1, so every frame the detector publishes until unstage is
+    appended to one HDF5 file. There is one resource for the file and each
+    datum refers to the frames of one trigger, point_number counts the
+    triggers since stage.
+    """
+
+    def __init__(self, *args, resource_root_path, relative_write_path, **kwargs):
+        super().__init__(*args, write_path_template=resource_root_path, **kwargs)
+
+        self.resource_root_path = resource_root_path
+        self.relative_write_path = relative_write_path
+        # FileName is this prefix followed by a short uid
+        self.file_name_prefix = ""
+
+        # bluesky document building
+        self._resource_document = None
+        self._datum_factory = None
+        self._asset_docs_cache = deque()
+        self._point_number = 0
+
+        self.logger = logging.getLogger("HDF5Writer")
+
+    def get_full_file_path(self):
+        """
+        Return the path of the file being written, from FullFileName_RBV.
+        """
+        return type(self.resource_root_path)(self.full_file_name.get())
+
+    def make_filename(self):
+        """
+        Called by stage() to choose FileName and FilePath.
+        """
+        write_path = str(self.resource_root_path / self.relative_write_path)
+        return self.file_name_prefix + new_short_uid(), write_path, write_path
+
+    def get_frames_per_point(self):
+        # an Average acquisition publishes one frame however many it averages
+        if (
+            self.parent.cam.image_mode.get()
+            == PerkinElmerCamera.PerkinElmerImageMode.AVERAGE
+        ):
+            return 1
+        return super().get_frames_per_point()
+
+    def stage(self):
+        self._asset_docs_cache = deque()
+        # skip HDF5Plugin.stage, which refuses a plugin that has not seen a
+        # frame yet, the simulated plugin sizes the dataset from the first
+        # frame of the capture so it does not need to be primed
+        super(plugins.HDF5Plugin, self).stage()
+        self.logger.debug("stage")
+        # staging set FileNumber=0 and the IOC opens the file when the first
+        # frame arrives, ophyd's name for it assumes the file is already open
+        relative_file_path = self.relative_write_path / (
+            self.file_template.get() % ("", self.file_name.get(), 0)
+        )
+        self._resource_document, self._datum_factory, _ = compose_resource(
+            start={
+                "uid": "must be a string now but will be replaced by the RunEngine with a real uid"
+            },
+            spec="AD_HDF5",
+            root=str(self.resource_root_path),
+            resource_path=str(relative_file_path),
+            resource_kwargs={"frame_per_point": self.get_frames_per_point()},
+        )
+        self._resource_document.pop("run_start")
+
+        self._asset_docs_cache = deque()
+        self._asset_docs_cache.append(("resource", self._resource_document))
+        self._point_number = 0
+
+    def generate_datum(self, key, timestamp, datum_kwargs):
+        datum_kwargs = dict(datum_kwargs or {})
+        # the AD_HDF5 handler reads frames point_number * frame_per_point
+        # up to (point_number + 1) * frame_per_point
+        datum_kwargs["point_number"] = self._point_number
+        self._point_number += 1
+        # SingleTrigger gives every file writer of the detector the same key,
+        # the detector reading would keep only one writer's datum under it
+        return super().generate_datum(f"{key}_hdf5", timestamp, datum_kwargs)
+
+    def unstage(self):
+        super().unstage()
+        self.logger.debug("unstage")
+        self._resource_document = None
+        self._datum_factory = None
+
+
 class NDFile:
     class FileWriteMode:
         SINGLE = "Single"
@@ -117,6 +242,10 @@ class PerkinElmerCamera:
         # AVERAGE is unique to the PerkinElmer detector
         AVERAGE = int(3)
 
+    class UseOffset:
+        DISABLE = int(0)
+        ENABLE = int(1)
+
     class TriggerMode:
         INTERNAL = int(0)
         EXTERNAL = int(1)
@@ -132,8 +261,17 @@ def acquire_high_to_low(value, old_value, **kwargs):
     return False
 
 
+class NewPerkinElmerDetectorCam(PerkinElmerDetectorCam):
+    # the IOC holds PEAcquireOffset_RBV at Acquire until the offset is done,
+    # ophyd sets PEAcquireOffset itself on put so it can not be waited on
+    pe_acquire_offset = ADCpt(EpicsSignalWithRBV, "PEAcquireOffset")
+
+
 class NewPerkinElmerDetector(SingleTrigger, PerkinElmerDetector):
+    # ADBase reads nothing by default whatever the kind of its components
+    _default_read_attrs = ("tiff_writer", "stats1")
 
+    cam = Cpt(NewPerkinElmerDetectorCam, "cam1:")
     tiff_writer = Cpt(
         TiffWriter,
         suffix="TIFF1:",
@@ -142,6 +280,35 @@ class NewPerkinElmerDetector(SingleTrigger, PerkinElmerDetector):
         # file_name="sim-detector.tiff"
         kind=Kind.normal
     )
+    # per-frame scalars for the primary stream, without the frames
+    stats1 = Cpt(
+        plugins.StatsPlugin,
+        "Stats1:",
+        read_attrs=[
+            "total",
+            "min_value",
+            "max_value",
+            "mean_value",
+            "sigma",
+            "centroid.x",
+            "centroid.y",
+            "sigma_x",
+            "sigma_y",
+        ],
+        # only the settings the simulated IOC serves, StatsPlugin has more
+        # configuration PVs, such as BgdWidth and ComputeProfiles, and
+        # reading them would time out
+        configuration_attrs=[
+            "enable",
+            "compute_statistics",
+            "compute_centroid",
+            "compute_histogram",
+            "hist_size",
+            "hist_min",
+            "hist_max",
+        ],
+        kind=Kind.normal,
+    )
 
     def __init__(self, *args, name, **kwargs):
         super().__init__(*args, name=name, **kwargs)
@@ -169,3 +336,25 @@ class NewPerkinElmerDetector(SingleTrigger, PerkinElmerDetector):
         print(f"NewPerkinElmerDetector unstage")
         self.logger.debug("unstage")
         super().unstage()
+
+
+class NewPerkinElmerDetectorWithHDF5(NewPerkinElmerDetector):
+    """
+    A NewPerkinElmerDetector that also appends every frame to an HDF5 file
+    with the HDF1 plugin while it is staged.
+
+    HDF5Writer gives each trigger the next frame_per_point frames of the
+    file, so every frame HDF1 receives while staged must come from a
+    trigger. pe_count publishes its dark frames between triggers, so it
+    uses NewPerkinElmerDetector.
+    """
+
+    _default_read_attrs = ("tiff_writer", "hdf5_writer", "stats1")
+
+    hdf5_writer = Cpt(
+        HDF5Writer,
+        suffix="HDF1:",
+        resource_root_path=Path("/tmp"),
+        relative_write_path=Path("hdf5/sim/detector"),
+        kind=Kind.normal,
+    )
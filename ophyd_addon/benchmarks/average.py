@@ -0,0 +1,67 @@
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+
+from ophyd_addon.frame_processing import FrameAverager
+from ophyd_addon.simulated_images import DiffractionImageGenerator
+
+
+def measure_average(frame_count, shape=(2048, 2048)):
+    """
+    Average frame_count simulated frames as ImageMode=Average does.
+
+    Returns a dict with the seconds per added frame, the seconds for the
+    final divide and cast, the bytes allocated while averaging (expected to
+    be close to zero) and the bytes held by the averager's buffers.
+    """
+    image_generator = DiffractionImageGenerator(shape=shape, seed=0)
+    frame = image_generator.generate(exposure=1.0)
+    frame_averager = FrameAverager()
+    # allocate the averager's buffers before measuring
+    frame_averager.add(frame)
+    frame_averager.get_average()
+
+    tracemalloc.start()
+    add_seconds = 0.0
+    for _ in range(frame_count):
+        t0 = time.perf_counter()
+        frame_averager.add(frame)
+        add_seconds += time.perf_counter() - t0
+    t0 = time.perf_counter()
+    average = frame_averager.get_average()
+    average_seconds = time.perf_counter() - t0
+    _, allocated_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    assert average.dtype == np.uint16
+    return {
+        "add_seconds_per_frame": add_seconds / frame_count,
+        "average_seconds": average_seconds,
+        "allocated_bytes": allocated_bytes,
+        "buffer_bytes": frame_averager.nbytes,
+    }
+
+
+def run():
+    """
+    python -m ophyd_addon.benchmarks.average --frame-counts 10 100 500
+    """
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--frame-counts", type=int, nargs="+", default=[10, 100, 500])
+    args = arg_parser.parse_args()
+
+    for frame_count in args.frame_counts:
+        result = measure_average(frame_count)
+        print(
+            f"{frame_count:5d} frames: "
+            f"add {result['add_seconds_per_frame'] * 1000:.2f}ms/frame "
+            f"average {result['average_seconds'] * 1000:.2f}ms "
+            f"buffers {result['buffer_bytes'] / 2**20:.1f}MiB "
+            f"allocated {result['allocated_bytes'] / 2**20:.1f}MiB"
+        )
+
+
+if __name__ == "__main__":
+    run()
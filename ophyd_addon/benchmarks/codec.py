@@ -0,0 +1,85 @@
+import argparse
+import time
+
+from ophyd_addon.areadetector.codec import decode_array
+from ophyd_addon.codec import NO_CODEC, available_codecs, compress
+from ophyd_addon.simulated_images import DiffractionImageGenerator
+
+
+def _seconds_per_repeat(function, repeat):
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - t0) / repeat
+
+
+def measure_codec(codec, shape=(2048, 2048), repeat=10, bandwidth=125e6):
+    """
+    Measure what a Codec plugin codec saves in bandwidth and latency for
+    live viewing of one frame.
+
+    Returns a dict with
+        frame_bytes, compressed_bytes
+            bytes of the frame and of the ArrayData sent for it
+        compress_seconds
+            compressing the frame in the IOC
+        transfer_seconds
+            sending the compressed bytes at bandwidth bytes per second,
+            by default 1 Gbit/s
+        decode_seconds
+            decompressing the frame in the client with decode_array
+        latency_seconds
+            the sum of compress_seconds, transfer_seconds and decode_seconds
+    """
+    frame = DiffractionImageGenerator(shape=shape, seed=0).generate(exposure=1.0).copy()
+    compressed = compress(codec, frame)
+    compress_seconds = _seconds_per_repeat(lambda: compress(codec, frame), repeat)
+    decode_seconds = _seconds_per_repeat(
+        lambda: decode_array(compressed, codec, frame.shape, frame.dtype), repeat
+    )
+    transfer_seconds = len(compressed) / bandwidth
+    return {
+        "frame_bytes": frame.nbytes,
+        "compressed_bytes": len(compressed),
+        "compress_seconds": compress_seconds,
+        "transfer_seconds": transfer_seconds,
+        "decode_seconds": decode_seconds,
+        "latency_seconds": compress_seconds + transfer_seconds + decode_seconds,
+    }
+
+
+def run():
+    """
+    python -m ophyd_addon.benchmarks.codec --repeat 10 --bandwidth 125e6
+    """
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument(
+        "--codecs", nargs="+", default=[NO_CODEC, *available_codecs()]
+    )
+    arg_parser.add_argument("--shape", type=int, nargs=2, default=[2048, 2048])
+    arg_parser.add_argument("--repeat", type=int, default=10)
+    arg_parser.add_argument(
+        "--bandwidth",
+        type=float,
+        default=125e6,
+        help="Channel Access bytes per second, default: 125e6 (1 Gbit/s)",
+    )
+    args = arg_parser.parse_args()
+
+    for codec in args.codecs:
+        result = measure_codec(
+            codec, shape=tuple(args.shape), repeat=args.repeat, bandwidth=args.bandwidth
+        )
+        print(
+            f"{codec:6s}: "
+            f"CA {result['compressed_bytes'] / 2**20:5.1f}MiB "
+            f"({result['compressed_bytes'] / result['frame_bytes']:5.1%}) "
+            f"compress {result['compress_seconds'] * 1000:7.2f}ms "
+            f"transfer {result['transfer_seconds'] * 1000:7.2f}ms "
+            f"decode {result['decode_seconds'] * 1000:6.2f}ms "
+            f"latency {result['latency_seconds'] * 1000:7.2f}ms"
+        )
+
+
+if __name__ == "__main__":
+    run()
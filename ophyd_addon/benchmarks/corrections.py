@@ -0,0 +1,87 @@
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+
+from ophyd_addon.frame_processing import (
+    BadPixelCorrection,
+    GainCorrection,
+    OffsetCorrection,
+)
+from ophyd_addon.simulated_images import DiffractionImageGenerator
+
+
+def measure_corrections(frame_count, shape=(2048, 2048), bad_pixel_fraction=0.001):
+    """
+    Correct frame_count simulated frames as PEUseOffset, PEUseGain and
+    PEUsePixelCorrection do.
+
+    Returns a dict with the seconds per frame of each correction and of all
+    three, and the bytes allocated while correcting, which is expected to
+    be close to zero.
+    """
+    image_generator = DiffractionImageGenerator(shape=shape, seed=0)
+    rng = np.random.default_rng(0)
+
+    offset_correction = OffsetCorrection()
+    offset_correction.set_offset(image_generator.generate(exposure=1.0, dark=True))
+    gain_correction = GainCorrection()
+    gain_correction.set_gain(rng.normal(1.0, 0.05, size=shape))
+    bad_pixel_correction = BadPixelCorrection()
+    bad_pixel_correction.set_bad_pixels(rng.random(size=shape) < bad_pixel_fraction)
+    corrections = {
+        "offset": offset_correction,
+        "gain": gain_correction,
+        "bad_pixel": bad_pixel_correction,
+    }
+
+    frame = image_generator.generate(exposure=1.0).copy()
+    # allocate the corrections' buffers before measuring
+    for correction in corrections.values():
+        correction.apply(frame)
+
+    correction_seconds = {correction_name: 0.0 for correction_name in corrections}
+    tracemalloc.start()
+    for _ in range(frame_count):
+        for correction_name, correction in corrections.items():
+            t0 = time.perf_counter()
+            correction.apply(frame)
+            correction_seconds[correction_name] += time.perf_counter() - t0
+    _, allocated_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result = {
+        f"{correction_name}_seconds_per_frame": seconds / frame_count
+        for correction_name, seconds in correction_seconds.items()
+    }
+    result["seconds_per_frame"] = sum(correction_seconds.values()) / frame_count
+    result["bad_pixel_count"] = bad_pixel_correction.bad_pixel_count
+    result["allocated_bytes"] = allocated_bytes
+    return result
+
+
+def run():
+    """
+    python -m ophyd_addon.benchmarks.corrections --frame-counts 10 100
+    """
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--frame-counts", type=int, nargs="+", default=[10, 100])
+    arg_parser.add_argument("--bad-pixel-fraction", type=float, default=0.001)
+    args = arg_parser.parse_args()
+
+    for frame_count in args.frame_counts:
+        result = measure_corrections(frame_count, bad_pixel_fraction=args.bad_pixel_fraction)
+        print(
+            f"{frame_count:5d} frames: "
+            f"offset {result['offset_seconds_per_frame'] * 1000:.2f}ms/frame "
+            f"gain {result['gain_seconds_per_frame'] * 1000:.2f}ms/frame "
+            f"{result['bad_pixel_count']} bad pixels "
+            f"{result['bad_pixel_seconds_per_frame'] * 1000:.2f}ms/frame "
+            f"total {result['seconds_per_frame'] * 1000:.2f}ms/frame "
+            f"allocated {result['allocated_bytes'] / 2**20:.1f}MiB"
+        )
+
+
+if __name__ == "__main__":
+    run()
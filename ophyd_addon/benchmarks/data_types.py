@@ -0,0 +1,112 @@
+import argparse
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from ophyd_addon.frame_processing import FrameAverager, ReadoutRegion
+from ophyd_addon.ndarray_pool import ND_DATA_TYPES
+from ophyd_addon.simulated_images import DiffractionImageGenerator
+from ophyd_addon.simulated_perkin_elmer_detector_ioc import SimulatedPerkinElmerDetectorIoc
+from ophyd_addon.tiff import write_tiff
+
+
+def _seconds_per_repeat(function, repeat):
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - t0) / repeat
+
+
+def measure_data_type(data_type, shape=(2048, 2048), repeat=10, directory=None):
+    """
+    Measure the cost of serving frames of one DataType from the simulated
+    camera, from readout to the file and the reduction.
+
+    Returns a dict with
+        cast_seconds
+            casting a sensor frame to the DataType as the camera reads it out,
+            zero for UInt16 which is served as a view of the sensor frame
+        frame_bytes
+            bytes of ArrayData sent over Channel Access for each frame
+        encode_seconds
+            converting the frame to big-endian Channel Access data as caproto does
+        tiff_bytes, tiff_seconds
+            size of a TIFF file of the frame and the time to write it
+        average_seconds
+            adding the frame to an ImageMode=Average running sum
+    """
+    dtype = ND_DATA_TYPES[data_type]
+    image_generator = DiffractionImageGenerator(shape=shape, seed=0)
+    sensor_frame = image_generator.generate(exposure=1.0).copy()
+    readout_region = ReadoutRegion(shape)
+    frame = np.empty(shape, dtype=dtype)
+    readout_region.apply(sensor_frame, out=frame)
+    if dtype == sensor_frame.dtype:
+        cast_seconds = 0.0
+    else:
+        cast_seconds = _seconds_per_repeat(
+            lambda: readout_region.apply(sensor_frame, out=frame), repeat
+        )
+
+    _, wire_dtype = SimulatedPerkinElmerDetectorIoc.ARRAY_DATA_TYPES[dtype]
+    flat_frame = frame.reshape(-1).view(wire_dtype)
+    encode_seconds = _seconds_per_repeat(
+        lambda: flat_frame.astype(flat_frame.dtype.newbyteorder(">")), repeat
+    )
+
+    with tempfile.TemporaryDirectory(dir=directory) as tiff_directory:
+        tiff_path = Path(tiff_directory) / "frame.tiff"
+        tiff_seconds = _seconds_per_repeat(lambda: write_tiff(tiff_path, frame), repeat)
+        tiff_bytes = os.path.getsize(tiff_path)
+
+    frame_averager = FrameAverager()
+    frame_averager.add(frame)
+    average_seconds = _seconds_per_repeat(lambda: frame_averager.add(frame), repeat)
+
+    return {
+        "cast_seconds": cast_seconds,
+        "frame_bytes": frame.nbytes,
+        "encode_seconds": encode_seconds,
+        "tiff_bytes": tiff_bytes,
+        "tiff_seconds": tiff_seconds,
+        "average_seconds": average_seconds,
+    }
+
+
+def run():
+    """
+    python -m ophyd_addon.benchmarks.data_types --repeat 10 --directory /data/scratch
+    """
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument(
+        "--data-types",
+        nargs="+",
+        default=list(SimulatedPerkinElmerDetectorIoc.SUPPORTED_DATA_TYPES),
+    )
+    arg_parser.add_argument("--shape", type=int, nargs=2, default=[2048, 2048])
+    arg_parser.add_argument("--repeat", type=int, default=10)
+    arg_parser.add_argument(
+        "--directory", default=None, help="write files here, by default the temporary directory"
+    )
+    args = arg_parser.parse_args()
+
+    for data_type in args.data_types:
+        result = measure_data_type(
+            data_type, shape=tuple(args.shape), repeat=args.repeat, directory=args.directory
+        )
+        print(
+            f"{data_type:8s}: "
+            f"cast {result['cast_seconds'] * 1000:6.2f}ms "
+            f"CA {result['frame_bytes'] / 2**20:5.1f}MiB "
+            f"encode {result['encode_seconds'] * 1000:6.2f}ms "
+            f"TIFF {result['tiff_bytes'] / 2**20:5.1f}MiB "
+            f"{result['tiff_seconds'] * 1000:6.2f}ms "
+            f"average {result['average_seconds'] * 1000:6.2f}ms/frame"
+        )
+
+
+if __name__ == "__main__":
+    run()
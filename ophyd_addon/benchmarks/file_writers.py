@@ -0,0 +1,101 @@
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+from ophyd_addon.hdf5 import HDF5FrameWriter
+from ophyd_addon.simulated_images import DiffractionImageGenerator
+from ophyd_addon.tiff import write_tiff
+
+
+def _write_rates(write_seconds, file_count, frames):
+    frame_bytes = sum(frame.nbytes for frame in frames)
+    return {
+        "seconds": write_seconds,
+        "files_per_second": file_count / write_seconds,
+        "frames_per_second": len(frames) / write_seconds,
+        "megabytes_per_second": frame_bytes / 2**20 / write_seconds,
+    }
+
+
+def measure_tiff(directory, frames):
+    """
+    Write each frame to its own TIFF file as the TIFF1 plugin does.
+    """
+    t0 = time.perf_counter()
+    for frame_number, frame in enumerate(frames):
+        write_tiff(Path(directory) / f"frame_{frame_number:06d}.tiff", frame)
+    return _write_rates(time.perf_counter() - t0, len(frames), frames)
+
+
+def measure_hdf5(directory, frames, frames_per_chunk=1, compression="None", compression_level=None):
+    """
+    Append all frames to one HDF5 file as the HDF1 plugin does in Stream mode.
+    """
+    t0 = time.perf_counter()
+    with HDF5FrameWriter(
+        Path(directory) / "frames.h5",
+        frame_shape=frames[0].shape,
+        dtype=frames[0].dtype,
+        frames_per_chunk=frames_per_chunk,
+        compression=compression,
+        compression_level=compression_level,
+    ) as hdf5_frame_writer:
+        for frame in frames:
+            hdf5_frame_writer.append([frame])
+    return _write_rates(time.perf_counter() - t0, 1, frames)
+
+
+def measure_file_writers(frame_count, shape=(2048, 2048), directory=None, z_level=1):
+    """
+    Write frame_count simulated frames as TIFF files and as HDF5 files with
+    and without zlib compression.
+
+    Returns a dict of the write rates of each writer. Frames are generated
+    before writing so only writing is measured. The files are written to a
+    temporary directory in directory, which should be on the filesystem
+    being measured.
+    """
+    image_generator = DiffractionImageGenerator(shape=shape, seed=0)
+    frames = [image_generator.generate(exposure=1.0).copy() for _ in range(frame_count)]
+
+    results = {}
+    with tempfile.TemporaryDirectory(dir=directory) as tiff_directory:
+        results["tiff"] = measure_tiff(tiff_directory, frames)
+    with tempfile.TemporaryDirectory(dir=directory) as hdf5_directory:
+        results["hdf5"] = measure_hdf5(hdf5_directory, frames)
+    with tempfile.TemporaryDirectory(dir=directory) as hdf5_directory:
+        results["hdf5_zlib"] = measure_hdf5(
+            hdf5_directory, frames, compression="zlib", compression_level=z_level
+        )
+    return results
+
+
+def run():
+    """
+    python -m ophyd_addon.benchmarks.file_writers --frame-counts 10 100 --directory /data/scratch
+    """
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--frame-counts", type=int, nargs="+", default=[10, 100])
+    arg_parser.add_argument("--shape", type=int, nargs=2, default=[2048, 2048])
+    arg_parser.add_argument(
+        "--directory", default=None, help="write files here, by default the temporary directory"
+    )
+    arg_parser.add_argument("--z-level", type=int, default=1)
+    args = arg_parser.parse_args()
+
+    for frame_count in args.frame_counts:
+        results = measure_file_writers(
+            frame_count, shape=tuple(args.shape), directory=args.directory, z_level=args.z_level
+        )
+        for writer_name, result in results.items():
+            print(
+                f"{frame_count:5d} frames {writer_name:10s}: "
+                f"{result['files_per_second']:8.1f} files/s "
+                f"{result['frames_per_second']:8.1f} frames/s "
+                f"{result['megabytes_per_second']:8.1f}MiB/s"
+            )
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,74 @@
+import argparse
+import json
+import subprocess
+import sys
+
+
+# run in a fresh interpreter so nothing is already imported
+IMPORT_SCRIPT = """\
+import json
+import sys
+import time
+
+t0 = time.perf_counter()
+import ophyd_addon
+elapsed = time.perf_counter() - t0
+
+print(json.dumps({
+    "import_seconds": elapsed,
+    "modules": sorted(m for m in sys.modules if m.split(".")[0] in %r),
+}))
+"""
+
+HEAVY_PACKAGES = ("databroker", "intake", "pymongo")
+
+
+def measure_import(repeat=5):
+    """
+    Import ophyd_addon in `repeat` fresh interpreters.
+
+    Returns a dict with the best and worst import time in seconds and the
+    heavy modules (databroker, intake, pymongo) that were imported.
+    """
+    script = IMPORT_SCRIPT % (HEAVY_PACKAGES,)
+    import_seconds = []
+    heavy_modules = set()
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", script],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        result = json.loads(output.splitlines()[-1])
+        import_seconds.append(result["import_seconds"])
+        heavy_modules.update(result["modules"])
+
+    return {
+        "best_seconds": min(import_seconds),
+        "worst_seconds": max(import_seconds),
+        "heavy_modules": sorted(heavy_modules),
+    }
+
+
+def run():
+    """
+    python -m ophyd_addon.benchmarks.import_time --repeat 10
+    """
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--repeat", type=int, default=5)
+    args = arg_parser.parse_args()
+
+    result = measure_import(repeat=args.repeat)
+    print(
+        f"import ophyd_addon: best {result['best_seconds'] * 1000:.1f}ms "
+        f"worst {result['worst_seconds'] * 1000:.1f}ms"
+    )
+    if result["heavy_modules"]:
+        print(f"heavy modules imported: {result['heavy_modules']}")
+    else:
+        print(f"none of {HEAVY_PACKAGES} were imported")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,181 @@
+import argparse
+import gc
+import json
+from pathlib import Path
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from ophyd_addon.simulated_images import DiffractionImageGenerator
+from ophyd_addon.simulated_perkin_elmer_detector_ioc import SimulatedPerkinElmerDetectorIoc
+
+
+def measure_pvdb(detector_count, shape=(64, 64)):
+    """
+    Measure the cost of building the PVGroups and pvdb of detector_count
+    simulated detectors in one process, as a beamline simulation would.
+
+    The frames are kept small so the NDArray pools do not hide the cost
+    of the PVs themselves.
+
+    Returns a dict with
+        pv_count
+            PVs in the pvdb of each detector
+        seconds_per_detector
+            building one detector and its pvdb
+        kib_per_detector
+            Python memory held by one detector after it is built, as
+            counted by tracemalloc
+        settings_bytes_per_detector
+            the part of that held by the settings of the camera and its
+            plugins, see ioc_util.rbv_settings
+    """
+    # build one detector first so imports and class caches are not counted
+    SimulatedPerkinElmerDetectorIoc(
+        prefix="Sim[warmup]",
+        macros=dict(camera="cam1"),
+        image_generator=DiffractionImageGenerator(shape=shape, seed=0),
+    )
+    image_generators = [
+        DiffractionImageGenerator(shape=shape, seed=detector_index)
+        for detector_index in range(detector_count)
+    ]
+
+    def build_detectors():
+        return [
+            SimulatedPerkinElmerDetectorIoc(
+                prefix=f"Sim[det{detector_index}]",
+                macros=dict(camera="cam1"),
+                image_generator=image_generator,
+            )
+            for detector_index, image_generator in enumerate(image_generators)
+        ]
+
+    # time and memory are measured separately, tracemalloc slows down
+    # every allocation
+    gc.collect()
+    t0 = time.perf_counter()
+    detectors = build_detectors()
+    elapsed = time.perf_counter() - t0
+    pv_count = len(detectors[0].pvdb)
+    del detectors
+    gc.collect()
+
+    tracemalloc.start()
+    try:
+        memory_start, _ = tracemalloc.get_traced_memory()
+        detectors = build_detectors()
+        gc.collect()
+        memory_end, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    settings_bytes = sum(
+        sys.getsizeof(group.settings)
+        for detector in detectors
+        for group in (detector, *detector.groups.values())
+        if hasattr(group, "settings")
+    )
+    del detectors
+
+    return {
+        "pv_count": pv_count,
+        "seconds_per_detector": elapsed / detector_count,
+        "kib_per_detector": (memory_end - memory_start) / detector_count / 1024,
+        "settings_bytes_per_detector": settings_bytes / detector_count,
+    }
+
+
+# run in a fresh interpreter with import_path first on sys.path, so
+# ophyd_addon is imported from the tree being measured
+PVDB_SCRIPT = """\
+import json
+import logging
+import runpy
+import sys
+
+sys.path.insert(0, %r)
+logging.disable(logging.WARNING)
+pvdb_benchmark = runpy.run_path(%r)
+print(json.dumps(pvdb_benchmark["measure_pvdb"](%d, shape=%r)))
+"""
+
+# the tree this benchmark is part of
+CURRENT_IMPORT_PATH = str(Path(__file__).resolve().parents[2])
+
+
+def measure_pvdb_tree(detector_count, shape=(64, 64), import_path=CURRENT_IMPORT_PATH):
+    """
+    Run measure_pvdb in a fresh interpreter against the ophyd_addon found
+    in import_path, for example a git worktree of an older commit.
+
+    Returns the dict of measure_pvdb. A tree without RBVSettings reports
+    0 settings bytes.
+    """
+    script = PVDB_SCRIPT % (str(import_path), __file__, detector_count, tuple(shape))
+    output = subprocess.run(
+        [sys.executable, "-c", script],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def run():
+    """
+    python -m ophyd_addon.benchmarks.pvdb --counts 1 12 48 --baseline /tmp/pvdb-baseline
+
+    --baseline is a checkout of the tree to compare with, such as the commit
+    before the setpoints were declared with pvproperty_with_rbv:
+
+        git worktree add /tmp/pvdb-baseline <commit>
+
+    Each tree is measured in a fresh interpreter.
+
+    Before pvproperty_with_rbv (commit 959ea1c), with it (35fd934) and with
+    DataType_RBV served as an mbbi record (2581b32), best of 3 runs:
+
+      before      1 detectors: 286 PVs each build   7.71ms memory   812.3KiB settings     0B per detector
+      rbv pairs   1 detectors: 292 PVs each build   6.02ms memory   816.7KiB settings   784B per detector
+      mbbi        1 detectors: 292 PVs each build   7.65ms memory  1024.8KiB settings   784B per detector
+      before     12 detectors: 286 PVs each build   6.65ms memory   809.3KiB settings     0B per detector
+      rbv pairs  12 detectors: 292 PVs each build   7.22ms memory   813.5KiB settings   784B per detector
+      mbbi       12 detectors: 292 PVs each build   8.73ms memory  1021.7KiB settings   784B per detector
+      before     48 detectors: 286 PVs each build  11.83ms memory   808.8KiB settings     0B per detector
+      rbv pairs  48 detectors: 292 PVs each build  10.03ms memory   813.0KiB settings   784B per detector
+      mbbi       48 detectors: 292 PVs each build  16.03ms memory  1021.1KiB settings   784B per detector
+
+    Build time and memory per detector hardly grow with the number of
+    detectors, and the build times are within the noise of the machine.
+    pvproperty_with_rbv adds about 4KiB per detector: the _RBV readbacks of
+    the six PE setpoints and less than 1KiB of settings. Nearly all of the
+    memory is one caproto ChannelData per PV. The mbbi record adds about
+    200KiB, the ChannelData of the record fields of DataType_RBV.
+    """
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--counts", type=int, nargs="+", default=[1, 12, 48])
+    arg_parser.add_argument("--shape", type=int, nargs=2, default=[64, 64])
+    arg_parser.add_argument("--baseline", help="import path of the tree to compare with")
+    args = arg_parser.parse_args()
+
+    import_paths = {"current": CURRENT_IMPORT_PATH}
+    if args.baseline is not None:
+        import_paths = {"baseline": args.baseline, **import_paths}
+
+    for detector_count in args.counts:
+        for tree_name, import_path in import_paths.items():
+            result = measure_pvdb_tree(
+                detector_count, shape=args.shape, import_path=import_path
+            )
+            print(
+                f"{tree_name:>8s} {detector_count:4d} detectors: "
+                f"{result['pv_count']} PVs each "
+                f"build {result['seconds_per_detector'] * 1000:6.2f}ms "
+                f"memory {result['kib_per_detector']:7.1f}KiB "
+                f"settings {result['settings_bytes_per_detector']:5.0f}B per detector"
+            )
+
+
+if __name__ == "__main__":
+    run()
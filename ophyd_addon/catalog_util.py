@@ -0,0 +1,102 @@
+import functools
+import threading
+
+
+@functools.lru_cache(maxsize=None)
+def get_mongo_client(mongo_uri):
+    """
+    Return one pymongo.MongoClient per URI.
+
+    Every catalog built from the same URI shares this client and
+    therefore its connection pool.
+    """
+    import pymongo
+
+    return pymongo.MongoClient(mongo_uri)
+
+
+def mongo_normalized_catalog(mongo_uri, metadatastore_db, asset_registry_db, **kwargs):
+    """
+    Build a bluesky-mongo-normalized-catalog backed by a single MongoClient.
+
+    Parameters
+    ----------
+    mongo_uri: str
+        for example "mongodb://localhost:27017"
+    metadatastore_db: str
+        name of the metadatastore database, for example "md"
+    asset_registry_db: str
+        name of the asset registry database, for example "ar"
+    kwargs:
+        passed on to the catalog driver, for example handler_registry
+    """
+    # intake and databroker are expensive to import so wait until
+    # a catalog is actually requested
+    import intake
+
+    catalog_class = intake.registry["bluesky-mongo-normalized-catalog"]
+    mongo_client = get_mongo_client(mongo_uri)
+    return catalog_class(
+        metadatastore_db=mongo_client[metadatastore_db],
+        asset_registry_db=mongo_client[asset_registry_db],
+        **kwargs,
+    )
+
+
+class LazyCatalog:
+    """
+    Stand in for a catalog until the catalog is needed.
+
+    The catalog is built by calling factory() on the first attribute access,
+    item access, iteration or call. Suitable as the target of an
+    intake.catalogs entry point, for example
+
+        mab_catalog_instance = LazyCatalog(
+            functools.partial(mongo_normalized_catalog, "mongodb://localhost:27017", "md", "ar")
+        )
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._catalog = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_built(self):
+        return self._catalog is not None
+
+    def get_catalog(self):
+        if self._catalog is None:
+            with self._lock:
+                if self._catalog is None:
+                    self._catalog = self._factory()
+        return self._catalog
+
+    def __getattr__(self, name):
+        # only called for attributes not found on the LazyCatalog itself
+        if name in ("_factory", "_catalog", "_lock"):
+            raise AttributeError(name)
+        return getattr(self.get_catalog(), name)
+
+    def __getitem__(self, key):
+        return self.get_catalog()[key]
+
+    def __iter__(self):
+        return iter(self.get_catalog())
+
+    def __len__(self):
+        return len(self.get_catalog())
+
+    def __contains__(self, key):
+        return key in self.get_catalog()
+
+    def __call__(self, *args, **kwargs):
+        return self.get_catalog()(*args, **kwargs)
+
+    def __dir__(self):
+        return sorted(set(super().__dir__()) | set(dir(self.get_catalog())))
+
+    def __repr__(self):
+        if self._catalog is None:
+            return f"<LazyCatalog (not built) factory={self._factory!r}>"
+        return f"<LazyCatalog {self._catalog!r}>"
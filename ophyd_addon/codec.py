@@ -0,0 +1,86 @@
+import importlib.util
+import zlib
+
+import numpy as np
+
+
+# the codecs in order of preference and the module each of them requires,
+# zlib is in the standard library so it is always available
+CODEC_MODULES = {"Blosc": "blosc", "LZ4": "lz4", "zlib": "zlib"}
+
+# areaDetector Codec plugin Compressor name for frames that are not compressed
+NO_CODEC = "None"
+
+# zlib at level 1 compresses about as well as level 6 in a fifth of the time
+ZLIB_LEVEL = 1
+BLOSC_LEVEL = 5
+
+
+def available_codecs():
+    """
+    Return the names of the codecs whose modules are installed, best first.
+    """
+    return tuple(
+        codec
+        for codec, module_name in CODEC_MODULES.items()
+        if importlib.util.find_spec(module_name) is not None
+    )
+
+
+def compress(codec, frame):
+    """
+    Return the bytes of frame compressed with codec, a key of CODEC_MODULES
+    or NO_CODEC.
+
+    The frame is compressed little-endian from its buffer, as
+    areadetector.codec.decode_array decodes it on any host. A frame that is
+    big-endian or not C contiguous is copied first. Blosc shuffles the bytes
+    of each pixel before compressing, which suits detector frames whose
+    high bytes change slowly.
+    """
+    frame = np.ascontiguousarray(frame.astype(frame.dtype.newbyteorder("<"), copy=False))
+    if codec == NO_CODEC:
+        return frame.tobytes()
+    elif codec == "zlib":
+        return zlib.compress(frame, ZLIB_LEVEL)
+    elif codec == "LZ4":
+        import lz4.frame
+
+        return lz4.frame.compress(frame)
+    elif codec == "Blosc":
+        import blosc
+
+        return blosc.compress(
+            frame, typesize=frame.itemsize, clevel=BLOSC_LEVEL, shuffle=blosc.SHUFFLE
+        )
+    else:
+        raise ValueError(
+            f"codec must be one of {(NO_CODEC, *CODEC_MODULES)}, not {codec!r}"
+        )
+
+
+def decompress(codec, data, uncompressed_bytes):
+    """
+    Return the bytes of data decompressed with codec.
+
+    data is any object with the buffer interface, such as the uint8 array
+    read from a waveform PV. With NO_CODEC it is returned as it is.
+    uncompressed_bytes sizes the zlib output buffer so it is not grown
+    while decompressing.
+    """
+    if codec == NO_CODEC:
+        return data
+    elif codec == "zlib":
+        return zlib.decompress(data, bufsize=uncompressed_bytes)
+    elif codec == "LZ4":
+        import lz4.frame
+
+        return lz4.frame.decompress(data)
+    elif codec == "Blosc":
+        import blosc
+
+        return blosc.decompress(data)
+    else:
+        raise ValueError(
+            f"codec must be one of {(NO_CODEC, *CODEC_MODULES)}, not {codec!r}"
+        )
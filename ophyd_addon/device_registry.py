@@ -0,0 +1,146 @@
+import functools
+import logging
+import threading
+import time
+
+from ophyd import Signal
+
+
+logger = logging.getLogger(__name__)
+
+
+def connect_device(device, timeout, signal_names=()):
+    """
+    Connect the signals of a device concurrently and time each connection.
+
+    The non-lazy signals of the device are connected, and the lazy signals
+    named in signal_names, such as the signals a plan puts to. Other lazy
+    signals are left to connect when they are first used, so a PV the IOC
+    does not serve only fails when something uses it. Every signal is
+    instantiated before waiting so all Channel Access searches are in
+    flight at the same time. There is a single timeout for the whole device.
+
+    Parameters
+    ----------
+    device: ophyd.Device
+    timeout: float
+        seconds to wait for the signals to connect
+    signal_names: iterable of str, optional
+        dotted names of lazy signals to connect too, for example "cam.acquire"
+
+    Returns
+    -------
+    dict of signal dotted name to seconds until the signal connected,
+    signals that did not connect are not included
+
+    Raises
+    ------
+    TimeoutError if any signal did not connect before timeout
+    """
+    signals = {
+        signal_walk.dotted_name: signal_walk.item
+        for signal_walk in device.walk_signals(include_lazy=False)
+    }
+    for dotted_name in signal_names:
+        # getattr instantiates a lazy signal and its parent devices
+        signals[dotted_name] = functools.reduce(getattr, dotted_name.split("."), device)
+
+    connection_times = {}
+    t0 = time.monotonic()
+
+    def timing_callback_factory(dotted_name):
+        def timing_callback(*, connected=False, **kwargs):
+            if connected and dotted_name not in connection_times:
+                connection_times[dotted_name] = time.monotonic() - t0
+
+        return timing_callback
+
+    subscriptions = []
+    for dotted_name, signal in signals.items():
+        timing_callback = timing_callback_factory(dotted_name)
+        cid = signal.subscribe(timing_callback, event_type=Signal.SUB_META, run=False)
+        subscriptions.append((signal, cid))
+        # some signals connected before there was a subscription
+        # or will never send a metadata event, for example soft signals
+        timing_callback(connected=signal.connected)
+
+    try:
+        while not all(signal.connected for signal in signals.values()):
+            if time.monotonic() - t0 > timeout:
+                unconnected = ", ".join(
+                    dotted_name
+                    for dotted_name, signal in signals.items()
+                    if not signal.connected
+                )
+                raise TimeoutError(
+                    f"{device.name}: signals did not connect in {timeout}s: {unconnected}"
+                )
+            time.sleep(min(0.05, timeout / 10))
+    finally:
+        for signal, cid in subscriptions:
+            signal.unsubscribe(cid)
+        log_connection_times(device, connection_times, len(subscriptions))
+
+    return connection_times
+
+
+def log_connection_times(device, connection_times, signal_count, slowest=10):
+    slowest_signals = sorted(
+        connection_times.items(), key=lambda name_and_time: name_and_time[1], reverse=True
+    )[:slowest]
+    logger.info(
+        "%s: %d of %d signals connected in %.3fs",
+        device.name,
+        len(connection_times),
+        signal_count,
+        max(connection_times.values(), default=0.0),
+    )
+    for dotted_name, connection_time in slowest_signals:
+        logger.info("    %s connected after %.3fs", dotted_name, connection_time)
+
+
+class DeviceRegistry:
+    """
+    Build ophyd devices on first use and cache the connected device per prefix.
+
+        pe_detector_registry = DeviceRegistry(NewPerkinElmerDetector, name="perkin_elmer_det1")
+        pe_detector = pe_detector_registry.get("XF:07BM-ES[Det:PE1]:")
+
+    Connection times for each signal are kept in connection_times[prefix].
+    See connect_device for which signals are connected, signal_names names
+    lazy signals to connect as well.
+    """
+
+    def __init__(self, device_class, **device_kwargs):
+        self.device_class = device_class
+        self.device_kwargs = device_kwargs
+        self.connection_times = {}
+        self._devices = {}
+        self._lock = threading.Lock()
+
+    def get(self, prefix, *, timeout=10.0, signal_names=(), **device_kwargs):
+        with self._lock:
+            if prefix not in self._devices:
+                device = self.device_class(
+                    prefix=prefix, **{**self.device_kwargs, **device_kwargs}
+                )
+                try:
+                    self.connection_times[prefix] = connect_device(
+                        device, timeout=timeout, signal_names=signal_names
+                    )
+                except TimeoutError:
+                    # do not cache a half-connected device
+                    device.destroy()
+                    raise
+                self._devices[prefix] = device
+            return self._devices[prefix]
+
+    def __contains__(self, prefix):
+        return prefix in self._devices
+
+    def clear(self):
+        with self._lock:
+            for device in self._devices.values():
+                device.destroy()
+            self._devices.clear()
+            self.connection_times.clear()
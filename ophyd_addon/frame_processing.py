@@ -0,0 +1,659 @@
+import numpy as np
+
+
+class FrameAverager:
+    """
+    Average a sequence of frames with a preallocated running sum.
+
+    Frames of 8 or 16 bit integers are summed in 32 bit integers, which
+    can not overflow before 65537 uint16 frames, and 32 or 64 bit integers
+    in 64 bit integers, so every pixel value is summed exactly. Floating
+    point frames are summed in float64, float32 would round pixels above
+    2**24 and lose precision over long averages. The running sum and the
+    average are allocated when the first frame arrives and reused as long
+    as frames keep the same shape and dtype, so adding a frame does not
+    allocate memory.
+
+        frame_averager.reset()
+        for frame in frames:
+            frame_averager.add(frame)
+        average = frame_averager.get_average()
+    """
+
+    def __init__(self):
+        self.frame_count = 0
+        self._sum = None
+        self._average = None
+
+    @staticmethod
+    def sum_dtype(frame_dtype):
+        frame_dtype = np.dtype(frame_dtype)
+        if frame_dtype.kind == "u":
+            return np.dtype(np.uint32 if frame_dtype.itemsize <= 2 else np.uint64)
+        elif frame_dtype.kind == "i":
+            return np.dtype(np.int32 if frame_dtype.itemsize <= 2 else np.int64)
+        return np.dtype(np.float64)
+
+    @property
+    def nbytes(self):
+        """
+        Bytes used by the running sum and average buffers.
+        """
+        return sum(buffer.nbytes for buffer in (self._sum, self._average) if buffer is not None)
+
+    def reset(self):
+        self.frame_count = 0
+
+    def _allocate(self, frame):
+        if (
+            self._average is None
+            or self._average.shape != frame.shape
+            or self._average.dtype != frame.dtype
+        ):
+            self._sum = np.empty(frame.shape, dtype=self.sum_dtype(frame.dtype))
+            self._average = np.empty(frame.shape, dtype=frame.dtype)
+
+    def add(self, frame):
+        if self.frame_count == 0:
+            self._allocate(frame)
+            np.copyto(self._sum, frame, casting="unsafe")
+        else:
+            np.add(self._sum, frame, out=self._sum, casting="unsafe")
+        self.frame_count += 1
+
+    def get_average(self, out=None):
+        """
+        Return the average of the frames added since reset().
+
+        The running sum is divided once and cast to the frame dtype, integer
+        averages are rounded to the nearest integer. The
+        running sum is consumed, the next add() starts a new average.
+
+        Parameters
+        ----------
+        out: numpy.ndarray, optional
+            array of the frame shape to write the average into
+
+        Returns
+        -------
+        out, or the preallocated average which is overwritten by the next average
+        """
+        if self.frame_count == 0:
+            raise ValueError("no frames have been added")
+        if out is None:
+            out = self._average
+        if self._sum.dtype.kind in "ui":
+            # round rather than truncate, floor division rounds negative
+            # sums the same way
+            np.add(self._sum, self.frame_count // 2, out=self._sum)
+            np.floor_divide(self._sum, self.frame_count, out=out, casting="unsafe")
+        else:
+            np.divide(self._sum, self.frame_count, out=out, casting="unsafe")
+        self.frame_count = 0
+        return out
+
+
+class OffsetCorrection:
+    """
+    Subtract a stored offset (dark) image from frames in place.
+
+    Unsigned frames are clipped at zero rather than wrapping around: each
+    pixel is first raised to at least its offset and then the offset is
+    subtracted, two in-place passes with no temporary arrays.
+    """
+
+    def __init__(self):
+        self._offset = None
+
+    @property
+    def available(self):
+        return self._offset is not None
+
+    @property
+    def offset(self):
+        return self._offset
+
+    def set_offset(self, offset_image):
+        """
+        Store a copy of offset_image, reusing the existing buffer if possible.
+        """
+        if (
+            self._offset is None
+            or self._offset.shape != offset_image.shape
+            or self._offset.dtype != offset_image.dtype
+        ):
+            self._offset = np.empty_like(offset_image)
+        np.copyto(self._offset, offset_image)
+
+    def clear(self):
+        self._offset = None
+
+    def apply(self, frame):
+        """
+        Subtract the offset from frame in place and return frame.
+        """
+        if self._offset is None:
+            raise ValueError("no offset image is available")
+        if frame.dtype.kind == "u":
+            np.maximum(frame, self._offset, out=frame)
+        np.subtract(frame, self._offset, out=frame, casting="unsafe")
+        return frame
+
+
+def load_correction_map(file_path):
+    """
+    Load a 2D gain or pixel correction map from a .npy or TIFF file.
+
+    Reading TIFF files requires tifffile.
+    """
+    file_path = str(file_path)
+    if file_path.lower().endswith((".tif", ".tiff")):
+        import tifffile
+
+        correction_map = tifffile.imread(file_path)
+    else:
+        correction_map = np.load(file_path)
+    if correction_map.ndim != 2:
+        raise ValueError(f"expected a 2D correction map, not {correction_map.ndim}D")
+    return correction_map
+
+
+class GainCorrection:
+    """
+    Flat-field frames in place with a precomputed gain multiplier.
+
+    The multiplier is the mean gain divided by the gain of each pixel so
+    corrected frames keep their overall level. Pixels with a gain of zero
+    or a non-finite gain are left unchanged. Corrected integer frames are
+    rounded and clipped to the range of their dtype, the float32 product
+    is kept in a buffer that is reused for every frame.
+    """
+
+    def __init__(self):
+        self._multiplier = None
+        self._product = None
+
+    @property
+    def available(self):
+        return self._multiplier is not None
+
+    @property
+    def multiplier(self):
+        return self._multiplier
+
+    def set_gain(self, gain_map):
+        gain_map = np.asarray(gain_map, dtype=np.float32)
+        good_gain = np.isfinite(gain_map) & (gain_map > 0)
+        if not good_gain.any():
+            raise ValueError("the gain map has no positive gains")
+        multiplier = np.ones(gain_map.shape, dtype=np.float32)
+        np.divide(gain_map[good_gain].mean(), gain_map, out=multiplier, where=good_gain)
+        self._multiplier = multiplier
+        self._product = np.empty_like(multiplier)
+
+    def clear(self):
+        self._multiplier = None
+        self._product = None
+
+    def apply(self, frame):
+        """
+        Multiply frame by the gain multiplier in place and return frame.
+        """
+        if self._multiplier is None:
+            raise ValueError("no gain map is available")
+        if frame.dtype.kind == "f":
+            np.multiply(frame, self._multiplier, out=frame, casting="unsafe")
+            return frame
+        np.multiply(frame, self._multiplier, out=self._product)
+        np.rint(self._product, out=self._product)
+        dtype_info = np.iinfo(frame.dtype)
+        np.clip(self._product, dtype_info.min, dtype_info.max, out=self._product)
+        np.copyto(frame, self._product, casting="unsafe")
+        return frame
+
+
+class BadPixelCorrection:
+    """
+    Replace bad pixels in place with the mean of their good neighbours.
+
+    A pixel correction map marks bad pixels with non-zero values. When the
+    map is set the flat indices of the bad pixels and of their up to 8 good
+    neighbours are computed once, so each frame is corrected by gathering
+    the neighbours of all bad pixels at once and taking a weighted sum, with
+    no loop over pixels. Bad pixels with no good neighbours are set to zero.
+    """
+
+    # row and column offsets of the 8 neighbours of a pixel
+    _NEIGHBOUR_OFFSETS = tuple(
+        (row_offset, column_offset)
+        for row_offset in (-1, 0, 1)
+        for column_offset in (-1, 0, 1)
+        if (row_offset, column_offset) != (0, 0)
+    )
+
+    def __init__(self):
+        self._shape = None
+        self._bad_pixel_indices = None
+        self._neighbour_indices = None
+        self._neighbour_weights = None
+        self._neighbours = None
+        self._weighted_neighbours = None
+        self._replacements = None
+
+    @property
+    def available(self):
+        return self._bad_pixel_indices is not None
+
+    @property
+    def bad_pixel_count(self):
+        return 0 if self._bad_pixel_indices is None else len(self._bad_pixel_indices)
+
+    def set_bad_pixels(self, pixel_correction_map):
+        bad_pixel_mask = np.asarray(pixel_correction_map) != 0
+        size_y, size_x = bad_pixel_mask.shape
+        bad_rows, bad_columns = np.nonzero(bad_pixel_mask)
+
+        neighbour_count = len(self._NEIGHBOUR_OFFSETS)
+        neighbour_indices = np.zeros((len(bad_rows), neighbour_count), dtype=np.intp)
+        good_neighbours = np.zeros((len(bad_rows), neighbour_count), dtype=bool)
+        for n, (row_offset, column_offset) in enumerate(self._NEIGHBOUR_OFFSETS):
+            rows = bad_rows + row_offset
+            columns = bad_columns + column_offset
+            inside = (rows >= 0) & (rows < size_y) & (columns >= 0) & (columns < size_x)
+            # neighbours outside the frame point at pixel 0 with zero weight
+            neighbour_indices[inside, n] = rows[inside] * size_x + columns[inside]
+            good_neighbours[inside, n] = ~bad_pixel_mask[rows[inside], columns[inside]]
+
+        good_neighbour_count = good_neighbours.sum(axis=1, keepdims=True)
+        neighbour_weights = np.zeros(good_neighbours.shape, dtype=np.float32)
+        np.divide(
+            good_neighbours,
+            good_neighbour_count,
+            out=neighbour_weights,
+            where=good_neighbour_count > 0,
+        )
+
+        self._shape = bad_pixel_mask.shape
+        self._bad_pixel_indices = np.ravel_multi_index((bad_rows, bad_columns), self._shape)
+        self._neighbour_indices = neighbour_indices
+        self._neighbour_weights = neighbour_weights
+        self._neighbours = None
+        self._weighted_neighbours = np.empty_like(neighbour_weights)
+        self._replacements = np.empty(len(bad_rows), dtype=np.float32)
+
+    def clear(self):
+        self._shape = None
+        self._bad_pixel_indices = None
+
+    def apply(self, frame):
+        """
+        Replace the bad pixels of frame in place and return frame.
+        """
+        if self._bad_pixel_indices is None:
+            raise ValueError("no pixel correction map is available")
+        if frame.shape != self._shape:
+            raise ValueError(
+                f"frame shape {frame.shape} does not match the pixel correction map {self._shape}"
+            )
+        if self._neighbours is None or self._neighbours.dtype != frame.dtype:
+            self._neighbours = np.empty(self._neighbour_indices.shape, dtype=frame.dtype)
+
+        flat_frame = frame.reshape(-1)
+        # gather the neighbours of every bad pixel before replacing any of them
+        np.take(flat_frame, self._neighbour_indices, out=self._neighbours, mode="clip")
+        np.multiply(self._neighbours, self._neighbour_weights, out=self._weighted_neighbours)
+        np.sum(self._weighted_neighbours, axis=1, out=self._replacements)
+        if frame.dtype.kind != "f":
+            np.rint(self._replacements, out=self._replacements)
+        flat_frame[self._bad_pixel_indices] = self._replacements
+        return frame
+
+
+class ReadoutRegion:
+    """
+    Read out a region of the sensor, binned and reversed, as areaDetector
+    cameras do with MinX/MinY, SizeX/SizeY, BinX/BinY and ReverseX/ReverseY.
+
+    The region is clamped to the sensor and its size is cut to whole bins,
+    as areaDetector drivers do. An unbinned region is a numpy view of the
+    frame and no pixels are copied. A binned region is reshaped to (rows,
+    BinY, columns, BinX) and summed into a buffer that is reused for every
+    frame, then clipped to the range of the output dtype.
+
+    Parameters
+    ----------
+    sensor_shape: tuple of int
+        (size y, size x) of the full frame
+    """
+
+    def __init__(
+        self,
+        sensor_shape,
+        min_x=0,
+        min_y=0,
+        size_x=None,
+        size_y=None,
+        bin_x=1,
+        bin_y=1,
+        reverse_x=False,
+        reverse_y=False,
+    ):
+        sensor_size_y, sensor_size_x = sensor_shape
+        self.sensor_shape = (sensor_size_y, sensor_size_x)
+        self.min_x, self.size_x, self.bin_x = self._clamp(
+            sensor_size_x, min_x, size_x, bin_x
+        )
+        self.min_y, self.size_y, self.bin_y = self._clamp(
+            sensor_size_y, min_y, size_y, bin_y
+        )
+        self.reverse_x = bool(reverse_x)
+        self.reverse_y = bool(reverse_y)
+        self._sum = None
+
+    @staticmethod
+    def _clamp(sensor_size, region_min, region_size, region_bin):
+        region_min = min(max(int(region_min), 0), sensor_size - 1)
+        if region_size is None:
+            region_size = sensor_size
+        region_size = min(max(int(region_size), 1), sensor_size - region_min)
+        region_bin = min(max(int(region_bin), 1), region_size)
+        # binning uses whole bins
+        region_size -= region_size % region_bin
+        return region_min, region_size, region_bin
+
+    @property
+    def binned(self):
+        return self.bin_x > 1 or self.bin_y > 1
+
+    @property
+    def output_shape(self):
+        return self.size_y // self.bin_y, self.size_x // self.bin_x
+
+    def _region(self, frame):
+        if frame.shape != self.sensor_shape:
+            raise ValueError(
+                f"frame shape {frame.shape} does not match the sensor {self.sensor_shape}"
+            )
+        return frame[
+            self.min_y:self.min_y + self.size_y, self.min_x:self.min_x + self.size_x
+        ]
+
+    def _reverse(self, image):
+        return image[:: -1 if self.reverse_y else 1, :: -1 if self.reverse_x else 1]
+
+    def view(self, frame):
+        """
+        Return the unbinned region of frame, reversed if requested, as a view of frame.
+        """
+        if self.binned:
+            raise ValueError("a binned region can not be a view, use bin()")
+        return self._reverse(self._region(frame))
+
+    def bin(self, frame, out):
+        """
+        Sum BinY by BinX blocks of the region of frame into out, an array of
+        output_shape, and return out.
+        """
+        output_size_y, output_size_x = self.output_shape
+        # splitting axes of a view is always another view
+        blocks = self._region(frame).reshape(
+            output_size_y, self.bin_y, output_size_x, self.bin_x
+        )
+        sum_dtype = FrameAverager.sum_dtype(frame.dtype)
+        if self._sum is None or self._sum.dtype != sum_dtype:
+            self._sum = np.empty(self.output_shape, dtype=sum_dtype)
+        # adding the pixels at each offset in the bins is several times faster
+        # than np.sum over both bin axes
+        np.copyto(self._sum, blocks[:, 0, :, 0], casting="unsafe")
+        for row_offset in range(self.bin_y):
+            for column_offset in range(self.bin_x):
+                if row_offset or column_offset:
+                    np.add(
+                        self._sum,
+                        blocks[:, row_offset, :, column_offset],
+                        out=self._sum,
+                        casting="unsafe",
+                    )
+        if out.dtype.kind in "ui":
+            np.minimum(self._sum, np.iinfo(out.dtype).max, out=self._sum)
+        np.copyto(out, self._reverse(self._sum), casting="unsafe")
+        return out
+
+    def apply(self, frame, out):
+        """
+        Write the readout region of frame into out, an array of output_shape,
+        and return out.
+        """
+        if self.binned:
+            return self.bin(frame, out)
+        np.copyto(out, self.view(frame), casting="unsafe")
+        return out
+
+    def __repr__(self):
+        return (
+            f"{self.__class__.__name__}(sensor_shape={self.sensor_shape}, "
+            f"min_x={self.min_x}, min_y={self.min_y}, "
+            f"size_x={self.size_x}, size_y={self.size_y}, "
+            f"bin_x={self.bin_x}, bin_y={self.bin_y}, "
+            f"reverse_x={self.reverse_x}, reverse_y={self.reverse_y})"
+        )
+
+
+class BackgroundOffsetScale:
+    """
+    Compute (frame - background) * scale + offset into another array, as
+    the areaDetector NDPluginProcess does with EnableBackground and
+    EnableOffsetScale.
+
+    The arithmetic is done in place in a float32 buffer that is reused for
+    every frame of the same shape, then rounded and clipped to the range of
+    the output dtype if it is an integer type.
+    """
+
+    def __init__(self):
+        self._background = None
+        self._work = None
+
+    @property
+    def background_available(self):
+        return self._background is not None
+
+    @property
+    def background_shape(self):
+        return None if self._background is None else self._background.shape
+
+    def set_background(self, background_image):
+        """
+        Store a float32 copy of background_image, reusing the existing buffer if possible.
+        """
+        if self._background is None or self._background.shape != background_image.shape:
+            self._background = np.empty(background_image.shape, dtype=np.float32)
+        np.copyto(self._background, background_image, casting="unsafe")
+
+    def clear_background(self):
+        self._background = None
+
+    def apply(self, frame, out, subtract_background=False, scale=None, offset=None):
+        """
+        Write the processed frame into out, an array of the frame shape, and return out.
+
+        Parameters
+        ----------
+        frame: numpy.ndarray
+            not modified
+        out: numpy.ndarray
+        subtract_background: bool
+            subtract the stored background
+        scale, offset: float, optional
+            multiply by scale then add offset if both are given
+        """
+        if subtract_background and self._background is None:
+            raise ValueError("no background image is available")
+        if subtract_background and self._background.shape != frame.shape:
+            raise ValueError(
+                f"frame shape {frame.shape} does not match "
+                f"the background {self._background.shape}"
+            )
+        if self._work is None or self._work.shape != frame.shape:
+            self._work = np.empty(frame.shape, dtype=np.float32)
+        work = self._work
+        if subtract_background:
+            np.subtract(frame, self._background, out=work, casting="unsafe")
+        else:
+            np.copyto(work, frame, casting="unsafe")
+        if scale is not None and offset is not None:
+            np.multiply(work, scale, out=work)
+            np.add(work, offset, out=work)
+        if out.dtype.kind in "ui":
+            out_info = np.iinfo(out.dtype)
+            np.rint(work, out=work)
+            np.clip(work, out_info.min, out_info.max, out=work)
+        np.copyto(out, work, casting="unsafe")
+        return out
+
+
+class FrameStatistics:
+    """
+    Compute the statistics of the areaDetector NDPluginStats for 2D frames.
+
+    The frame is copied once into a float64 buffer. One matrix product of
+    that buffer with columns of 1, x and x**2 gives the sum and the first
+    and second x moments of every row, and the total, mean, centroid and
+    second moments all follow from these row sums without another pass
+    over the frame. The sum of squares for sigma is a single dot product
+    of the buffer with itself. The minimum and maximum and their positions
+    come from argmin and argmax. Buffers are reused while frames keep the
+    same shape.
+
+        frame_statistics = FrameStatistics()
+        statistics = frame_statistics.compute(frame)
+        statistics["mean_value"], statistics["centroid_x"]
+    """
+
+    def __init__(self):
+        self._work = None
+        self._x_weights = None
+        self._y = None
+
+    def _allocate(self, shape):
+        if self._work is None or self._work.shape != shape:
+            size_y, size_x = shape
+            self._work = np.empty(shape, dtype=np.float64)
+            x = np.arange(size_x, dtype=np.float64)
+            self._x_weights = np.stack([np.ones_like(x), x, x * x], axis=1)
+            self._y = np.arange(size_y, dtype=np.float64)
+
+    def compute(self, frame, centroid=True):
+        """
+        Return a dict of the statistics of a 2D frame.
+
+        The keys are min_value, max_value, min_x, min_y, max_x, max_y,
+        mean_value, sigma and total, and with centroid=True also
+        centroid_x, centroid_y, sigma_x, sigma_y and sigma_xy. sigma_xy is
+        the correlation of x and y, the covariance divided by sigma_x and
+        sigma_y. The centroid statistics are 0 if the total is not positive.
+        """
+        self._allocate(frame.shape)
+        size_x = frame.shape[1]
+        min_index = int(np.argmin(frame))
+        max_index = int(np.argmax(frame))
+        min_y, min_x = divmod(min_index, size_x)
+        max_y, max_x = divmod(max_index, size_x)
+
+        work = self._work
+        np.copyto(work, frame, casting="unsafe")
+        # the sum, x moment and x**2 moment of each row in one pass
+        row_moments = work @ self._x_weights
+        row_sums = row_moments[:, 0]
+        total = float(row_sums.sum())
+        flat_work = work.reshape(-1)
+        sum_of_squares = float(np.dot(flat_work, flat_work))
+        pixel_count = frame.size
+        mean_value = total / pixel_count
+        variance = max(sum_of_squares / pixel_count - mean_value * mean_value, 0.0)
+
+        statistics = {
+            "min_value": frame[min_y, min_x].item(),
+            "max_value": frame[max_y, max_x].item(),
+            "min_x": min_x,
+            "min_y": min_y,
+            "max_x": max_x,
+            "max_y": max_y,
+            "mean_value": mean_value,
+            "sigma": variance ** 0.5,
+            "total": total,
+        }
+        if centroid:
+            statistics.update(self._centroid(row_moments, total))
+        return statistics
+
+    def _centroid(self, row_moments, total):
+        if total <= 0:
+            return dict.fromkeys(
+                ("centroid_x", "centroid_y", "sigma_x", "sigma_y", "sigma_xy"), 0.0
+            )
+        y = self._y
+        row_sums, row_x_moments, row_x2_moments = row_moments.T
+        centroid_x = row_x_moments.sum() / total
+        centroid_y = np.dot(y, row_sums) / total
+        variance_x = max(row_x2_moments.sum() / total - centroid_x * centroid_x, 0.0)
+        variance_y = max(np.dot(y * y, row_sums) / total - centroid_y * centroid_y, 0.0)
+        covariance_xy = np.dot(y, row_x_moments) / total - centroid_x * centroid_y
+        sigma_x = variance_x ** 0.5
+        sigma_y = variance_y ** 0.5
+        if sigma_x > 0 and sigma_y > 0:
+            sigma_xy = covariance_xy / (sigma_x * sigma_y)
+        else:
+            sigma_xy = 0.0
+        return {
+            "centroid_x": float(centroid_x),
+            "centroid_y": float(centroid_y),
+            "sigma_x": float(sigma_x),
+            "sigma_y": float(sigma_y),
+            "sigma_xy": float(sigma_xy),
+        }
+
+    @staticmethod
+    def histogram(frame, size, hist_min, hist_max):
+        """
+        Return (counts, below, above, entropy) of the pixels of frame.
+
+        counts has size bins of equal width from hist_min to hist_max, and
+        pixels equal to hist_max are counted in the last bin. below and
+        above count the pixels outside the range. entropy is -sum(p ln p)
+        of the fraction p of the counted pixels in each bin.
+
+        Frames of 8 or 16 bit unsigned integers are counted by value with
+        np.bincount in one pass, then the value counts are summed into bins.
+        Other frames use np.histogram.
+        """
+        if size < 1:
+            raise ValueError(f"size must be at least 1, not {size}")
+        if hist_max <= hist_min:
+            raise ValueError(f"hist_max {hist_max} must be greater than hist_min {hist_min}")
+        if frame.dtype.kind == "u" and frame.dtype.itemsize <= 2:
+            value_counts = np.bincount(frame.reshape(-1))
+            values = np.arange(len(value_counts), dtype=np.float64)
+            in_range = (values >= hist_min) & (values <= hist_max)
+            bin_indices = np.minimum(
+                ((values[in_range] - hist_min) * (size / (hist_max - hist_min))).astype(np.intp),
+                size - 1,
+            )
+            counts = np.bincount(
+                bin_indices, weights=value_counts[in_range], minlength=size
+            )
+            below = int(value_counts[values < hist_min].sum())
+            above = int(value_counts[values > hist_max].sum())
+        else:
+            counts, _ = np.histogram(frame, bins=size, range=(hist_min, hist_max))
+            counts = counts.astype(np.float64)
+            below = int(np.count_nonzero(frame < hist_min))
+            above = int(np.count_nonzero(frame > hist_max))
+
+        counted = counts.sum()
+        if counted > 0:
+            probabilities = counts[counts > 0] / counted
+            entropy = float(-np.sum(probabilities * np.log(probabilities)))
+        else:
+            entropy = 0.0
+        return counts, below, above, entropy
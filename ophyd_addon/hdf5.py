@@ -0,0 +1,115 @@
+import numpy as np
+
+
+# the dataset areaDetector writes with its default layout, and where the
+# AD_HDF5 handler looks for frames
+DATASET_PATH = "/entry/data/data"
+
+# Compression PV values and the h5py filter for each of them, zlib is
+# the only filter every HDF5 library has
+COMPRESSION_FILTERS = {"None": None, "zlib": "gzip"}
+
+
+class HDF5FrameWriter:
+    """
+    Append frames to a chunked 3D dataset in one HDF5 file.
+
+    The dataset has one frame per index of its first dimension and grows as
+    frames are appended, so a whole capture goes to one file instead of one
+    file per frame. Frames are chunked frames_per_chunk at a time and each
+    chunk is compressed separately.
+
+    Writing HDF5 files requires h5py.
+
+    Parameters
+    ----------
+    file_path: str or Path
+        the file is created, an existing file is overwritten
+    frame_shape: tuple of int
+    dtype: numpy.dtype
+    frames_per_chunk: int
+    compression: str
+        a key of COMPRESSION_FILTERS
+    compression_level: int, optional
+        0 to 9 for zlib
+    """
+
+    def __init__(
+        self,
+        file_path,
+        frame_shape,
+        dtype,
+        frames_per_chunk=1,
+        compression="None",
+        compression_level=None,
+    ):
+        import h5py
+
+        if compression not in COMPRESSION_FILTERS:
+            raise ValueError(
+                f"compression must be one of {tuple(COMPRESSION_FILTERS)}, not {compression!r}"
+            )
+        compression_filter = COMPRESSION_FILTERS[compression]
+        self.file_path = file_path
+        self.frame_shape = tuple(frame_shape)
+        self.dtype = np.dtype(dtype)
+        self.frame_count = 0
+
+        self._h5_file = h5py.File(file_path, "w")
+        try:
+            self._dataset = self._h5_file.create_dataset(
+                DATASET_PATH,
+                shape=(0, *self.frame_shape),
+                maxshape=(None, *self.frame_shape),
+                dtype=self.dtype,
+                chunks=(max(int(frames_per_chunk), 1), *self.frame_shape),
+                compression=compression_filter,
+                compression_opts=compression_level if compression_filter else None,
+            )
+        except Exception:
+            self._h5_file.close()
+            raise
+
+    @property
+    def closed(self):
+        return self._h5_file is None
+
+    def append(self, frames):
+        """
+        Append a sequence of frames, each of frame_shape, to the dataset.
+        """
+        if self._h5_file is None:
+            raise ValueError(f"{self.file_path} is closed")
+        for frame in frames:
+            if frame.shape != self.frame_shape:
+                raise ValueError(
+                    f"frame shape {frame.shape} does not match the dataset {self.frame_shape}"
+                )
+        frame_count = len(frames)
+        if frame_count == 0:
+            return
+        self._dataset.resize(self.frame_count + frame_count, axis=0)
+        for frame_index, frame in enumerate(frames, start=self.frame_count):
+            # write_direct skips the slicing machinery of dataset[frame_index] = frame
+            self._dataset.write_direct(
+                np.ascontiguousarray(frame, dtype=self.dtype), dest_sel=np.s_[frame_index]
+            )
+        self.frame_count += frame_count
+
+    def close(self):
+        if self._h5_file is not None:
+            self._h5_file.close()
+            self._h5_file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __repr__(self):
+        return (
+            f"{self.__class__.__name__}(file_path={str(self.file_path)!r}, "
+            f"frame_shape={self.frame_shape}, dtype={self.dtype}, "
+            f"frame_count={self.frame_count})"
+        )
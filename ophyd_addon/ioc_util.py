@@ -1,5 +1,10 @@
 import contextvars
 import functools
+import math
+import time
+
+from caproto.server import pvproperty
+from caproto.server.server import PvpropertyData
 
 internal_process = contextvars.ContextVar("internal_process", default=False)
 
@@ -16,3 +21,382 @@ def no_reentry(func):
             internal_process.set(False)
 
     return inner
+
+
+async def run_in_thread(async_lib, func, *args):
+    """
+    Run func(*args) in a worker thread so the IOC keeps serving PVs.
+
+    Parameters
+    ----------
+    async_lib: caproto AsyncLibraryLayer
+        as passed to pvproperty startup hooks
+    """
+    if async_lib.name == "asyncio":
+        loop = async_lib.library.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(func, *args))
+    elif async_lib.name == "trio":
+        return await async_lib.library.to_thread.run_sync(functools.partial(func, *args))
+    elif async_lib.name == "curio":
+        return await async_lib.library.run_in_thread(func, *args)
+    else:
+        raise ValueError(f"unsupported async library {async_lib.name}")
+
+
+def pvproperty_with_rbv(name, dtype, value, *, lower=None, upper=None, **cls_kwargs):
+    """
+    Return a setpoint pvproperty and its read-only _RBV readback, the pair
+    an ophyd SignalWithRBV connects to.
+
+        acquire_time, acquire_time_rbv = pvproperty_with_rbv(
+            name=":{camera}:AcquireTime", dtype=ChannelType.DOUBLE, value=1.0
+        )
+
+    The readback attribute must be the setpoint attribute followed by _rbv.
+    Writing the setpoint checks lower and upper, stores the value in the
+    group's settings, see rbv_settings, and writes the readback so monitors
+    on it fire. A setpoint that needs to do more than that keeps its own
+    putter, marked with stores_setting.
+
+    Parameters
+    ----------
+    name: str
+        the setpoint PV name, the readback is name + "_RBV"
+    dtype: ChannelType
+    value:
+        initial value of the setpoint, the readback and the setting
+    lower, upper: optional
+        inclusive limits of the setpoint, a write outside them is rejected
+    **cls_kwargs
+        passed on to both pvproperties, such as enum_strings and max_length
+    """
+    setpoint = pvproperty(
+        name=name, dtype=dtype, value=value, put=_rbv_putter(lower, upper), **cls_kwargs
+    )
+    readback = pvproperty(
+        name=name + "_RBV", dtype=dtype, value=value, read_only=True, **cls_kwargs
+    )
+    return setpoint, readback
+
+
+def _rbv_putter(lower, upper):
+    async def put_with_rbv(group, instance, value):
+        if (lower is not None and value < lower) or (upper is not None and value > upper):
+            setpoint_name = instance.pvspec.name.rsplit(":", 1)[-1]
+            if upper is None:
+                raise ValueError(f"{setpoint_name} must be at least {lower}, not {value}")
+            elif lower is None:
+                raise ValueError(f"{setpoint_name} must be at most {upper}, not {value}")
+            else:
+                raise ValueError(
+                    f"{setpoint_name} must be from {lower} to {upper}, not {value}"
+                )
+        attr = instance.pvspec.attr
+        setattr(group.settings, attr, value)
+        await getattr(group, attr + "_rbv").write(value)
+        return value
+
+    return stores_setting(put_with_rbv)
+
+
+def stores_setting(put):
+    """
+    Mark a setpoint putter that stores the values written in the group's
+    settings, so rbv_settings gives the setpoint an attribute.
+
+        @data_type.putter
+        @stores_setting
+        async def data_type(self, instance, value):
+            ...
+            self.settings.data_type = value
+            await self.data_type_rbv.write(value)
+            return value
+    """
+    put.stores_setting = True
+    return put
+
+
+class RBVSettings:
+    """
+    Base class of the settings returned by rbv_settings.
+
+    Each PVGroup class gets a subclass with one slot for each of its
+    setpoints, so the settings of a group take a few words each however
+    many groups are created.
+    """
+
+    __slots__ = ()
+    # setpoint attribute to initial value, set on each subclass
+    defaults = {}
+
+    def as_dict(self):
+        return {attr: getattr(self, attr) for attr in self.__slots__}
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.as_dict()})"
+
+
+@functools.lru_cache(maxsize=None)
+def _rbv_settings_class(group_class):
+    defaults = {
+        attr: prop.pvspec.value
+        for attr, prop in group_class._pvs_.items()
+        # subgroups have their own settings
+        if "." not in attr and getattr(prop.pvspec.put, "stores_setting", False)
+    }
+    return type(
+        f"{group_class.__name__}Settings",
+        (RBVSettings,),
+        {"__slots__": tuple(defaults), "defaults": defaults},
+    )
+
+
+def rbv_settings(group):
+    """
+    Return the settings of a PVGroup, an RBVSettings with an attribute for
+    each setpoint declared with pvproperty_with_rbv or with a putter marked
+    by stores_setting, holding its initial value. Assign it to
+    group.settings in __init__, the setpoint putters store the values
+    written there.
+
+    A subclass that declares a setpoint again, for example with another
+    initial value, overrides the setpoint of its base class here as well.
+    """
+    settings_class = _rbv_settings_class(type(group))
+    settings = settings_class()
+    for attr, value in settings_class.defaults.items():
+        setattr(settings, attr, value)
+    return settings
+
+
+class LoopLagMeter:
+    """
+    Measure how late the event loop wakes up a task that sleeps for interval.
+
+    Anything that holds the event loop, such as serving many clients or
+    computing frames, delays the wake up, so the lag is the latency a
+    Channel Access request would see on top of its own processing time.
+    Lag is measured in real time, whatever clock the IOC runs on.
+
+    Parameters
+    ----------
+    interval: float
+        seconds between samples
+    latency_histogram: LatencyHistogram, optional
+        every sample is also added to this, reset() does not reset it
+    """
+
+    def __init__(self, interval=0.1, latency_histogram=None):
+        self.interval = interval
+        self.latency_histogram = latency_histogram
+        self.reset()
+
+    def reset(self):
+        self.sample_count = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self._lag_sum = 0.0
+
+    @property
+    def mean_lag(self):
+        return self._lag_sum / self.sample_count if self.sample_count else 0.0
+
+    def add_sample(self, lag):
+        self.sample_count += 1
+        self.last_lag = lag
+        self.max_lag = max(self.max_lag, lag)
+        self._lag_sum += lag
+        if self.latency_histogram is not None:
+            self.latency_histogram.add(lag)
+
+    async def run(self, async_lib):
+        """
+        Sample the loop lag until cancelled, run this as a startup hook task.
+        """
+        async_sleep = async_lib.library.sleep
+        while True:
+            wake_up_time = time.monotonic() + self.interval
+            await async_sleep(self.interval)
+            self.add_sample(max(time.monotonic() - wake_up_time, 0.0))
+
+
+class CpuMeter:
+    """
+    Measure the CPU time used by this process, including its worker
+    threads, as a percentage of one core.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self._cpu_start = time.process_time()
+        self._wall_start = time.monotonic()
+
+    def sample(self):
+        """
+        Return the CPU percentage since the last sample or reset and start a new one.
+        """
+        cpu_time = time.process_time()
+        wall_time = time.monotonic()
+        elapsed = wall_time - self._wall_start
+        percent = 100.0 * (cpu_time - self._cpu_start) / elapsed if elapsed > 0 else 0.0
+        self._cpu_start = cpu_time
+        self._wall_start = wall_time
+        return percent
+
+
+class LatencyHistogram:
+    """
+    Count latencies in fixed logarithmic buckets.
+
+    Bucket i counts latencies from MIN_LATENCY * 2**(i - 1) up to
+    MIN_LATENCY * 2**i, the first bucket also counts anything shorter and
+    the last anything longer. The buckets are allocated once, add() only
+    increments counters so it can be called for every Channel Access
+    request. Quantiles are the upper bound of the bucket they fall in, so
+    they are at most a factor of 2 high.
+    """
+
+    MIN_LATENCY = 1e-6
+    # 1 microsecond to 134 seconds
+    BUCKET_COUNT = 28
+
+    def __init__(self):
+        self.counts = [0] * LatencyHistogram.BUCKET_COUNT
+        self.reset()
+
+    def reset(self):
+        for bucket_index in range(LatencyHistogram.BUCKET_COUNT):
+            self.counts[bucket_index] = 0
+        self.count = 0
+        self.max_latency = 0.0
+        self._latency_sum = 0.0
+
+    @staticmethod
+    def bucket_upper_bounds():
+        return [
+            LatencyHistogram.MIN_LATENCY * 2 ** bucket_index
+            for bucket_index in range(LatencyHistogram.BUCKET_COUNT)
+        ]
+
+    @property
+    def mean_latency(self):
+        return self._latency_sum / self.count if self.count else 0.0
+
+    def add(self, latency):
+        # frexp returns the exponent e with 2**(e - 1) <= x < 2**e
+        _, bucket_index = math.frexp(latency / LatencyHistogram.MIN_LATENCY)
+        self.counts[min(max(bucket_index, 0), LatencyHistogram.BUCKET_COUNT - 1)] += 1
+        self.count += 1
+        self._latency_sum += latency
+        if latency > self.max_latency:
+            self.max_latency = latency
+
+    def merge(self, latency_histogram):
+        """
+        Add the counts of another LatencyHistogram to this one.
+        """
+        for bucket_index, bucket_count in enumerate(latency_histogram.counts):
+            self.counts[bucket_index] += bucket_count
+        self.count += latency_histogram.count
+        self._latency_sum += latency_histogram._latency_sum
+        self.max_latency = max(self.max_latency, latency_histogram.max_latency)
+
+    def quantile(self, q):
+        """
+        Return the upper bound of the bucket holding quantile q, 0 if there are no latencies.
+        """
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        cumulative_count = 0
+        for bucket_index, bucket_count in enumerate(self.counts):
+            cumulative_count += bucket_count
+            if cumulative_count >= rank and bucket_count > 0:
+                return LatencyHistogram.MIN_LATENCY * 2 ** bucket_index
+        return self.max_latency
+
+    def summary(self):
+        """
+        Return a dict of the count and the mean, median, 99th percentile and
+        maximum latency in seconds.
+        """
+        return {
+            "count": self.count,
+            "mean": self.mean_latency,
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+            "max": self.max_latency,
+        }
+
+
+class PVLatencyMeter:
+    """
+    Time the getter and putter of every pvproperty in a pvdb that has one.
+
+    Each bound getter and putter is replaced once by a wrapper that adds
+    its latency to a LatencyHistogram for its PV, the wrapper allocates
+    nothing but its coroutine. The latency is the time the getter or
+    putter takes, including any awaits, but not the time a request waits
+    for the event loop, see LoopLagMeter for that.
+
+    Parameters
+    ----------
+    pvdb: dict
+        PV name to caproto ChannelData, as in PVGroup.pvdb
+    """
+
+    def __init__(self, pvdb):
+        self.get_latency = {}
+        self.put_latency = {}
+        for pvname, channel in pvdb.items():
+            if not isinstance(channel, PvpropertyData):
+                continue
+            if channel.pvspec.get is not None:
+                self.get_latency[pvname] = LatencyHistogram()
+                channel.getter = self._timed(channel.getter, self.get_latency[pvname])
+            if channel.pvspec.put is not None:
+                self.put_latency[pvname] = LatencyHistogram()
+                channel.putter = self._timed(channel.putter, self.put_latency[pvname])
+
+    @staticmethod
+    def _timed(method, latency_histogram):
+        @functools.wraps(method)
+        async def timed(*args):
+            t0 = time.perf_counter()
+            try:
+                return await method(*args)
+            finally:
+                latency_histogram.add(time.perf_counter() - t0)
+
+        return timed
+
+    def reset(self):
+        for latency_histogram in self.get_latency.values():
+            latency_histogram.reset()
+        for latency_histogram in self.put_latency.values():
+            latency_histogram.reset()
+
+    def total(self, latencies):
+        """
+        Return one LatencyHistogram of all of get_latency or put_latency.
+        """
+        total_latency = LatencyHistogram()
+        for latency_histogram in latencies.values():
+            total_latency.merge(latency_histogram)
+        return total_latency
+
+    def summary(self):
+        """
+        Return {"get": {pvname: summary}, "put": {pvname: summary}} for
+        the PVs that have been read or written, see LatencyHistogram.summary.
+        """
+        return {
+            request: {
+                pvname: latency_histogram.summary()
+                for pvname, latency_histogram in latencies.items()
+                if latency_histogram.count > 0
+            }
+            for request, latencies in (("get", self.get_latency), ("put", self.put_latency))
+        }
@@ -0,0 +1,139 @@
+from collections import deque
+
+import numpy as np
+
+
+# numpy dtypes of the areaDetector NDDataType_t values, in enum order
+ND_DATA_TYPES = {
+    "Int8": np.dtype(np.int8),
+    "UInt8": np.dtype(np.uint8),
+    "Int16": np.dtype(np.int16),
+    "UInt16": np.dtype(np.uint16),
+    "Int32": np.dtype(np.int32),
+    "UInt32": np.dtype(np.uint32),
+    "Int64": np.dtype(np.int64),
+    "UInt64": np.dtype(np.uint64),
+    "Float32": np.dtype(np.float32),
+    "Float64": np.dtype(np.float64),
+}
+
+
+class NDArray:
+    """
+    A frame in a buffer borrowed from an NDArrayPool.
+
+    Like an areaDetector NDArray it is reference counted: whoever keeps the
+    array past the callback that received it calls reserve(), and calls
+    release() when it is done. The buffer returns to the pool when the last
+    reference is released, so frames are passed around without copying.
+
+    Attributes
+    ----------
+    data: numpy.ndarray
+        the frame, a view of the pool buffer
+    unique_id: int
+        the ArrayCounter value of the frame
+    timestamp: float
+        time the frame was read out, on the IOC clock
+    """
+
+    def __init__(self, pool, buffer_index, data):
+        self.pool = pool
+        self.buffer_index = buffer_index
+        self.data = data
+        self.unique_id = 0
+        self.timestamp = 0.0
+        self.reference_count = 1
+
+    def reserve(self):
+        if self.reference_count <= 0:
+            raise RuntimeError("can not reserve an NDArray that has been released")
+        self.reference_count += 1
+        return self
+
+    def release(self):
+        if self.reference_count <= 0:
+            raise RuntimeError("NDArray has already been released")
+        self.reference_count -= 1
+        if self.reference_count == 0:
+            self.pool._free(self)
+
+    def __repr__(self):
+        return (
+            f"{self.__class__.__name__}(unique_id={self.unique_id}, "
+            f"shape={self.data.shape}, dtype={self.data.dtype}, "
+            f"reference_count={self.reference_count})"
+        )
+
+
+class NDArrayPool:
+    """
+    A fixed ring of preallocated frame buffers, like the areaDetector NDArrayPool.
+
+    All buffers are allocated when the pool is created, so the pool never
+    allocates memory while acquiring. alloc() returns None when every
+    buffer is in use, as areaDetector drivers find when their pool is
+    exhausted, and the frame is dropped.
+
+    Parameters
+    ----------
+    max_buffers: int
+        number of buffers
+    buffer_bytes: int
+        size of each buffer, the largest frame the pool can hold
+    """
+
+    def __init__(self, max_buffers, buffer_bytes):
+        if max_buffers < 1:
+            raise ValueError(f"max_buffers must be at least 1, not {max_buffers}")
+        self.max_buffers = max_buffers
+        self.buffer_bytes = buffer_bytes
+        self._buffers = [np.zeros(buffer_bytes, dtype=np.uint8) for _ in range(max_buffers)]
+        # buffers are reused in first in, first out order
+        self._free_buffer_indices = deque(range(max_buffers))
+        self.used_memory = 0
+
+    @property
+    def alloc_buffers(self):
+        return len(self._buffers)
+
+    @property
+    def free_buffers(self):
+        return len(self._free_buffer_indices)
+
+    @property
+    def used_buffers(self):
+        return self.alloc_buffers - self.free_buffers
+
+    @property
+    def max_memory(self):
+        return self.max_buffers * self.buffer_bytes
+
+    def alloc(self, shape, dtype):
+        """
+        Return an NDArray of shape and dtype with one reference, or None if
+        the pool is exhausted. The contents of the array are undefined.
+        """
+        dtype = np.dtype(dtype)
+        nbytes = int(np.prod(shape)) * dtype.itemsize
+        if nbytes > self.buffer_bytes:
+            raise ValueError(
+                f"a {shape} {dtype} array needs {nbytes} bytes, "
+                f"pool buffers have {self.buffer_bytes} bytes"
+            )
+        if not self._free_buffer_indices:
+            return None
+        buffer_index = self._free_buffer_indices.popleft()
+        data = self._buffers[buffer_index][:nbytes].view(dtype).reshape(shape)
+        self.used_memory += self.buffer_bytes
+        return NDArray(self, buffer_index, data)
+
+    def _free(self, ndarray):
+        self._free_buffer_indices.append(ndarray.buffer_index)
+        self.used_memory -= self.buffer_bytes
+
+    def __repr__(self):
+        return (
+            f"{self.__class__.__name__}(max_buffers={self.max_buffers}, "
+            f"buffer_bytes={self.buffer_bytes}, free_buffers={self.free_buffers})"
+        )
@@ -1,5 +1,4 @@
 from pathlib import Path, PureWindowsPath
-import uuid
 
 from bluesky import Msg
 import bluesky.plan_stubs as bps
@@ -11,14 +10,42 @@ from ophyd_addon.areadetector.document_builders import (
     NewPerkinElmerDetector,
     NDFile,
 )
+from ophyd_addon.device_registry import DeviceRegistry
 
 # fast_shutter = SimulatedFastShutter(name="fast_shutter", prefix="XF:07BMB-CT{Enc02-DO:0}Dflt-Sel")
 
 
-pe_detector = NewPerkinElmerDetector(
-    name="perkin_elmer_det1", prefix="XF:07BM-ES[Det:PE1]:"
+PE_DETECTOR_PREFIX = "XF:07BM-ES[Det:PE1]:"
+
+# the detector is not built until get_pe_detector is called so importing
+# this module does not start Channel Access connections
+pe_detector_registry = DeviceRegistry(NewPerkinElmerDetector, name="perkin_elmer_det1")
+
+# the lazy signals pe_count puts to or waits on, they are connected with
+# the detector so a missing PV fails before the plan starts
+PE_COUNT_SIGNALS = (
+    "cam.acquire",
+    "cam.acquire_time",
+    "cam.image_mode",
+    "cam.num_images",
+    "cam.pe_acquire_offset",
+    "cam.pe_num_offset_frames",
+    "cam.pe_use_offset",
+    "tiff_writer.file_write_mode",
+    "tiff_writer.write_file",
 )
 
+
+def get_pe_detector(prefix=PE_DETECTOR_PREFIX, timeout=10.0):
+    """
+    Return the connected NewPerkinElmerDetector for prefix, building it on first use.
+
+    This blocks until the detector connects, so call it before the RunEngine,
+    as pe_count does when it is called without pe_detector.
+    """
+    return pe_detector_registry.get(prefix, timeout=timeout, signal_names=PE_COUNT_SIGNALS)
+
+
 "XF:07BM-ES[Det:PE1]:TIFF1:FileNumber_RBV"
 "XF:07BM-ES[Det:PE1]:TIFF1:FileNumber_RBV"
 
@@ -45,8 +72,34 @@ def pe_count(
     num_dark_images: int = 1,
     num_repetitions: int = 5,
     delay=60,
+    pe_detector=None,
 ):
+    """
+    Take num_repetitions light frames, each after a dark frame.
+
+        RE(pe_count("sample1", exposure=1))
+
+    pe_detector is a connected NewPerkinElmerDetector. If it is None the
+    detector from get_pe_detector is connected when pe_count is called,
+    before the RunEngine starts the plan, so connecting does not block the
+    RunEngine event loop.
+    """
+    if pe_detector is None:
+        pe_detector = get_pe_detector()
+    return _pe_count(
+        pe_detector,
+        filename=filename,
+        exposure=exposure,
+        num_images=num_images,
+        num_dark_images=num_dark_images,
+        num_repetitions=num_repetitions,
+        delay=delay,
+    )
 
+
+def _pe_count(
+    pe_detector, filename, exposure, num_images, num_dark_images, num_repetitions, delay
+):
     year = "2020"  # RE.md["year"]
     cycle = "C2"  # RE.md["cycle"]
     proposal = "67890"  # RE.md["PROPOSAL"]
@@ -68,21 +121,16 @@ def pe_count(
         f"perkin_elmer/detector/{year}/{cycle}/XRD{proposal}"  # remove "XRD" from the end?
     )
 
+    # staging sets FilePath, FileName and FileNumber, and AutoIncrement=Yes
+    # gives each WriteFile below its own file
+    pe_detector.tiff_writer.file_name_prefix = filename
+
     # start the run
     yield from bps.open_run()
 
     # stage the detector
     yield from bps.stage(pe_detector)
 
-    yield from bps.mv(pe_detector.tiff_writer.file_number, 1)
-    tiff_full_file_path = (
-        pe_detector.tiff_writer.resource_root_path
-        / pe_detector.tiff_writer.relative_write_path
-    )
-
-    print(f"tiff_full_file_path: {str(tiff_full_file_path)}")
-    yield from bps.mv(pe_detector.tiff_writer.file_path, str(tiff_full_file_path))
-
     for repetition_index in range(int(num_repetitions)):
 
         print("\n")
@@ -92,11 +140,6 @@ def pe_count(
             )
         )
 
-        # TiffWriter or similar plugin should do this
-        yield from bps.mv(
-            pe_detector.tiff_writer.file_name, filename + str(uuid.uuid4())
-        )
-
         if num_dark_images > 0:
             # originally used pe_detector.num_dark_images
             # but this is really pe_num_offset_frames
@@ -112,8 +155,11 @@ def pe_count(
             )
 
             # acquire a "dark frame"
+            # cam.pe_acquire_offset reads PEAcquireOffset_RBV, which the IOC
+            # holds at Acquire until the offset is done, run=False because
+            # the last event of the previous repetition went from Acquire to Done
             pe_acquire_offset_status = SubscriptionStatus(
-                pe_detector.cam.pe_acquire_offset, high_to_low_pe_acquire_offset
+                pe_detector.cam.pe_acquire_offset, high_to_low_pe_acquire_offset, run=False
             )
             yield from bps.abs_set(
                 pe_detector.cam.pe_acquire_offset,
@@ -126,6 +172,11 @@ def pe_count(
                 pe_detector.tiff_writer.write_file, NDFile.WriteFile.WRITE
             )
 
+            # subtract the new dark frame from the light frames
+            yield from bps.mv(
+                pe_detector.cam.pe_use_offset, PerkinElmerCamera.UseOffset.ENABLE
+            )
+
         # yield from bps.mv(
         #  pe1.cam.image_mode,
         #  NewPerkinElmerDetector.ImageMode.MULTIPLE
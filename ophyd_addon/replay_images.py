@@ -0,0 +1,154 @@
+from pathlib import Path
+
+import numpy as np
+
+from ophyd_addon.ndarray_pool import ND_DATA_TYPES
+
+
+# files in a replay directory with these suffixes are replayed, others are ignored
+REPLAY_SUFFIXES = (".npy", ".raw")
+
+
+class ReplayImageGenerator:
+    """
+    Replay recorded frames in place of DiffractionImageGenerator.
+
+    Frames are read from memory-mapped .npy files or raw files, each
+    holding one 2D frame or a 3D stack of frames. path is one such file or
+    a directory of them, replayed in order of file name. Frames are served
+    in order and the replay starts again from the first frame after the
+    last one.
+
+    Only the headers are read when the replay is opened. Each call to
+    generate() copies one frame from its memory map, so only the pages of
+    that frame are read from disk and only one file is mapped at a time.
+
+    The frames already hold the exposure and offset they were recorded
+    with, so exposure and dark are ignored.
+
+    Parameters
+    ----------
+    path: str or Path
+        a .npy file, a raw file or a directory of them
+    shape: tuple of int, optional
+        (size_y, size_x) of the frames in raw files, .npy files record their shape
+    dtype: numpy.dtype
+        data type of the frames in raw files, .npy files record their data type
+    """
+
+    def __init__(self, path, shape=None, dtype=np.uint16):
+        path = Path(path)
+        if path.is_dir():
+            file_paths = sorted(
+                file_path
+                for file_path in path.iterdir()
+                if file_path.suffix in REPLAY_SUFFIXES and file_path.is_file()
+            )
+            if not file_paths:
+                raise ValueError(f"{path} has no {' or '.join(REPLAY_SUFFIXES)} files")
+        else:
+            file_paths = [path]
+
+        self._raw_shape = None if shape is None else tuple(shape)
+        self._raw_dtype = np.dtype(dtype)
+        # (file path, frame count) for each file, the shape and data type
+        # are taken from the first file
+        self._files = []
+        frame_shape = None
+        frame_dtype = None
+        for file_path in file_paths:
+            frames = self._map_frames(file_path)
+            if frame_shape is None:
+                frame_shape = frames.shape[1:]
+                frame_dtype = frames.dtype
+            elif frames.shape[1:] != frame_shape or frames.dtype != frame_dtype:
+                raise ValueError(
+                    f"{file_path} has {frames.dtype} frames of shape {frames.shape[1:]}, "
+                    f"not {frame_dtype} frames of shape {frame_shape} like {file_paths[0]}"
+                )
+            if len(frames) > 0:
+                self._files.append((file_path, len(frames)))
+            del frames
+        if not self._files:
+            raise ValueError(f"{path} has no frames")
+
+        if frame_dtype.newbyteorder("=") not in ND_DATA_TYPES.values():
+            raise ValueError(f"frames of {frame_dtype} can not be replayed")
+        self.path = path
+        self.shape = frame_shape
+        self.frame = np.zeros(self.shape, dtype=frame_dtype.newbyteorder("="))
+        self.frame_count = sum(frame_count for _, frame_count in self._files)
+
+        # the file being replayed and the index of its next frame
+        self._file_index = 0
+        self._frame_index = 0
+        self._frames = None
+
+    @property
+    def size_x(self):
+        return self.shape[1]
+
+    @property
+    def size_y(self):
+        return self.shape[0]
+
+    def _map_frames(self, file_path):
+        """
+        Return a read-only memory map of the frames of file_path with shape
+        (frame count, size_y, size_x).
+        """
+        if file_path.suffix == ".npy":
+            frames = np.load(file_path, mmap_mode="r")
+        else:
+            if self._raw_shape is None:
+                raise ValueError(f"the frame shape of the raw file {file_path} is required")
+            frames = np.memmap(file_path, dtype=self._raw_dtype, mode="r")
+            frame_size = self._raw_shape[0] * self._raw_shape[1]
+            if frames.size % frame_size != 0:
+                raise ValueError(
+                    f"{file_path} does not hold whole {self._raw_dtype} frames "
+                    f"of shape {self._raw_shape}"
+                )
+            frames = frames.reshape((-1, *self._raw_shape))
+        if frames.ndim == 2:
+            frames = frames[np.newaxis]
+        elif frames.ndim != 3:
+            raise ValueError(f"{file_path} holds a {frames.ndim}D array, not frames")
+        return frames
+
+    def generate(self, exposure=1.0, dark=False, out=None):
+        """
+        Copy the next recorded frame.
+
+        Parameters
+        ----------
+        out: numpy.ndarray, optional
+            array of the frame shape and data type to copy into, for example
+            an NDArrayPool buffer
+
+        Returns
+        -------
+        out, or the preallocated frame which is overwritten by the next call
+        """
+        if self._frames is None:
+            file_path, _ = self._files[self._file_index]
+            self._frames = self._map_frames(file_path)
+        if out is None:
+            out = self.frame
+        np.copyto(out, self._frames[self._frame_index])
+
+        self._frame_index += 1
+        if self._frame_index == len(self._frames):
+            self._frame_index = 0
+            if len(self._files) > 1:
+                # unmap the file before mapping the next one
+                self._frames = None
+                self._file_index = (self._file_index + 1) % len(self._files)
+        return out
+
+    def __repr__(self):
+        return (
+            f"{self.__class__.__name__}(path={str(self.path)!r}, "
+            f"shape={self.shape}, dtype={self.frame.dtype}, "
+            f"frame_count={self.frame_count})"
+        )
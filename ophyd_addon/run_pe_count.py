@@ -10,7 +10,8 @@ from databroker import catalog
 from caproto import config_caproto_logging
 
 from ophyd_addon.areadetector.document_builders import NewPerkinElmerDetector
-from ophyd_addon.perkin_elmer_diffraction_plan import pe_count
+from ophyd_addon.perkin_elmer_diffraction_plan import get_pe_detector, pe_count
+from ophyd_addon.virtual_clock import clock_from_environment, install_clock
 
 from ophyd.log import config_ophyd_logging
 
@@ -22,6 +23,10 @@ from ophyd.log import config_ophyd_logging
 logging.getLogger("TiffWriter").setLevel(logging.DEBUG)
 logging.getLogger("TiffWriter").addHandler(logging.StreamHandler())
 
+# report how long each detector signal took to connect
+logging.getLogger("ophyd_addon.device_registry").setLevel(logging.INFO)
+logging.getLogger("ophyd_addon.device_registry").addHandler(logging.StreamHandler())
+
 
 def run():
     """
@@ -32,6 +37,10 @@ def run():
     Run mongo or you will get "All EventDispatch queues are empty."
 
     Run simulated IOC.
+
+    Set OPHYD_ADDON_TIME_SCALE for both the simulated IOC and this process
+    to run the plan on a virtual clock, for example
+        OPHYD_ADDON_TIME_SCALE=60
     """
     # arg_parser = argparse.ArgumentParser()
     # arg_parser.add_argument("--agent-name", required=True, type=str)
@@ -97,6 +106,8 @@ def run():
 
     RE = MyRunEngine()
     RE.register_command(name="wait_for_status", func=RE._wait_for_status)
+    # bps.sleep() in pe_count sleeps on the same virtual clock as the simulated IOC
+    install_clock(RE, clock_from_environment())
 
     bec = BestEffortCallback()
 
@@ -106,6 +117,9 @@ def run():
 
     RE.subscribe(db.v1.insert)
 
+    # connect the detector before the plan runs on the RunEngine event loop
+    pe_detector = get_pe_detector()
+
     RE(
         pe_count(
             filename="",
@@ -114,6 +128,7 @@ def run():
             num_dark_images=1,
             num_repetitions=1,
             delay=2,
+            pe_detector=pe_detector,
         )
     )
 
@@ -0,0 +1,250 @@
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+
+from caproto.server import run
+
+from ophyd_addon.ioc_util import CpuMeter, LoopLagMeter
+from ophyd_addon.simulated_images import DiffractionImageGenerator
+from ophyd_addon.simulated_perkin_elmer_detector_ioc import SimulatedPerkinElmerDetectorIoc
+from ophyd_addon.virtual_clock import TIME_SCALE_ENV, make_clock
+
+logger = logging.getLogger(__name__)
+
+
+def detector_prefixes(prefix_template, detector_count):
+    """
+    Return detector_count prefixes numbered from 1, for example
+    detector_prefixes("Sim[det{}]", 2) returns ["Sim[det1]", "Sim[det2]"].
+    """
+    return [prefix_template.format(n) for n in range(1, detector_count + 1)]
+
+
+def split_prefixes(prefixes, process_count):
+    """
+    Split prefixes into at most process_count lists of consecutive prefixes
+    whose lengths differ by at most one.
+    """
+    if process_count < 1:
+        raise ValueError(f"process_count must be at least 1, not {process_count}")
+    process_count = min(process_count, len(prefixes))
+    prefix_groups = []
+    start = 0
+    for process_index in range(process_count):
+        group_size = len(prefixes) // process_count
+        if process_index < len(prefixes) % process_count:
+            group_size += 1
+        prefix_groups.append(prefixes[start:start + group_size])
+        start += group_size
+    return prefix_groups
+
+
+def make_detector_pvdb(prefixes, camera="cam1", **ioc_kwargs):
+    """
+    Return one pvdb serving a SimulatedPerkinElmerDetectorIoc for each prefix.
+
+    ioc_kwargs are passed to every SimulatedPerkinElmerDetectorIoc, so the
+    detectors share a clock and image generator if they are given.
+    """
+    pvdb = {}
+    for prefix in prefixes:
+        ioc = SimulatedPerkinElmerDetectorIoc(
+            prefix=prefix, macros=dict(camera=camera), **ioc_kwargs
+        )
+        pvdb.update(ioc.pvdb)
+    return pvdb
+
+
+def make_load_reporter(prefixes, report_interval, loop_lag_interval=0.1, started_event=None):
+    """
+    Return a caproto startup hook that logs the CPU used by this process and
+    the lag of its event loop every report_interval seconds.
+
+    The hook sets started_event, if given, when it starts. Startup hooks run
+    after the server is listening on its TCP port.
+    """
+
+    async def report_load(async_lib):
+        if started_event is not None:
+            started_event.set()
+        loop_lag_meter = LoopLagMeter(interval=loop_lag_interval)
+        cpu_meter = CpuMeter()
+        loop_lag_task = asyncio.ensure_future(loop_lag_meter.run(async_lib))
+        try:
+            while True:
+                await async_lib.library.sleep(report_interval)
+                logger.info(
+                    "pid %d serving %d detectors %s to %s: "
+                    "cpu %.1f%% loop lag mean %.2fms max %.2fms",
+                    os.getpid(),
+                    len(prefixes),
+                    prefixes[0],
+                    prefixes[-1],
+                    cpu_meter.sample(),
+                    loop_lag_meter.mean_lag * 1000,
+                    loop_lag_meter.max_lag * 1000,
+                )
+                loop_lag_meter.reset()
+        finally:
+            loop_lag_task.cancel()
+
+    return report_load
+
+
+def serve_detectors(
+    prefixes,
+    shape=(2048, 2048),
+    readout_time=0.0667,
+    time_scale=1.0,
+    pool_max_buffers=10,
+    report_interval=10.0,
+    interfaces=None,
+    started_event=None,
+):
+    """
+    Serve a simulated detector for each prefix from one asyncio server in
+    this process, until the process is stopped.
+
+    started_event is set once the server is listening.
+    """
+    logger.info("pid %d starting %d detectors", os.getpid(), len(prefixes))
+    pvdb = make_detector_pvdb(
+        prefixes,
+        readout_time=readout_time,
+        clock=make_clock(time_scale),
+        image_generator=DiffractionImageGenerator(shape=shape),
+        pool_max_buffers=pool_max_buffers,
+    )
+    run(
+        pvdb,
+        module_name="caproto.asyncio.server",
+        interfaces=interfaces,
+        startup_hook=make_load_reporter(
+            prefixes, report_interval, started_event=started_event
+        ),
+    )
+
+
+def _serve_detectors_process(prefixes, serve_kwargs, log_level, started_event):
+    logging.basicConfig(level=log_level, format="%(asctime)s %(name)s %(message)s")
+    serve_detectors(prefixes, started_event=started_event, **serve_kwargs)
+
+
+def start_detector_processes(
+    prefix_groups, log_level=logging.INFO, start_timeout=30.0, **serve_kwargs
+):
+    """
+    Start a process serving each list of prefixes, serve_kwargs are passed
+    to serve_detectors. Returns the started processes.
+
+    Each process is started once the previous one is listening. caproto
+    servers starting together can choose the same TCP port, and all but
+    one of them fail.
+    """
+    detector_processes = []
+    for prefixes in prefix_groups:
+        started_event = multiprocessing.Event()
+        detector_process = multiprocessing.Process(
+            target=_serve_detectors_process,
+            args=(prefixes, serve_kwargs, log_level, started_event),
+            daemon=True,
+        )
+        detector_process.start()
+        detector_processes.append(detector_process)
+        if not started_event.wait(timeout=start_timeout):
+            for detector_process in detector_processes:
+                detector_process.terminate()
+            raise RuntimeError(
+                f"the server for {prefixes[0]} to {prefixes[-1]} "
+                f"did not start within {start_timeout}s"
+            )
+    return detector_processes
+
+
+def main():
+    """
+    Serve many simulated detectors from one host to find how many one core can serve.
+
+        python -m ophyd_addon.simulated_detector_host --detectors 8 --processes 2
+
+    serves Sim[det1] to Sim[det4] from one process and Sim[det5] to Sim[det8]
+    from another. Each process logs its CPU use and event loop lag.
+    """
+    arg_parser = argparse.ArgumentParser(description=main.__doc__)
+    arg_parser.add_argument("--detectors", type=int, default=1, help="default: 1")
+    arg_parser.add_argument(
+        "--processes",
+        type=int,
+        default=1,
+        help="Number of server processes the detectors are split across, default: 1",
+    )
+    arg_parser.add_argument(
+        "--prefix-template",
+        default="Sim[det{}]",
+        help="Detector prefix, {} is replaced by the detector number, default: Sim[det{}]",
+    )
+    arg_parser.add_argument(
+        "--shape",
+        type=int,
+        nargs=2,
+        default=[2048, 2048],
+        help="Frame size y x, default: 2048 2048",
+    )
+    arg_parser.add_argument(
+        "--readout-time",
+        type=float,
+        default=0.0667,
+        help="Seconds to read out each frame, default: 0.0667",
+    )
+    arg_parser.add_argument(
+        "--time-scale",
+        default=os.environ.get(TIME_SCALE_ENV, 1.0),
+        help=(
+            "Virtual seconds per real second or 'simulated' for a clock that "
+            f"does not wait, default: ${TIME_SCALE_ENV} or 1.0"
+        ),
+    )
+    arg_parser.add_argument(
+        "--pool-max-buffers",
+        type=int,
+        default=10,
+        help="Number of frame buffers in the NDArray pool of each detector, default: 10",
+    )
+    arg_parser.add_argument(
+        "--report-interval",
+        type=float,
+        default=10.0,
+        help="Seconds between CPU and loop lag reports, default: 10",
+    )
+    arg_parser.add_argument(
+        "--interfaces", nargs="+", default=None, help="default: all interfaces"
+    )
+    args = arg_parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    prefixes = detector_prefixes(args.prefix_template, args.detectors)
+    serve_kwargs = dict(
+        shape=tuple(args.shape),
+        readout_time=args.readout_time,
+        time_scale=args.time_scale,
+        pool_max_buffers=args.pool_max_buffers,
+        report_interval=args.report_interval,
+        interfaces=args.interfaces,
+    )
+    prefix_groups = split_prefixes(prefixes, args.processes)
+    if len(prefix_groups) == 1:
+        serve_detectors(prefixes, **serve_kwargs)
+    else:
+        detector_processes = start_detector_processes(prefix_groups, **serve_kwargs)
+        try:
+            for detector_process in detector_processes:
+                detector_process.join()
+        except KeyboardInterrupt:
+            for detector_process in detector_processes:
+                detector_process.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+import numpy as np
+
+
+# the first reflections of CeO2 (fcc, a = 5.411 angstroms), a common calibrant
+CEO2_LATTICE_PARAMETER = 5.411
+CEO2_REFLECTIONS = (
+    # (h, k, l), relative intensity
+    ((1, 1, 1), 1.00),
+    ((2, 0, 0), 0.29),
+    ((2, 2, 0), 0.52),
+    ((3, 1, 1), 0.42),
+    ((2, 2, 2), 0.07),
+    ((4, 0, 0), 0.08),
+    ((3, 3, 1), 0.15),
+    ((4, 2, 0), 0.11),
+    ((4, 2, 2), 0.12),
+    ((5, 1, 1), 0.08),
+)
+
+
+def cubic_d_spacings(lattice_parameter, reflections):
+    """
+    Return a list of (d-spacing, relative intensity) for a cubic lattice.
+    """
+    return [
+        (lattice_parameter / np.sqrt(sum(index ** 2 for index in hkl)), intensity)
+        for hkl, intensity in reflections
+    ]
+
+
+class DiffractionImageGenerator:
+    """
+    Render simulated powder diffraction frames.
+
+    The noise-free count rate (Debye-Scherrer rings on an air scatter
+    background with a beam stop and beam stop arm shadow) and the detector
+    offset (a pedestal with a fixed per-pixel pattern) are computed once
+    in __init__. Each call to generate() draws noise into preallocated
+    float32 buffers and casts the result into the same preallocated uint16
+    frame, so no arrays are allocated per frame. Dark frames have only the
+    offset and read noise.
+
+    Counting noise is Poisson noise in the normal approximation,
+    counts = offset + mean + sqrt(read_noise**2 + mean) * N(0, 1),
+    clipped to the uint16 range.
+    This is a good approximation for the tens to thousands of counts per
+    pixel in a typical diffraction frame and unlike numpy's poisson() it
+    can be drawn in place.
+
+    Parameters
+    ----------
+    shape: tuple of int
+        (size_y, size_x) in pixels, 2048x2048 for a PerkinElmer XRD 1621
+    pixel_size: float
+        mm
+    detector_distance: float
+        sample to detector distance in mm
+    wavelength: float
+        x-ray wavelength in angstroms
+    d_spacings: sequence of (d-spacing, relative intensity)
+        defaults to the first CeO2 reflections
+    beam_center: tuple of float
+        (y, x) in pixels, defaults to the center of the frame
+    ring_counts_per_second: float
+        peak count rate of the strongest ring
+    ring_width: float
+        standard deviation of the ring profile in pixels
+    background_counts_per_second: float
+        air scatter count rate at the beam center
+    beam_stop_radius: float
+        pixels
+    beam_stop_transmission: float
+        fraction of counts passing through the beam stop and its arm
+    offset_level: float
+        mean detector offset in counts
+    offset_variation: float
+        standard deviation of the fixed offset pattern in counts
+    read_noise: float
+        standard deviation of the read noise in counts
+    seed: int, optional
+        seed for the noise generator
+    """
+
+    def __init__(
+        self,
+        shape=(2048, 2048),
+        *,
+        pixel_size=0.2,
+        detector_distance=500.0,
+        wavelength=0.2,
+        d_spacings=None,
+        beam_center=None,
+        ring_counts_per_second=2000.0,
+        ring_width=2.5,
+        background_counts_per_second=100.0,
+        beam_stop_radius=40.0,
+        beam_stop_transmission=0.01,
+        offset_level=500.0,
+        offset_variation=20.0,
+        read_noise=5.0,
+        seed=None,
+    ):
+        if d_spacings is None:
+            d_spacings = cubic_d_spacings(CEO2_LATTICE_PARAMETER, CEO2_REFLECTIONS)
+        if beam_center is None:
+            beam_center = ((shape[0] - 1) / 2, (shape[1] - 1) / 2)
+
+        self.shape = tuple(shape)
+        self.frame = np.zeros(self.shape, dtype=np.uint16)
+
+        self._rng = np.random.default_rng(seed)
+        self._counts_per_second = self._render_counts_per_second(
+            pixel_size=pixel_size,
+            detector_distance=detector_distance,
+            wavelength=wavelength,
+            d_spacings=d_spacings,
+            beam_center=beam_center,
+            ring_counts_per_second=ring_counts_per_second,
+            ring_width=ring_width,
+            background_counts_per_second=background_counts_per_second,
+            beam_stop_radius=beam_stop_radius,
+            beam_stop_transmission=beam_stop_transmission,
+        )
+        self._read_noise = read_noise
+        self._offset = self._rng.normal(
+            offset_level, offset_variation, size=self.shape
+        ).astype(np.float32)
+        # per-exposure buffers, updated only when the exposure changes
+        self._exposure = None
+        self._mean_counts = np.empty(self.shape, dtype=np.float32)
+        self._sigma_counts = np.empty(self.shape, dtype=np.float32)
+        # per-frame buffer
+        self._counts = np.empty(self.shape, dtype=np.float32)
+
+    @property
+    def size_x(self):
+        return self.shape[1]
+
+    @property
+    def size_y(self):
+        return self.shape[0]
+
+    def _render_counts_per_second(
+        self,
+        *,
+        pixel_size,
+        detector_distance,
+        wavelength,
+        d_spacings,
+        beam_center,
+        ring_counts_per_second,
+        ring_width,
+        background_counts_per_second,
+        beam_stop_radius,
+        beam_stop_transmission,
+    ):
+        size_y, size_x = self.shape
+        y, x = np.ogrid[0:size_y, 0:size_x]
+        dy = (y - beam_center[0]).astype(np.float32)
+        dx = (x - beam_center[1]).astype(np.float32)
+        radius = np.hypot(dy, dx)
+
+        counts_per_second = np.zeros(self.shape, dtype=np.float32)
+        for d_spacing, relative_intensity in d_spacings:
+            # Bragg's law gives the scattering angle 2-theta
+            sin_theta = wavelength / (2 * d_spacing)
+            if sin_theta >= 1.0:
+                continue
+            two_theta = 2 * np.arcsin(sin_theta)
+            ring_radius = detector_distance * np.tan(two_theta) / pixel_size
+            counts_per_second += (
+                ring_counts_per_second
+                * relative_intensity
+                * np.exp(-0.5 * ((radius - ring_radius) / ring_width) ** 2)
+            )
+
+        # air scatter falls off away from the beam
+        counts_per_second += background_counts_per_second * np.exp(
+            -radius / max(self.shape)
+        )
+
+        # the beam stop and an arm holding it from the right edge
+        shadow = (radius < beam_stop_radius) | (
+            (np.abs(dy) < beam_stop_radius / 4) & (dx > 0)
+        )
+        counts_per_second[shadow] *= beam_stop_transmission
+
+        return counts_per_second
+
+    def set_exposure(self, exposure):
+        """
+        Update the mean and sigma buffers for a new exposure time in seconds.
+        """
+        if exposure != self._exposure:
+            np.multiply(self._counts_per_second, exposure, out=self._mean_counts)
+            np.add(self._mean_counts, self._read_noise ** 2, out=self._sigma_counts)
+            np.sqrt(self._sigma_counts, out=self._sigma_counts)
+            np.add(self._mean_counts, self._offset, out=self._mean_counts)
+            self._exposure = exposure
+
+    def generate(self, exposure=1.0, dark=False, out=None):
+        """
+        Render one frame of `exposure` seconds, with the shutter closed if dark is True.
+
+        Parameters
+        ----------
+        out: numpy.ndarray, optional
+            uint16 array of the frame shape to render into, for example
+            an NDArrayPool buffer
+
+        Returns
+        -------
+        out, or the preallocated uint16 frame which is overwritten by the next call
+        """
+        counts = self._counts
+        self._rng.standard_normal(dtype=np.float32, out=counts)
+        if dark:
+            np.multiply(counts, self._read_noise, out=counts)
+            np.add(counts, self._offset, out=counts)
+        else:
+            self.set_exposure(exposure)
+            np.multiply(counts, self._sigma_counts, out=counts)
+            np.add(counts, self._mean_counts, out=counts)
+        np.clip(counts, 0, np.iinfo(np.uint16).max, out=counts)
+        np.rint(counts, out=counts)
+        if out is None:
+            out = self.frame
+        np.copyto(out, counts, casting="unsafe")
+        return out
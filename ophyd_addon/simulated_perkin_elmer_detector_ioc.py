@@ -1,38 +1,216 @@
+import abc
 from enum import IntEnum, unique
+import functools
+import json
 import logging
+import os
+import time
 
 from textwrap import dedent
 
+import numpy as np
+
 from caproto import ChannelType
 from caproto._log import config_caproto_logging
-from caproto.server import pvproperty, PVGroup, SubGroup, ioc_arg_parser, run
-
-from ophyd_addon.ioc_util import no_reentry
+from caproto.server import pvproperty, PVGroup, SubGroup, template_arg_parser, run
+from caproto.server.server import PVGroupMeta
+
+from ophyd_addon.codec import CODEC_MODULES, NO_CODEC, available_codecs, compress
+from ophyd_addon.frame_processing import (
+    BackgroundOffsetScale,
+    BadPixelCorrection,
+    FrameAverager,
+    FrameStatistics,
+    GainCorrection,
+    OffsetCorrection,
+    ReadoutRegion,
+    load_correction_map,
+)
+from ophyd_addon.hdf5 import COMPRESSION_FILTERS, HDF5FrameWriter
+from ophyd_addon.ioc_util import (
+    CpuMeter,
+    LatencyHistogram,
+    LoopLagMeter,
+    PVLatencyMeter,
+    no_reentry,
+    pvproperty_with_rbv,
+    rbv_settings,
+    stores_setting,
+    run_in_thread,
+)
+from ophyd_addon.ndarray_pool import ND_DATA_TYPES, NDArrayPool
+from ophyd_addon.replay_images import ReplayImageGenerator
+from ophyd_addon.simulated_images import DiffractionImageGenerator
+from ophyd_addon.simulated_timing import (
+    AcquisitionTimingModel,
+    FrameRateMeter,
+    ImageMode,
+)
+from ophyd_addon.tiff import write_tiff
+from ophyd_addon.virtual_clock import RealClock, TIME_SCALE_ENV, make_clock
 
 config_caproto_logging(level=logging.INFO)
 
 
 class PluginBasePVGroup(PVGroup):
-    def __init__(self, *args, plugin_type_rbv=None, **kwargs):
+    # the QSIZE of the areaDetector commonPlugins.cmd
+    DEFAULT_QUEUE_SIZE = 20
+
+    def __init__(self, *args, plugin_type_rbv=None, port_name_rbv=None, **kwargs):
         super().__init__(*args, **kwargs)
-        self._enable_callbacks = PluginBasePVGroup.EnableCallbacks.ENABLE
-        self._blocking_callbacks = PluginBasePVGroup.BlockingCallbacks.NO
-        self._port_name_rbv = "FileTIFF1"  # ?????
-        self._nd_array_port = None
+        # EnableCallbacks, BlockingCallbacks and the other setpoints as written
+        self.settings = rbv_settings(self)
+        self._port_name_rbv = port_name_rbv  # "FileTIFF1"
+        # plugins receive arrays from the camera until NDArrayPort is written
+        self._nd_array_port = getattr(self.parent, "PORT_NAME", None)
         self._plugin_type_rbv = plugin_type_rbv  # "NDFileTIFF"
+        # NDArrays waiting for the plugin when BlockingCallbacks is No, the
+        # queue is created when the IOC starts
+        self._array_queue = None
+        self._queue_size = PluginBasePVGroup.DEFAULT_QUEUE_SIZE
+        self._dropped_arrays = 0
+
+    async def receive_array(self, ndarray):
+        """
+        Called by the camera with each new NDArray when ArrayCallbacks is enabled.
+
+        With BlockingCallbacks=Yes the NDArray is processed before this
+        returns, in the camera's acquisition task. With BlockingCallbacks=No
+        it is reserved and queued for the plugin's own task, unless QueueSize
+        NDArrays are already waiting, then it is dropped and counted in
+        DroppedArrays_RBV, as areaDetector plugins do when they fall behind.
+        """
+        if self.settings.enable_callbacks != PluginBasePVGroup.EnableCallbacks.ENABLE:
+            return
+        if (
+            self.settings.blocking_callbacks == PluginBasePVGroup.BlockingCallbacks.YES
+            or self._array_queue is None
+        ):
+            await self.handle_array(ndarray)
+        elif self._array_queue.qsize() >= self._queue_size:
+            self._dropped_arrays += 1
+            await self.dropped_arrays_rbv.write(self._dropped_arrays)
+        else:
+            self._array_queue.put_nowait(ndarray.reserve())
+            await self.update_queue_free()
+
+    @property
+    def port_name(self):
+        return self._port_name_rbv
+
+    @property
+    def nd_array_port_name(self):
+        return self._nd_array_port
+
+    async def handle_array(self, ndarray):
+        """
+        Process an NDArray and pass the result on to the plugins whose
+        NDArrayPort is this plugin.
+        """
+        t0 = time.perf_counter()
+        self.settings.array_counter += 1
+        await self.array_counter_rbv.write(self.settings.array_counter)
+        await self.update_array_size(ndarray.data)
+        output_ndarray = await self.process_array(ndarray)
+        await self.execution_time_rbv.write((time.perf_counter() - t0) * 1000)
+        if output_ndarray is None:
+            return
+        try:
+            if self.settings.array_callbacks == PluginBasePVGroup.ArrayCallbacks.ENABLE:
+                await self.parent.dispatch_array(output_ndarray, port_name=self.port_name)
+        finally:
+            if output_ndarray is not ndarray:
+                output_ndarray.release()
+
+    async def process_queued_arrays(self):
+        """
+        Process queued NDArrays one at a time until the IOC stops.
+        """
+        while True:
+            ndarray = await self._array_queue.get()
+            try:
+                await self.handle_array(ndarray)
+            except Exception:
+                self.log.exception("failed to process %r", ndarray)
+            finally:
+                ndarray.release()
+                self._array_queue.task_done()
+                await self.update_queue_free()
+
+    async def update_queue_free(self):
+        if self._array_queue is None:
+            return
+        queue_free = max(self._queue_size - self._array_queue.qsize(), 0)
+        if self.queue_free.value != queue_free:
+            await self.queue_free.write(queue_free)
+
+    async def update_array_size(self, frame):
+        """
+        Write the size of a 2D frame to ArraySize0_RBV (x) and ArraySize1_RBV (y).
+        """
+        size_y, size_x = frame.shape
+        if self.array_size0_rbv.value != size_x:
+            await self.array_size0_rbv.write(size_x)
+        if self.array_size1_rbv.value != size_y:
+            await self.array_size1_rbv.write(size_y)
+
+    async def write_initial_values(self):
+        """
+        Write the values that are known only when the plugin is created to
+        their PVs. This is called when the IOC starts.
+
+        Every other readback is written by the putter of its setpoint, or
+        where the plugin changes it, so monitors on readbacks fire.
+        """
+        await self.plugin_type_rbv.write(self._plugin_type_rbv)
+        await self.port_name_rbv.write(self._port_name_rbv)
+        if self._nd_array_port is not None:
+            await self.nd_array_port.write(self._nd_array_port)
+
+    async def process_array(self, ndarray):
+        """
+        Override this to handle frames. The NDArray buffer returns to the
+        camera's pool after this returns, call ndarray.reserve() to keep it
+        and ndarray.release() when done with it.
+
+        The frame is shared with every other plugin on the same port and is
+        read-only. Return the NDArray to pass on to the plugins on this port:
+        ndarray itself, a new NDArray from the camera's pool with a reference
+        for the caller to release, or None to pass nothing on.
+        """
+        return ndarray
 
     """
     PluginType
     """
 
-    @pvproperty(
+    plugin_type_rbv = pvproperty(
         name=":PluginType_RBV",
         dtype=ChannelType.STRING,
         value="uninitialized PluginType_RBV",
         read_only=True,
     )
-    async def plugin_type_rbv(self, instance):
-        return self._plugin_type_rbv
+
+    @plugin_type_rbv.startup
+    async def plugin_type_rbv(self, instance, async_lib):
+        await self.write_initial_values()
+
+    """
+    ArraySize0_RBV, ArraySize1_RBV, ArraySize2_RBV
+        size of the last array the plugin received, ophyd will not stage an
+        HDF5 plugin that has not received an array
+    """
+
+    array_size0_rbv = pvproperty(
+        name=":ArraySize0_RBV", dtype=ChannelType.INT, value=0, read_only=True
+    )
+    array_size1_rbv = pvproperty(
+        name=":ArraySize1_RBV", dtype=ChannelType.INT, value=0, read_only=True
+    )
+    # frames are 2D
+    array_size2_rbv = pvproperty(
+        name=":ArraySize2_RBV", dtype=ChannelType.INT, value=0, read_only=True
+    )
 
     """
     BlockingCallbacks (No, Yes)
@@ -42,29 +220,12 @@ class PluginBasePVGroup(PVGroup):
         NO = "No"
         YES = "Yes"
 
-    @pvproperty(
+    blocking_callbacks, blocking_callbacks_rbv = pvproperty_with_rbv(
         name=":BlockingCallbacks",
         dtype=ChannelType.ENUM,
         enum_strings=(BlockingCallbacks.NO, BlockingCallbacks.YES),
         value=BlockingCallbacks.NO,
     )
-    async def blocking_callbacks(self, instance):
-        return self._blocking_callbacks
-
-    @blocking_callbacks.putter
-    async def blocking_callbacks(self, instance, value):
-        self._blocking_callbacks = value
-        return value
-
-    @pvproperty(
-        name=":BlockingCallbacks_RBV",
-        dtype=ChannelType.ENUM,
-        enum_strings=(BlockingCallbacks.NO, BlockingCallbacks.YES),
-        value=BlockingCallbacks.NO,
-        read_only=True,
-    )
-    async def blocking_callbacks_rbv(self, instance):
-        return self._blocking_callbacks
 
     """
     EnableCallbacks (0 - Disable, 1 - Enable)
@@ -74,47 +235,293 @@ class PluginBasePVGroup(PVGroup):
         DISABLE = "Disable"
         ENABLE = "Enable"
 
-    @pvproperty(
+    enable_callbacks, enable_callbacks_rbv = pvproperty_with_rbv(
         name=":EnableCallbacks",
         dtype=ChannelType.ENUM,
         enum_strings=(EnableCallbacks.DISABLE, EnableCallbacks.ENABLE),
         value=EnableCallbacks.ENABLE,
     )
-    async def enable_callbacks(self, instance):
-        return self._enable_callbacks
 
-    @enable_callbacks.putter
-    async def enable_callbacks(self, instance, value):
-        self._enable_callbacks = value
+    """
+    PortName_RBV
+    """
+
+    port_name_rbv = pvproperty(
+        name=":PortName_RBV",
+        dtype=ChannelType.CHAR,
+        max_length=1024,
+        value=None,
+        read_only=True,
+    )
+
+    """
+    NDArrayPort
+        the port, the camera or another plugin, whose arrays this plugin
+        receives, by default the camera. A port that would feed the plugin
+        its own arrays is rejected.
+        Configure correctly or get this:
+        RuntimeError: The asyn ports ['uninitialized NDArrayPort'] are used by plugins
+        that ophyd is aware of but the source plugin is not.  Please reconfigure your
+        device to include the source plugin or reconfigure to not use these ports.
+    """
+
+    nd_array_port = pvproperty(name=":NDArrayPort", dtype=ChannelType.STRING, value=None)
+
+    @nd_array_port.putter
+    async def nd_array_port(self, instance, value):
+        upstream_port_name = value
+        while upstream_port_name:
+            if upstream_port_name == self._port_name_rbv:
+                raise ValueError(
+                    f"NDArrayPort {value} would send {self._port_name_rbv} its own arrays"
+                )
+            upstream_plugin = self.parent.plugin(upstream_port_name)
+            if upstream_plugin is None:
+                break
+            upstream_port_name = upstream_plugin.nd_array_port_name
+        self._nd_array_port = value
+        await self.nd_array_port_rbv.write(value)
         return value
 
-    @pvproperty(
-        name=":EnableCallbacks_RBV",
-        dtype=ChannelType.ENUM,
-        enum_strings=(EnableCallbacks.DISABLE, EnableCallbacks.ENABLE),
-        value=EnableCallbacks.ENABLE,
+    nd_array_port_rbv = pvproperty(
+        name=":NDArrayPort_RBV",
+        dtype=ChannelType.STRING,
+        # max_length=1024,
+        value=None,
         read_only=True,
     )
-    async def enable_callbacks_rbv(self, instance):
-        return self._enable_callbacks
+
+    # array_counter = ADCpt(SignalWithRBV, 'ArrayCounter')
+    array_counter, array_counter_rbv = pvproperty_with_rbv(
+        name=":ArrayCounter", dtype=ChannelType.INT, value=0
+    )
+
+    """
+    ArrayCallbacks (0 - Disable, 1 - Enable)
+        pass arrays on to the plugins whose NDArrayPort is this plugin
+    """
+
+    class ArrayCallbacks:
+        DISABLE = "Disable"
+        ENABLE = "Enable"
+
+    array_callbacks, array_callbacks_rbv = pvproperty_with_rbv(
+        name=":ArrayCallbacks",
+        dtype=ChannelType.ENUM,
+        enum_strings=(ArrayCallbacks.DISABLE, ArrayCallbacks.ENABLE),
+        value=ArrayCallbacks.ENABLE,
+    )
+
+    """
+    ExecutionTime_RBV
+        milliseconds the plugin spent processing the most recent array, not
+        counting the plugins it passed the array on to
+    """
+
+    execution_time_rbv = pvproperty(
+        name=":ExecutionTime_RBV", dtype=ChannelType.DOUBLE, value=0.0, read_only=True
+    )
+
+    """
+    QueueSize
+        NDArrays that can wait for the plugin when BlockingCallbacks is No
+    QueueFree
+        free places in the queue
+    DroppedArrays, DroppedArrays_RBV
+        NDArrays dropped because the queue was full, write 0 to reset
+    """
+
+    @pvproperty(name=":QueueSize", dtype=ChannelType.INT, value=DEFAULT_QUEUE_SIZE)
+    async def queue_size(self, instance):
+        return self._queue_size
+
+    @queue_size.putter
+    async def queue_size(self, instance, value):
+        if value < 1:
+            raise ValueError(f"QueueSize must be at least 1, not {value}")
+        # NDArrays already queued stay queued if the queue shrinks
+        self._queue_size = value
+        await self.update_queue_free()
+        return value
+
+    @queue_size.startup
+    async def queue_size(self, instance, async_lib):
+        self._array_queue = async_lib.library.Queue()
+        await self.process_queued_arrays()
+
+    queue_free = pvproperty(
+        name=":QueueFree", dtype=ChannelType.INT, value=DEFAULT_QUEUE_SIZE, read_only=True
+    )
+
+    @pvproperty(name=":DroppedArrays", dtype=ChannelType.INT, value=0)
+    async def dropped_arrays(self, instance):
+        return self._dropped_arrays
+
+    @dropped_arrays.putter
+    async def dropped_arrays(self, instance, value):
+        self._dropped_arrays = value
+        await self.dropped_arrays_rbv.write(value)
+        return value
+
+    dropped_arrays_rbv = pvproperty(
+        name=":DroppedArrays_RBV", dtype=ChannelType.INT, value=0, read_only=True
+    )
+
+
+class AbstractPVGroupMeta(PVGroupMeta, abc.ABCMeta):
+    """
+    Metaclass of PVGroups with abstract methods, caproto PVGroups can not
+    use abc.ABC as a base class.
+    """
 
 
-class FilePluginPVGroup(PluginBasePVGroup):
+class FilePluginPVGroup(PluginBasePVGroup, metaclass=AbstractPVGroupMeta):
+    """
+    Base class of the file plugins, subclasses write the files and set
+    default_file_template, which is used while FileTemplate is empty.
+    """
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self._file_name = None
-        self._file_number = None
-        self._file_path = None
-        self._file_path_exists = None
-        self._file_template = None
-        self._file_write_mode = None
-        self._write_file = None
-
-        self._array_counter = None
-        self._auto_increment = None
-        self._auto_save = None
-        self._capture = None
-        self._num_capture = None
+        # the most recent NDArray from the camera, reserved until the next one
+        self._ndarray = None
+
+        # Capture and Stream modes
+        self._capturing = False
+        self._num_captured = 0
+        # NDArrays buffered in Capture mode, reserved until they are written
+        self._captured_ndarrays = []
+
+    async def process_array(self, ndarray):
+        if self._ndarray is not None:
+            self._ndarray.release()
+        self._ndarray = ndarray.reserve()
+
+        if self._capturing:
+            await self.capture_array(ndarray)
+        elif (
+            self.settings.auto_save == FilePluginPVGroup.AutoSave.YES
+            and self.settings.file_write_mode == FilePluginPVGroup.FileWriteMode.SINGLE
+        ):
+            # as areaDetector, AutoSave writes every NDArray in Single mode
+            await self.write_array(self.capture.async_lib, ndarray)
+        return ndarray
+
+    async def capture_array(self, ndarray):
+        """
+        Buffer (Capture mode) or write (Stream mode) an NDArray while capturing.
+
+        Capture completes when NumCaptured_RBV reaches NumCapture, or when
+        Capture=0 is written if NumCapture is 0.
+        """
+        async_lib = self.capture.async_lib
+        self._num_captured += 1
+        await self.num_captured_rbv.write(self._num_captured)
+        if self.settings.file_write_mode == FilePluginPVGroup.FileWriteMode.STREAM:
+            await self.write_arrays(async_lib, [ndarray])
+        else:
+            self._captured_ndarrays.append(ndarray.reserve())
+
+        num_capture = self.settings.num_capture
+        if num_capture > 0 and self._num_captured >= num_capture:
+            await self.end_capture(async_lib)
+            await self.capture.write(FilePluginPVGroup.Capture.DONE)
+
+    async def end_capture(self, async_lib):
+        """
+        Stop capturing and write the frames buffered in Capture mode in one batch.
+        """
+        self._capturing = False
+        captured_ndarrays, self._captured_ndarrays = self._captured_ndarrays, []
+        try:
+            if captured_ndarrays:
+                await self.write_arrays(async_lib, captured_ndarrays)
+        finally:
+            for captured_ndarray in captured_ndarrays:
+                captured_ndarray.release()
+
+    def get_full_file_name(self):
+        """
+        Expand FileTemplate with FilePath, FileName and FileNumber.
+
+        As in areaDetector FileTemplate is a C format string with two %s
+        conversions for FilePath and FileName and one integer conversion
+        for FileNumber, for example "%s%s_%6.6d.tiff".
+        """
+        file_template = self.settings.file_template or self.default_file_template
+        file_path = self.file_path.value
+        if file_path and not file_path.endswith(os.sep):
+            file_path += os.sep
+        return file_template % (
+            file_path,
+            self.settings.file_name,
+            self.settings.file_number,
+        )
+
+    async def next_full_file_name(self):
+        """
+        Return the file name for the next write and increment FileNumber
+        if AutoIncrement is Yes.
+        """
+        full_file_name = self.get_full_file_name()
+        if self.settings.auto_increment == FilePluginPVGroup.AutoIncrement.YES:
+            await self.file_number.write(self.settings.file_number + 1)
+        return full_file_name
+
+    @abc.abstractmethod
+    def write_image_file(self, full_file_name, image):
+        """
+        Write image to full_file_name, this is called in a worker thread.
+        """
+
+    def write_image_files(self, full_file_names, images):
+        """
+        Write each image to its file, this is called in a worker thread.
+        """
+        for full_file_name, image in zip(full_file_names, images):
+            self.write_image_file(full_file_name, image)
+
+    async def write_arrays(self, async_lib, ndarrays):
+        """
+        Write NDArrays captured in Capture or Stream mode in one worker thread call.
+
+        TIFF files hold one frame, so each NDArray is written to its own file
+        and with AutoIncrement=Yes FileNumber is incremented after each of them.
+        """
+        full_file_names = [await self.next_full_file_name() for _ in ndarrays]
+        self.log.info("writing %d files from %s", len(full_file_names), full_file_names[0])
+        await run_in_thread(
+            async_lib,
+            self.write_image_files,
+            full_file_names,
+            [ndarray.data for ndarray in ndarrays],
+        )
+        await self.full_file_name_rbv.write(full_file_names[-1])
+
+    async def write_frame(self, async_lib):
+        """
+        Write the most recent frame without blocking the IOC.
+        """
+        if self._ndarray is None:
+            raise RuntimeError(f"{self.prefix}: there is no frame to write")
+        await self.write_array(async_lib, self._ndarray)
+
+    async def write_array(self, async_lib, ndarray):
+        """
+        Write one NDArray to its own file without blocking the IOC.
+        """
+        # a new frame may replace self._ndarray while the file is being
+        # written, the reservation keeps the pool from reusing this buffer
+        ndarray = ndarray.reserve()
+        try:
+            full_file_name = await self.next_full_file_name()
+            self.log.info("writing %s", full_file_name)
+            await run_in_thread(
+                async_lib, self.write_image_file, full_file_name, ndarray.data
+            )
+            await self.full_file_name_rbv.write(full_file_name)
+        finally:
+            ndarray.release()
 
     # FileWriteMode = enum(SINGLE=0, CAPTURE=1, STREAM=2)
     #
@@ -123,87 +530,63 @@ class FilePluginPVGroup(PluginBasePVGroup):
         NO = "No"
         YES = "Yes"
 
-    @pvproperty(
+    auto_increment, auto_increment_rbv = pvproperty_with_rbv(
         name=":AutoIncrement",
         dtype=ChannelType.ENUM,
         enum_strings=(AutoIncrement.NO, AutoIncrement.YES),
         value=AutoIncrement.NO,
     )
-    async def auto_increment(self, instance):
-        return self._auto_increment
-
-    @auto_increment.putter
-    async def auto_increment(self, instance, value):
-        self._auto_increment = value
-        return value
-
-    @pvproperty(
-        name=":AutoIncrement_RBV",
-        dtype=ChannelType.ENUM,
-        enum_strings=(AutoIncrement.NO, AutoIncrement.YES),
-        value=AutoIncrement.NO,
-        read_only=True,
-    )
-    async def auto_increment_rbv(self, instance):
-        return self._auto_increment
 
     # auto_save = Cpt(SignalWithRBV, 'AutoSave', kind='config')
     class AutoSave:
         NO = "No"
         YES = "Yes"
 
-    @pvproperty(
+    auto_save, auto_save_rbv = pvproperty_with_rbv(
         name=":AutoSave",
         dtype=ChannelType.ENUM,
         enum_strings=(AutoSave.NO, AutoSave.YES),
         value=AutoSave.NO,
     )
-    async def auto_save(self, instance):
-        return self._auto_save
-
-    @auto_save.putter
-    async def auto_save(self, instance, value):
-        self._auto_save = value
-        return value
-
-    @pvproperty(
-        name=":AutoSave_RBV",
-        dtype=ChannelType.ENUM,
-        enum_strings=(AutoSave.NO, AutoSave.YES),
-        value=AutoSave.NO,
-        read_only=True,
-    )
-    async def auto_save_rbv(self, instance):
-        return self._auto_save
 
     # capture = Cpt(SignalWithRBV, 'Capture')
     class Capture:
         DONE = "Done"
         CAPTURING = "Capturing"
 
-    @pvproperty(
+    capture = pvproperty(
         name=":Capture",
         dtype=ChannelType.ENUM,
         enum_strings=(Capture.DONE, Capture.CAPTURING),
         value=Capture.DONE,
     )
-    async def capture(self, instance):
-        return self._capture
 
     @capture.putter
     async def capture(self, instance, value):
-        self._capture = value
+        if value == FilePluginPVGroup.Capture.CAPTURING:
+            if self.settings.file_write_mode == FilePluginPVGroup.FileWriteMode.SINGLE:
+                raise ValueError("Capture requires FileWriteMode Capture or Stream")
+            if not self._capturing:
+                self._num_captured = 0
+                await self.num_captured_rbv.write(0)
+                self._capturing = True
+        elif self._capturing:
+            # Capture=0 ends the capture early
+            await self.end_capture(instance.async_lib)
+        await self.capture_rbv.write(value)
         return value
 
-    @pvproperty(
+    @capture.startup
+    async def capture(self, instance, async_lib):
+        instance.async_lib = async_lib
+
+    capture_rbv = pvproperty(
         name=":Capture_RBV",
         dtype=ChannelType.ENUM,
         enum_strings=(Capture.DONE, Capture.CAPTURING),
         value=Capture.DONE,
         read_only=True,
     )
-    async def capture_rbv(self, instance):
-        return self._capture
 
     # delete_driver_file = Cpt(SignalWithRBV, 'DeleteDriverFile', kind='config')
     # file_format = Cpt(SignalWithRBV, 'FileFormat', kind='config')
@@ -217,79 +600,40 @@ class FilePluginPVGroup(PluginBasePVGroup):
         NO = "No"
         YES = "Yes"
 
-    @pvproperty(
+    file_path_exists, file_path_exists_rbv = pvproperty_with_rbv(
         name=":FilePathExists",
         dtype=ChannelType.ENUM,
         enum_strings=(FilePathExists.NO, FilePathExists.YES),
         value=FilePathExists.NO,
     )
-    async def file_path_exists(self, instance):
-        return self._file_path_exists
-
-    @file_path_exists.putter
-    async def file_path_exists(self, instance, value):
-        self._file_path_exists = value
-        return value
-
-    @pvproperty(
-        name=":FilePathExists_RBV",
-        dtype=ChannelType.ENUM,
-        enum_strings=(FilePathExists.NO, FilePathExists.YES),
-        value=FilePathExists.NO,
-        read_only=True,
-    )
-    async def file_path_exists_rbv(self, instance):
-        return self._file_path_exists
 
     # file_template = Cpt(SignalWithRBV, 'FileTemplate', string=True, kind='config')
-    @pvproperty(
-        name=":FileTemplate",
-        dtype=ChannelType.STRING,
-        value="",
+    file_template, file_template_rbv = pvproperty_with_rbv(
+        name=":FileTemplate", dtype=ChannelType.STRING, value=""
     )
-    async def file_template(self, instance):
-        return self._file_template
-
-    @file_template.putter
-    async def file_template(self, instance, value):
-        self._file_template = value
-        return value
 
-    @pvproperty(
-        name=":FileTemplate_RBV",
-        dtype=ChannelType.STRING,
+    # file_write_mode = Cpt(SignalWithRBV, 'FileWriteMode', kind='config')
+    # full_file_name = Cpt(EpicsSignalRO, 'FullFileName_RBV', string=True, kind='config')
+    full_file_name_rbv = pvproperty(
+        name=":FullFileName_RBV",
+        dtype=ChannelType.CHAR,
+        max_length=1024,
         value="",
         read_only=True,
     )
-    async def file_template_rbv(self, instance):
-        return self._file_template
 
-    # file_write_mode = Cpt(SignalWithRBV, 'FileWriteMode', kind='config')
-    # full_file_name = Cpt(EpicsSignalRO, 'FullFileName_RBV', string=True, kind='config')
     # num_capture = Cpt(SignalWithRBV, 'NumCapture', kind='config')
-    @pvproperty(
-        name=":NumCapture",
-        dtype=ChannelType.INT,
-        value=1,
+    num_capture, num_capture_rbv = pvproperty_with_rbv(
+        name=":NumCapture", dtype=ChannelType.INT, value=1
     )
-    async def num_capture(self, instance):
-        return self._num_capture
-
-    @num_capture.putter
-    async def num_capture(self, instance, value):
-        self._num_capture = value
-        return value
 
-    @pvproperty(
-        name=":NumCapture_RBV",
+    num_captured_rbv = pvproperty(
+        name=":NumCaptured_RBV",
         dtype=ChannelType.INT,
-        value=1,
+        value=0,
         read_only=True,
     )
-    async def num_capture_rbv(self, instance):
-        return self._num_capture
 
-    # num_captured = Cpt(EpicsSignalRO, 'NumCaptured_RBV')
     # read_file = Cpt(SignalWithRBV, 'ReadFile')
 
     """
@@ -301,22 +645,39 @@ class FilePluginPVGroup(PluginBasePVGroup):
         1 - Writing
     """
 
-    @pvproperty(
+    class WriteFile:
+        DONE = int(0)
+        WRITE = int(1)
+
+    class WriteFileRBV:
+        DONE = int(0)
+        WRITING = int(1)
+
+    write_file = pvproperty(
         name=":WriteFile",
         dtype=ChannelType.INT,
         value=0,
     )
-    async def write_file(self, instance):
-        return self._write_file
 
     @write_file.putter
     async def write_file(self, instance, value):
-        self._write_file = value
-        return value
+        if value == FilePluginPVGroup.WriteFile.WRITE:
+            # WriteFile_RBV is Writing until the file has been written and
+            # the put completes only then
+            await self.write_file_rbv.write(FilePluginPVGroup.WriteFileRBV.WRITING)
+            try:
+                await self.write_frame(instance.async_lib)
+            finally:
+                await self.write_file_rbv.write(FilePluginPVGroup.WriteFileRBV.DONE)
+        return FilePluginPVGroup.WriteFile.DONE
 
-    @pvproperty(name=":WriteFile_RBV", dtype=ChannelType.INT, value=0, read_only=True)
-    async def write_file_rbv(self, instance):
-        return self._write_file
+    @write_file.startup
+    async def write_file(self, instance, async_lib):
+        instance.async_lib = async_lib
+
+    write_file_rbv = pvproperty(
+        name=":WriteFile_RBV", dtype=ChannelType.INT, value=0, read_only=True
+    )
 
     # write_message = Cpt(EpicsSignal, 'WriteMessage', string=True)
     # write_status = Cpt(EpicsSignal, 'WriteStatus')
@@ -325,184 +686,803 @@ class FilePluginPVGroup(PluginBasePVGroup):
     FileName 
     """
 
-    @pvproperty(
+    file_name, file_name_rbv = pvproperty_with_rbv(
         name=":FileName",
         dtype=ChannelType.CHAR,
         max_length=1024,
         value="file_name at file_name definition",
     )
-    async def file_name(self, instance):
-        print(f"pvpropety file_name {instance}")
-        return self._file_name
-
-    @file_name.putter
-    async def file_name(self, instance, value):
-        print(f"file_name.putter {instance} {value}")
-        self._file_name = value
-        return value
-
-    @pvproperty(
-        name=":FileName_RBV",
-        dtype=ChannelType.CHAR,
-        max_length=1024,
-        value="file_name at file_name_rbv definition",
-        read_only=True,
-    )
-    async def file_name_rbv(self, instance):
-        return self._file_name
 
     """
     FileNumber 
     """
 
-    @pvproperty(
-        name=":FileNumber",
-        dtype=ChannelType.INT,
-        value=0,
+    file_number, file_number_rbv = pvproperty_with_rbv(
+        name=":FileNumber", dtype=ChannelType.INT, value=0
     )
-    async def file_number(self, instance):
-        return self._file_number
-
-    @file_number.putter
-    async def file_number(self, instance, value):
-        self._file_number = value
-        return value
-
-    @pvproperty(name=":FileNumber_RBV", dtype=ChannelType.INT, value=0, read_only=True)
-    async def file_number_rbv(self, instance):
-        return self._file_number
 
     """
     FilePath 
     """
 
-    @pvproperty(
+    file_path = pvproperty(
         name=":FilePath",
         dtype=ChannelType.CHAR,
         max_length=1024,
         # value="file_path pvproperty",
     )
-    async def file_path(self, instance):
-        return self._file_path
 
     @file_path.putter
     async def file_path(self, instance, value):
         print(f"file_path.putter value: {value}")
-        self._file_path = value
+        # create the directory as areaDetector does with CreateDirectory set
+        try:
+            if value:
+                os.makedirs(value, exist_ok=True)
+        except OSError:
+            self.log.exception("failed to create %s", value)
+        if value and os.path.isdir(value):
+            file_path_exists = FilePluginPVGroup.FilePathExists.YES
+        else:
+            file_path_exists = FilePluginPVGroup.FilePathExists.NO
+        await self.file_path_rbv.write(value)
+        await self.file_path_exists.write(file_path_exists)
         return value
 
-    @pvproperty(
+    file_path_rbv = pvproperty(
         name=":FilePath_RBV",
         dtype=ChannelType.CHAR,
         max_length=1024,
         # value="file_path_rbv pvproperty",
         read_only=True,
     )
-    async def file_path_rbv(self, instance):
-        return self._file_path
 
     """
     FileWriteMode (Single, Capture, Stream)
+        Single  - WriteFile writes the most recent frame
+        Capture - Capture=1 buffers NumCapture frames, they are written
+                  together when the capture completes
+        Stream  - Capture=1 writes each of the next NumCapture frames as it arrives
     """
 
-    @pvproperty(
+    class FileWriteMode:
+        SINGLE = "Single"
+        CAPTURE = "Capture"
+        STREAM = "Stream"
+
+    file_write_mode, file_write_mode_rbv = pvproperty_with_rbv(
         name=":FileWriteMode",
         dtype=ChannelType.ENUM,
-        enum_strings=("Single", "Capture", "Stream"),
-        value="Single",
+        enum_strings=(FileWriteMode.SINGLE, FileWriteMode.CAPTURE, FileWriteMode.STREAM),
+        value=FileWriteMode.SINGLE,
     )
-    async def file_write_mode(self, instance):
-        return self._file_write_mode
 
-    @file_write_mode.putter
-    async def file_write_mode(self, instance, value):
-        self._file_write_mode = value
-        return value
 
-    @pvproperty(
-        name=":FileWriteMode_RBV",
+class FileTiffPluginPVGroup(FilePluginPVGroup):
+    default_file_template = "%s%s_%3.3d.tif"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(
+            *args, plugin_type_rbv="NDFileTIFF", port_name_rbv="FileTIFF1", **kwargs
+        )
+
+    def write_image_file(self, full_file_name, image):
+        os.makedirs(os.path.dirname(full_file_name) or ".", exist_ok=True)
+        write_tiff(full_file_name, image)
+
+
+class FileHDF5PluginPVGroup(FilePluginPVGroup):
+    """
+    In Capture and Stream modes every frame of a capture is appended to one
+    chunked HDF5 dataset. The file is opened when the first frame of the
+    capture is written, which is when FileNumber is incremented, and closed
+    when the capture ends. WriteFile in Single mode writes a file with one frame.
+
+    Writing HDF5 files requires h5py.
+    """
+
+    default_file_template = "%s%s_%3.3d.h5"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(
+            *args, plugin_type_rbv="NDFileHDF5", port_name_rbv="FileHDF1", **kwargs
+        )
+        # the file of the current capture
+        self._hdf5_frame_writer = None
+
+    def open_hdf5_file(self, full_file_name, frame_shape, dtype):
+        """
+        Return an HDF5FrameWriter for full_file_name, this is called in a worker thread.
+        """
+        os.makedirs(os.path.dirname(full_file_name) or ".", exist_ok=True)
+        return HDF5FrameWriter(
+            full_file_name,
+            frame_shape=frame_shape,
+            dtype=dtype,
+            frames_per_chunk=self.settings.num_frames_chunks,
+            compression=self.settings.compression,
+            compression_level=self.settings.z_level,
+        )
+
+    def write_image_file(self, full_file_name, image):
+        with self.open_hdf5_file(full_file_name, image.shape, image.dtype) as hdf5_frame_writer:
+            hdf5_frame_writer.append([image])
+
+    async def write_arrays(self, async_lib, ndarrays):
+        """
+        Append NDArrays captured in Capture or Stream mode to the file of the
+        capture, opening it for the first NDArray.
+        """
+        if self._hdf5_frame_writer is None:
+            full_file_name = await self.next_full_file_name()
+            self.log.info("opening %s", full_file_name)
+            first_frame = ndarrays[0].data
+            self._hdf5_frame_writer = await run_in_thread(
+                async_lib,
+                self.open_hdf5_file,
+                full_file_name,
+                first_frame.shape,
+                first_frame.dtype,
+            )
+            await self.full_file_name_rbv.write(full_file_name)
+        await run_in_thread(
+            async_lib,
+            self._hdf5_frame_writer.append,
+            [ndarray.data for ndarray in ndarrays],
+        )
+
+    async def end_capture(self, async_lib):
+        try:
+            await super().end_capture(async_lib)
+        finally:
+            if self._hdf5_frame_writer is not None:
+                hdf5_frame_writer, self._hdf5_frame_writer = self._hdf5_frame_writer, None
+                self.log.info(
+                    "closing %s with %d frames",
+                    hdf5_frame_writer.file_path,
+                    hdf5_frame_writer.frame_count,
+                )
+                await run_in_thread(async_lib, hdf5_frame_writer.close)
+
+    """
+    Compression (None, zlib)
+        areaDetector has more compression filters, zlib is the only one
+        every HDF5 library has
+    ZLevel
+        zlib compression level 0 to 9
+    NumFramesChunks
+        frames per chunk of the dataset
+    """
+
+    class Compression:
+        NONE = "None"
+        ZLIB = "zlib"
+
+    compression, compression_rbv = pvproperty_with_rbv(
+        name=":Compression",
+        dtype=ChannelType.ENUM,
+        enum_strings=tuple(COMPRESSION_FILTERS),
+        value=Compression.NONE,
+    )
+
+    z_level, z_level_rbv = pvproperty_with_rbv(
+        name=":ZLevel", dtype=ChannelType.INT, value=6, lower=0, upper=9
+    )
+
+    num_frames_chunks, num_frames_chunks_rbv = pvproperty_with_rbv(
+        name=":NumFramesChunks", dtype=ChannelType.INT, value=1, lower=1
+    )
+
+
+class ProcessPluginPVGroup(PluginBasePVGroup):
+    """
+    Simulate the areaDetector NDPluginProcess background subtraction and
+    offset and scale: (frame - background) * Scale + Offset.
+
+    Each processed frame is written to a new NDArray from the camera's pool
+    and passed on to the plugins whose NDArrayPort is PROC1, the input frame
+    is not changed. Frames are passed on unchanged, without a copy, when
+    neither EnableBackground nor EnableOffsetScale is enabled. Like the
+    areaDetector Proc plugin it starts with EnableCallbacks=Disable.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(
+            *args, plugin_type_rbv="NDPluginProcess", port_name_rbv="PROC1", **kwargs
+        )
+        self._background_offset_scale = BackgroundOffsetScale()
+
+    async def process_array(self, ndarray):
+        frame = ndarray.data
+        if self.settings.save_background:
+            self._background_offset_scale.set_background(frame)
+            await self.save_background.write(0)
+            await self.valid_background_rbv.write(ProcessPluginPVGroup.ValidBackground.VALID)
+
+        # a background saved before the readout region changed is not used
+        subtract_background = (
+            self.settings.enable_background == ProcessPluginPVGroup.Enable.ENABLE
+            and self._background_offset_scale.background_shape == frame.shape
+        )
+        offset_scale = (
+            self.settings.enable_offset_scale == ProcessPluginPVGroup.Enable.ENABLE
+        )
+        if not (subtract_background or offset_scale):
+            return ndarray
+
+        output_ndarray = self.parent.ndarray_pool(frame.dtype).alloc(frame.shape, frame.dtype)
+        if output_ndarray is None:
+            self._dropped_arrays += 1
+            await self.dropped_arrays_rbv.write(self._dropped_arrays)
+            return None
+        self._background_offset_scale.apply(
+            frame,
+            out=output_ndarray.data,
+            subtract_background=subtract_background,
+            scale=self.settings.scale if offset_scale else None,
+            offset=self.settings.offset if offset_scale else None,
+        )
+        output_ndarray.unique_id = ndarray.unique_id
+        output_ndarray.timestamp = ndarray.timestamp
+        return output_ndarray
+
+    # starts with EnableCallbacks=Disable
+    enable_callbacks, enable_callbacks_rbv = pvproperty_with_rbv(
+        name=":EnableCallbacks",
+        dtype=ChannelType.ENUM,
+        enum_strings=(
+            PluginBasePVGroup.EnableCallbacks.DISABLE,
+            PluginBasePVGroup.EnableCallbacks.ENABLE,
+        ),
+        value=PluginBasePVGroup.EnableCallbacks.DISABLE,
+    )
+
+    """
+    SaveBackground
+        write 1 to save the next frame as the background
+    ValidBackground_RBV (0 - Invalid, 1 - Valid)
+    EnableBackground, EnableOffsetScale (0 - Disable, 1 - Enable)
+    Offset, Scale
+    """
+
+    class Enable:
+        DISABLE = "Disable"
+        ENABLE = "Enable"
+
+    class ValidBackground:
+        INVALID = "Invalid"
+        VALID = "Valid"
+
+    save_background, save_background_rbv = pvproperty_with_rbv(
+        name=":SaveBackground", dtype=ChannelType.INT, value=0
+    )
+
+    valid_background_rbv = pvproperty(
+        name=":ValidBackground_RBV",
         dtype=ChannelType.ENUM,
-        enum_strings=("Single", "Capture", "Stream"),
-        value="Single",
+        enum_strings=(ValidBackground.INVALID, ValidBackground.VALID),
+        value=ValidBackground.INVALID,
         read_only=True,
     )
-    async def file_write_mode_rbv(self, instance):
-        return self._file_write_mode
 
+    enable_background, enable_background_rbv = pvproperty_with_rbv(
+        name=":EnableBackground",
+        dtype=ChannelType.ENUM,
+        enum_strings=(Enable.DISABLE, Enable.ENABLE),
+        value=Enable.DISABLE,
+    )
+
+    enable_offset_scale, enable_offset_scale_rbv = pvproperty_with_rbv(
+        name=":EnableOffsetScale",
+        dtype=ChannelType.ENUM,
+        enum_strings=(Enable.DISABLE, Enable.ENABLE),
+        value=Enable.DISABLE,
+    )
+
+    offset, offset_rbv = pvproperty_with_rbv(name=":Offset", dtype=ChannelType.DOUBLE, value=0.0)
+
+    scale, scale_rbv = pvproperty_with_rbv(name=":Scale", dtype=ChannelType.DOUBLE, value=1.0)
+
+
+class StatsPluginPVGroup(PluginBasePVGroup):
     """
-    PortName_RBV
+    Simulate the areaDetector NDPluginStats statistics, centroid and histogram.
+
+    Each frame's results are written to the _RBV PVs, which post monitors,
+    so a client can read scalars for each frame without receiving the
+    frame. Frames are passed on unchanged to the plugins whose NDArrayPort
+    is STATS1. Like the areaDetector Stats plugin it starts with
+    EnableCallbacks=Disable.
     """
 
-    @pvproperty(
-        name=":PortName_RBV",
-        dtype=ChannelType.CHAR,
-        max_length=1024,
-        value=None,
+    # enough bins to count each value of a UInt16 frame separately
+    MAX_HIST_SIZE = 65536
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(
+            *args, plugin_type_rbv="NDPluginStats", port_name_rbv="STATS1", **kwargs
+        )
+        self._frame_statistics = FrameStatistics()
+
+    async def process_array(self, ndarray):
+        frame = ndarray.data
+        settings = self.settings
+        compute_statistics = settings.compute_statistics == StatsPluginPVGroup.Compute.YES
+        compute_centroid = settings.compute_centroid == StatsPluginPVGroup.Compute.YES
+        if compute_statistics or compute_centroid:
+            statistics = self._frame_statistics.compute(frame, centroid=compute_centroid)
+            if compute_statistics:
+                await self.min_value_rbv.write(statistics["min_value"])
+                await self.max_value_rbv.write(statistics["max_value"])
+                await self.min_x_rbv.write(statistics["min_x"])
+                await self.min_y_rbv.write(statistics["min_y"])
+                await self.max_x_rbv.write(statistics["max_x"])
+                await self.max_y_rbv.write(statistics["max_y"])
+                await self.mean_value_rbv.write(statistics["mean_value"])
+                await self.sigma_rbv.write(statistics["sigma"])
+                await self.total_rbv.write(statistics["total"])
+                # there is no background region, so Net is Total
+                await self.net_rbv.write(statistics["total"])
+            if compute_centroid:
+                await self.centroid_x_rbv.write(statistics["centroid_x"])
+                await self.centroid_y_rbv.write(statistics["centroid_y"])
+                await self.sigma_x_rbv.write(statistics["sigma_x"])
+                await self.sigma_y_rbv.write(statistics["sigma_y"])
+                await self.sigma_xy_rbv.write(statistics["sigma_xy"])
+
+        # HistMin and HistMax are written one at a time, so a range that
+        # is briefly empty skips the histogram instead of failing
+        if (
+            settings.compute_histogram == StatsPluginPVGroup.Compute.YES
+            and settings.hist_max > settings.hist_min
+        ):
+            counts, below, above, entropy = self._frame_statistics.histogram(
+                frame, settings.hist_size, settings.hist_min, settings.hist_max
+            )
+            await self.histogram_rbv.write(counts)
+            await self.hist_below_rbv.write(below)
+            await self.hist_above_rbv.write(above)
+            await self.hist_entropy_rbv.write(entropy)
+        return ndarray
+
+    # starts with EnableCallbacks=Disable
+    enable_callbacks, enable_callbacks_rbv = pvproperty_with_rbv(
+        name=":EnableCallbacks",
+        dtype=ChannelType.ENUM,
+        enum_strings=(
+            PluginBasePVGroup.EnableCallbacks.DISABLE,
+            PluginBasePVGroup.EnableCallbacks.ENABLE,
+        ),
+        value=PluginBasePVGroup.EnableCallbacks.DISABLE,
+    )
+
+    """
+    ComputeStatistics, ComputeCentroid, ComputeHistogram (0 - No, 1 - Yes)
+    MinValue_RBV, MaxValue_RBV, MeanValue_RBV, Sigma_RBV, Total_RBV, Net_RBV
+    MinX_RBV, MinY_RBV, MaxX_RBV, MaxY_RBV
+    CentroidX_RBV, CentroidY_RBV, SigmaX_RBV, SigmaY_RBV, SigmaXY_RBV
+    HistSize, HistMin, HistMax
+    Histogram_RBV, HistBelow_RBV, HistAbove_RBV, HistEntropy_RBV
+    """
+
+    class Compute:
+        NO = "No"
+        YES = "Yes"
+
+    compute_statistics, compute_statistics_rbv = pvproperty_with_rbv(
+        name=":ComputeStatistics",
+        dtype=ChannelType.ENUM,
+        enum_strings=(Compute.NO, Compute.YES),
+        value=Compute.YES,
+    )
+
+    compute_centroid, compute_centroid_rbv = pvproperty_with_rbv(
+        name=":ComputeCentroid",
+        dtype=ChannelType.ENUM,
+        enum_strings=(Compute.NO, Compute.YES),
+        value=Compute.YES,
+    )
+
+    compute_histogram, compute_histogram_rbv = pvproperty_with_rbv(
+        name=":ComputeHistogram",
+        dtype=ChannelType.ENUM,
+        enum_strings=(Compute.NO, Compute.YES),
+        value=Compute.NO,
+    )
+
+    min_value_rbv = pvproperty(
+        name=":MinValue_RBV", dtype=ChannelType.DOUBLE, value=0.0, read_only=True
+    )
+    max_value_rbv = pvproperty(
+        name=":MaxValue_RBV", dtype=ChannelType.DOUBLE, value=0.0, read_only=True
+    )
+    mean_value_rbv = pvproperty(
+        name=":MeanValue_RBV", dtype=ChannelType.DOUBLE, value=0.0, read_only=True
+    )
+    sigma_rbv = pvproperty(
+        name=":Sigma_RBV", dtype=ChannelType.DOUBLE, value=0.0, read_only=True
+    )
+    total_rbv = pvproperty(
+        name=":Total_RBV", dtype=ChannelType.DOUBLE, value=0.0, read_only=True
+    )
+    net_rbv = pvproperty(
+        name=":Net_RBV", dtype=ChannelType.DOUBLE, value=0.0, read_only=True
+    )
+    min_x_rbv = pvproperty(
+        name=":MinX_RBV", dtype=ChannelType.DOUBLE, value=0.0, read_only=True
+    )
+    min_y_rbv = pvproperty(
+        name=":MinY_RBV", dtype=ChannelType.DOUBLE, value=0.0, read_only=True
+    )
+    max_x_rbv = pvproperty(
+        name=":MaxX_RBV", dtype=ChannelType.DOUBLE, value=0.0, read_only=True
+    )
+    max_y_rbv = pvproperty(
+        name=":MaxY_RBV", dtype=ChannelType.DOUBLE, value=0.0, read_only=True
+    )
+
+    centroid_x_rbv = pvproperty(
+        name=":CentroidX_RBV", dtype=ChannelType.DOUBLE, value=0.0, read_only=True
+    )
+    centroid_y_rbv = pvproperty(
+        name=":CentroidY_RBV", dtype=ChannelType.DOUBLE, value=0.0, read_only=True
+    )
+    sigma_x_rbv = pvproperty(
+        name=":SigmaX_RBV", dtype=ChannelType.DOUBLE, value=0.0, read_only=True
+    )
+    sigma_y_rbv = pvproperty(
+        name=":SigmaY_RBV", dtype=ChannelType.DOUBLE, value=0.0, read_only=True
+    )
+    sigma_xy_rbv = pvproperty(
+        name=":SigmaXY_RBV", dtype=ChannelType.DOUBLE, value=0.0, read_only=True
+    )
+
+    hist_size, hist_size_rbv = pvproperty_with_rbv(
+        name=":HistSize", dtype=ChannelType.LONG, value=256, lower=1, upper=MAX_HIST_SIZE
+    )
+
+    hist_min, hist_min_rbv = pvproperty_with_rbv(
+        name=":HistMin", dtype=ChannelType.DOUBLE, value=0.0
+    )
+
+    hist_max, hist_max_rbv = pvproperty_with_rbv(
+        name=":HistMax", dtype=ChannelType.DOUBLE, value=65535.0
+    )
+
+    histogram_rbv = pvproperty(
+        name=":Histogram_RBV",
+        dtype=ChannelType.DOUBLE,
+        max_length=MAX_HIST_SIZE,
+        value=[0.0],
         read_only=True,
     )
-    async def port_name_rbv(self, instance):
-        return self._port_name_rbv
+    hist_below_rbv = pvproperty(
+        name=":HistBelow_RBV", dtype=ChannelType.DOUBLE, value=0.0, read_only=True
+    )
+    hist_above_rbv = pvproperty(
+        name=":HistAbove_RBV", dtype=ChannelType.DOUBLE, value=0.0, read_only=True
+    )
+    hist_entropy_rbv = pvproperty(
+        name=":HistEntropy_RBV", dtype=ChannelType.DOUBLE, value=0.0, read_only=True
+    )
 
+
+class CodecPluginPVGroup(PluginBasePVGroup):
     """
-    NDArrayPort
-        Configure correctly or get this:
-        RuntimeError: The asyn ports ['uninitialized NDArrayPort'] are used by plugins
-        that ophyd is aware of but the source plugin is not.  Please reconfigure your 
-        device to include the source plugin or reconfigure to not use these ports.
+    Simulate the areaDetector NDPluginCodec compressing frames for live viewing.
+
+    Each frame is compressed in a worker thread with the codec named by
+    Compressor and published on ArrayData as bytes, with Codec_RBV,
+    CompressedSize_RBV, CompFactor_RBV, DataType_RBV and the ArraySize RBVs
+    a client needs to decode it, see ophyd_addon.areadetector.codec.
+    Compressed frames are not passed on to plugins. Like the areaDetector
+    Codec plugin it starts with EnableCallbacks=Disable.
     """
 
-    @pvproperty(name=":NDArrayPort", dtype=ChannelType.STRING, value=None)
-    async def nd_array_port(self, instance):
-        return self._nd_array_port
+    # room for a Float64 frame of the largest size with compression headers
+    MAX_ARRAY_BYTES = 2048 * 2048 * 8 + 4096
 
-    @nd_array_port.putter
-    async def nd_array_port(self, instance, value):
-        self._nd_array_port = value
+    def __init__(self, *args, **kwargs):
+        super().__init__(
+            *args, plugin_type_rbv="NDPluginCodec", port_name_rbv="CODEC1", **kwargs
+        )
+
+    async def process_array(self, ndarray):
+        frame = ndarray.data
+        codec = self.settings.compressor
+        # the camera keeps the NDArray until this returns
+        compressed = await run_in_thread(self.compressor.async_lib, compress, codec, frame)
+
+        # a client monitoring ArrayData finds the RBVs for decoding it already written
+        data_type = next(
+            name for name, dtype in ND_DATA_TYPES.items() if dtype == frame.dtype
+        )
+        if self.data_type_rbv.value != data_type:
+            await self.data_type_rbv.write(data_type)
+        await self.codec_rbv.write(codec)
+        await self.compressed_size_rbv.write(len(compressed))
+        await self.comp_factor_rbv.write(frame.nbytes / max(len(compressed), 1))
+        await self.array_data.write(compressed)
+        return None
+
+    # starts with EnableCallbacks=Disable
+    enable_callbacks, enable_callbacks_rbv = pvproperty_with_rbv(
+        name=":EnableCallbacks",
+        dtype=ChannelType.ENUM,
+        enum_strings=(
+            PluginBasePVGroup.EnableCallbacks.DISABLE,
+            PluginBasePVGroup.EnableCallbacks.ENABLE,
+        ),
+        value=PluginBasePVGroup.EnableCallbacks.DISABLE,
+    )
+
+    """
+    Compressor (None, Blosc, LZ4, zlib)
+        writing a codec whose module is not installed is rejected
+    ArrayData
+        the compressed bytes of the most recent frame
+    Codec_RBV, CompressedSize_RBV, CompFactor_RBV, DataType_RBV
+    """
+
+    DEFAULT_COMPRESSOR = available_codecs()[0]
+
+    compressor = pvproperty(
+        name=":Compressor",
+        dtype=ChannelType.ENUM,
+        enum_strings=(NO_CODEC, *CODEC_MODULES),
+        value=DEFAULT_COMPRESSOR,
+    )
+
+    @compressor.putter
+    @stores_setting
+    async def compressor(self, instance, value):
+        if value != NO_CODEC and value not in available_codecs():
+            raise ValueError(
+                f"Compressor {value} is not installed, use one of "
+                f"{(NO_CODEC, *available_codecs())}"
+            )
+        self.settings.compressor = value
+        await self.compressor_rbv.write(value)
         return value
 
-    @pvproperty(
-        name=":NDArrayPort_RBV",
-        dtype=ChannelType.STRING,
-        # max_length=1024,
-        value=None,
+    @compressor.startup
+    async def compressor(self, instance, async_lib):
+        instance.async_lib = async_lib
+
+    compressor_rbv = pvproperty(
+        name=":Compressor_RBV",
+        dtype=ChannelType.ENUM,
+        enum_strings=(NO_CODEC, *CODEC_MODULES),
+        value=DEFAULT_COMPRESSOR,
         read_only=True,
     )
-    async def nd_array_port_rbv(self, instance):
-        return self._nd_array_port
 
-    # array_counter = ADCpt(SignalWithRBV, 'ArrayCounter')
-    @pvproperty(
-        name=":ArrayCounter",
-        dtype=ChannelType.INT,
-        value=0,
+    array_data = pvproperty(
+        name=":ArrayData",
+        dtype=ChannelType.CHAR,
+        max_length=MAX_ARRAY_BYTES,
+        value="",
+        read_only=True,
+    )
+    codec_rbv = pvproperty(
+        name=":Codec_RBV",
+        dtype=ChannelType.CHAR,
+        max_length=256,
+        value="",
+        read_only=True,
+    )
+    compressed_size_rbv = pvproperty(
+        name=":CompressedSize_RBV", dtype=ChannelType.LONG, value=0, read_only=True
+    )
+    comp_factor_rbv = pvproperty(
+        name=":CompFactor_RBV", dtype=ChannelType.DOUBLE, value=0.0, read_only=True
+    )
+    data_type_rbv = pvproperty(
+        name=":DataType_RBV",
+        dtype=ChannelType.ENUM,
+        enum_strings=tuple(ND_DATA_TYPES),
+        value="UInt16",
+        read_only=True,
     )
-    async def array_counter(self, instance):
-        return self._array_counter
 
-    @array_counter.putter
-    async def array_counter(self, instance, value):
-        self._array_counter = value
-        return value
 
-    @pvproperty(
-        name=":ArrayCounter_RBV",
-        dtype=ChannelType.INT,
-        value=0,
-        read_only=True,
+class IOCStatsPVGroup(PVGroup):
+    """
+    Publish how long the IOC's getters and putters take and how late its
+    event loop runs.
+
+    The IOC times every pvproperty getter and putter with an
+    ophyd_addon.ioc_util.PVLatencyMeter, this group publishes summaries of
+    those latencies since Reset, and the CPU use and event loop lag since
+    the last update, every UpdateInterval seconds. Latencies are in ms.
+    When the IOC shuts down the latency histograms of every PV are written
+    as JSON to StatsFile, if it is set.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._update_interval = 1.0
+        self._stats_file = ""
+        self._start_time = time.monotonic()
+        self._cpu_meter = CpuMeter()
+        self._loop_lag_latency = LatencyHistogram()
+        self._loop_lag_meter = LoopLagMeter(latency_histogram=self._loop_lag_latency)
+
+    @property
+    def pv_latency_meter(self):
+        return self.parent.pv_latency_meter
+
+    def stats(self):
+        """
+        Return a dict of the latency histograms of the event loop and every
+        PV read or written since Reset, with bucket counts for the
+        LatencyHistogram bucket_upper_bounds.
+        """
+
+        def histogram_stats(latency_histogram):
+            return {**latency_histogram.summary(), "counts": latency_histogram.counts}
+
+        return {
+            "pid": os.getpid(),
+            "prefix": self.parent.prefix,
+            "uptime": time.monotonic() - self._start_time,
+            "bucket_upper_bounds": LatencyHistogram.bucket_upper_bounds(),
+            "loop_lag": histogram_stats(self._loop_lag_latency),
+            **{
+                request: {
+                    pvname: histogram_stats(latency_histogram)
+                    for pvname, latency_histogram in latencies.items()
+                    if latency_histogram.count > 0
+                }
+                for request, latencies in (
+                    ("get", self.pv_latency_meter.get_latency),
+                    ("put", self.pv_latency_meter.put_latency),
+                )
+            },
+        }
+
+    def write_stats_file(self, file_path):
+        with open(file_path, "w") as stats_file:
+            json.dump(self.stats(), stats_file, indent=1)
+
+    async def update(self):
+        """
+        Write the RBVs from the latencies since Reset and the CPU use and
+        loop lag since the last update.
+        """
+        get_latency = self.pv_latency_meter.total(self.pv_latency_meter.get_latency)
+        put_latency = self.pv_latency_meter.total(self.pv_latency_meter.put_latency)
+        slowest_put = max(
+            self.pv_latency_meter.put_latency.items(),
+            key=lambda item: item[1].max_latency,
+            default=("", None),
+        )[0]
+        await self.cpu_load.write(self._cpu_meter.sample())
+        await self.loop_lag_mean_rbv.write(self._loop_lag_meter.mean_lag * 1000)
+        await self.loop_lag_max_rbv.write(self._loop_lag_meter.max_lag * 1000)
+        self._loop_lag_meter.reset()
+        await self.get_count_rbv.write(get_latency.count)
+        await self.get_latency_p99_rbv.write(get_latency.quantile(0.99) * 1000)
+        await self.put_count_rbv.write(put_latency.count)
+        await self.put_latency_p50_rbv.write(put_latency.quantile(0.5) * 1000)
+        await self.put_latency_p99_rbv.write(put_latency.quantile(0.99) * 1000)
+        await self.put_latency_max_rbv.write(put_latency.max_latency * 1000)
+        await self.slowest_put_rbv.write(slowest_put)
+        await self.summary_rbv.write(json.dumps(self.pv_latency_meter.summary()))
+
+    """
+    UpdateInterval
+        seconds between updates of the RBVs
+    Reset
+        write 1 to reset the latency histograms
+    StatsFile
+        the latency histograms are written here as JSON when the IOC shuts down
+    CPU_LOAD
+        percent of one core used by the IOC process
+    LoopLagMean_RBV, LoopLagMax_RBV
+    GetCount_RBV, GetLatencyP99_RBV
+    PutCount_RBV, PutLatencyP50_RBV, PutLatencyP99_RBV, PutLatencyMax_RBV
+    SlowestPut_RBV
+        the PV whose putter took longest
+    Summary_RBV
+        JSON of the latency summary of each PV, see PVLatencyMeter.summary
+    """
+
+    @pvproperty(name=":UpdateInterval", dtype=ChannelType.DOUBLE, value=1.0)
+    async def update_interval(self, instance):
+        return self._update_interval
+
+    @update_interval.putter
+    async def update_interval(self, instance, value):
+        if value <= 0:
+            raise ValueError(f"UpdateInterval must be positive, not {value}")
+        self._update_interval = value
+        return value
+
+    @update_interval.startup
+    async def update_interval(self, instance, async_lib):
+        # in real time, whatever clock the camera runs on
+        while True:
+            await async_lib.library.sleep(self._update_interval)
+            await self.update()
+
+    @pvproperty(name=":Reset", dtype=ChannelType.INT, value=0)
+    async def reset(self, instance):
+        return 0
+
+    @reset.putter
+    async def reset(self, instance, value):
+        if value:
+            self.pv_latency_meter.reset()
+            self._loop_lag_latency.reset()
+        return 0
+
+    @pvproperty(name=":StatsFile", dtype=ChannelType.CHAR, max_length=1024, value="")
+    async def stats_file(self, instance):
+        return self._stats_file
+
+    @stats_file.putter
+    async def stats_file(self, instance, value):
+        self._stats_file = value
+        return value
+
+    @stats_file.shutdown
+    async def stats_file(self, instance, async_lib):
+        if self._stats_file:
+            self.log.info("writing IOC stats to %s", self._stats_file)
+            self.write_stats_file(self._stats_file)
+
+    cpu_load = pvproperty(
+        name=":CPU_LOAD", dtype=ChannelType.DOUBLE, value=0.0, read_only=True
+    )
+
+    loop_lag_mean_rbv = pvproperty(
+        name=":LoopLagMean_RBV", dtype=ChannelType.DOUBLE, value=0.0, read_only=True
     )
-    async def array_counter_rbv(self, instance):
-        return self._array_counter
 
+    @loop_lag_mean_rbv.startup
+    async def loop_lag_mean_rbv(self, instance, async_lib):
+        await self._loop_lag_meter.run(async_lib)
 
-class FileTiffPluginPVGroup(FilePluginPVGroup):
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, plugin_type_rbv="NDFileTIFF", **kwargs)
+    loop_lag_max_rbv = pvproperty(
+        name=":LoopLagMax_RBV", dtype=ChannelType.DOUBLE, value=0.0, read_only=True
+    )
+    get_count_rbv = pvproperty(
+        name=":GetCount_RBV", dtype=ChannelType.LONG, value=0, read_only=True
+    )
+    get_latency_p99_rbv = pvproperty(
+        name=":GetLatencyP99_RBV", dtype=ChannelType.DOUBLE, value=0.0, read_only=True
+    )
+    put_count_rbv = pvproperty(
+        name=":PutCount_RBV", dtype=ChannelType.LONG, value=0, read_only=True
+    )
+    put_latency_p50_rbv = pvproperty(
+        name=":PutLatencyP50_RBV", dtype=ChannelType.DOUBLE, value=0.0, read_only=True
+    )
+    put_latency_p99_rbv = pvproperty(
+        name=":PutLatencyP99_RBV", dtype=ChannelType.DOUBLE, value=0.0, read_only=True
+    )
+    put_latency_max_rbv = pvproperty(
+        name=":PutLatencyMax_RBV", dtype=ChannelType.DOUBLE, value=0.0, read_only=True
+    )
+    slowest_put_rbv = pvproperty(
+        name=":SlowestPut_RBV", dtype=ChannelType.CHAR, max_length=1024, value="", read_only=True
+    )
+    summary_rbv = pvproperty(
+        name=":Summary_RBV", dtype=ChannelType.CHAR, max_length=1000000, value="", read_only=True
+    )
 
 
 class ArrayBasePVGroup(PVGroup):
+    # plugins with this NDArrayPort receive the camera's arrays
+    PORT_NAME = "CAM1"
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self._array_callbacks = ArrayBasePVGroup.ArrayCallbacks.DISABLE
+        # ArrayCallbacks, AcquireTime and the other setpoints as written
+        self.settings = rbv_settings(self)
+        # set by writing Acquire=0 during an acquisition
+        self._stop_acquisition = False
 
     """
     ArrayCallbacks - this is really in NDPluginDriverBlockingCallbacks
@@ -514,24 +1494,12 @@ class ArrayBasePVGroup(PVGroup):
         DISABLE = int(0)
         ENABLE = int(1)
 
-    array_callbacks = pvproperty(
+    array_callbacks, array_callbacks_rbv = pvproperty_with_rbv(
         name=":{camera}:ArrayCallbacks",
         dtype=ChannelType.INT,
         value=ArrayCallbacks.DISABLE,
     )
 
-    @array_callbacks.putter
-    async def array_callbacks(self, instance, value):
-        await self.array_callbacks_rbv.write(value)
-        return value
-
-    array_callbacks_rbv = pvproperty(
-        name=":{camera}:ArrayCallbacks_RBV",
-        dtype=ChannelType.INT,
-        value=ArrayCallbacks.DISABLE,
-        read_only=True,
-    )
-
     """
     Acquire 
         0 - Done
@@ -553,26 +1521,26 @@ class ArrayBasePVGroup(PVGroup):
     async def acquire(self, instance, value):
         print(f"acquire putter called with instance {instance} and value {value}")
         if not instance.async_event.is_set():
-
+            if value == ArrayBasePVGroup.Acquire.DONE:
+                # stop the acquisition in progress after the current frame
+                self._stop_acquisition = True
             await instance.async_event.wait()
             return ArrayBasePVGroup.Acquire.DONE
 
         if value == ArrayBasePVGroup.Acquire.ACQUIRE:
             instance.async_event.clear()
+            self._stop_acquisition = False
             try:
 
                 await instance.write(ArrayBasePVGroup.Acquire.ACQUIRE)
                 await self.acquire_rbv.write(ArrayBasePVGroup.Acquire.ACQUIRE)
 
-                # await instance.async_lib.library.sleep(self.exposure_time.value)
-                await instance.async_lib.library.sleep(2)
-
-                # await self.reading.write(np.random.rand())
+                await self.acquire_images(instance.async_lib)
 
             finally:
                 instance.async_event.set()
+                await self.acquire_rbv.write(ArrayBasePVGroup.Acquire.DONE)
 
-        await self.acquire_rbv.write(ArrayBasePVGroup.Acquire.DONE)
         return ArrayBasePVGroup.Acquire.DONE
 
     @acquire.startup
@@ -590,6 +1558,45 @@ class ArrayBasePVGroup(PVGroup):
     # async def acquire_rbv(self, instance):
     #     return self._acquire
 
+    @property
+    def plugins(self):
+        return [
+            group for group in self.groups.values() if isinstance(group, PluginBasePVGroup)
+        ]
+
+    def plugin(self, port_name):
+        """
+        Return the plugin with port_name or None.
+        """
+        for plugin in self.plugins:
+            if plugin.port_name == port_name:
+                return plugin
+        return None
+
+    async def dispatch_array(self, ndarray, port_name=None):
+        """
+        Pass an NDArray from port_name, by default the camera, to every
+        plugin whose NDArrayPort is port_name. The camera passes arrays on
+        only when its ArrayCallbacks is enabled.
+
+        Every plugin receives the same NDArray, which is made read-only
+        so that no plugin changes the frame the others see.
+        """
+        if port_name is None:
+            if self.settings.array_callbacks != ArrayBasePVGroup.ArrayCallbacks.ENABLE:
+                return
+            port_name = self.PORT_NAME
+        ndarray.data.flags.writeable = False
+        for plugin in self.plugins:
+            if plugin.nd_array_port_name == port_name:
+                await plugin.receive_array(ndarray)
+
+    async def acquire_images(self, async_lib):
+        """
+        Called by the Acquire putter, override this to produce images.
+        """
+        await async_lib.library.sleep(2)
+
 
 class SimulatedPerkinElmerDetectorIoc(ArrayBasePVGroup):
     """
@@ -604,53 +1611,158 @@ class SimulatedPerkinElmerDetectorIoc(ArrayBasePVGroup):
         FREE_RUNNING = 2
         SOFT_TRIGGER = 3
 
-    def __init__(self, *args, **kwargs):
+    PORT_NAME = "PE1"
+
+    # PerkinElmer XRD 1621
+    MAX_SIZE_X = 2048
+    MAX_SIZE_Y = 2048
+
+    def __init__(
+        self,
+        *args,
+        image_generator=None,
+        readout_time=0.0667,
+        clock=None,
+        pool_max_buffers=10,
+        stats_file=None,
+        **kwargs,
+    ):
         super().__init__(*args, **kwargs)
 
-        self._acquire_period = 1.0
-        self._acquire_time = 1.0
-        self._array_counter = None
-
-        self._num_images = 0
-
-        self._port_name_rbv = None
-
-        self._image_mode = 0  # Single
-
-        self._trigger_mode = SimulatedPerkinElmerDetectorIoc.TriggerMode.INTERNAL
-
-        self._pe_num_offset_frames = 0
+        # every getter and putter is timed for IOCStats
+        self.pv_latency_meter = PVLatencyMeter(self.pvdb)
+        if stats_file is not None:
+            self.ioc_stats._stats_file = str(stats_file)
+
+        # acquisitions sleep on this clock, see ophyd_addon.virtual_clock
+        if clock is None:
+            clock = RealClock()
+        self._clock = clock
+
+        if image_generator is None:
+            image_generator = DiffractionImageGenerator(
+                shape=(self.MAX_SIZE_Y, self.MAX_SIZE_X)
+            )
+        # ArrayData holds at most a frame of the sensor size
+        size_y, size_x = image_generator.shape
+        if size_y > self.MAX_SIZE_Y or size_x > self.MAX_SIZE_X:
+            raise ValueError(
+                f"frames of shape {image_generator.shape} are larger than the "
+                f"{(self.MAX_SIZE_Y, self.MAX_SIZE_X)} sensor"
+            )
+        self._image_generator = image_generator
+        # every frame is read out into a buffer from this pool
+        self._ndarray_pool = NDArrayPool(
+            max_buffers=pool_max_buffers, buffer_bytes=image_generator.frame.nbytes
+        )
+        # frames are cast to DataType when they are read out, into buffers
+        # from a pool for each DataType preallocated when it is selected
+        self._cast_pools = {}
+        # the NDArray served by ArrayData
+        self._array_data_ndarray = None
+        # the readout region clamps MinX through ReverseY to the sensor
+        self._readout_region = ReadoutRegion(image_generator.shape)
+        self._timing_model = AcquisitionTimingModel(readout_time=readout_time)
+        # for ImageMode.AVERAGE
+        self._frame_averager = FrameAverager()
+        # PEAcquireOffset averages dark frames into the offset image
+        self._offset_averager = FrameAverager()
+        self._offset_correction = OffsetCorrection()
+        # PELoadGainFile and PELoadPixelCorrection load these from local files
+        self._gain_correction = GainCorrection()
+        self._bad_pixel_correction = BadPixelCorrection()
+
+        self._frame_rate_meter = FrameRateMeter(self._clock)
+        # frames a free-running acquisition could not publish in time and
+        # frames lost because the NDArray pool was exhausted
+        self._dropped_frames = 0
 
         self._pe_acquire_offset = 0  # Done
 
     tiff_plugin = SubGroup(FileTiffPluginPVGroup, prefix=":TIFF1")
+    hdf5_plugin = SubGroup(FileHDF5PluginPVGroup, prefix=":HDF1")
+    process_plugin = SubGroup(ProcessPluginPVGroup, prefix=":Proc1")
+    stats_plugin = SubGroup(StatsPluginPVGroup, prefix=":Stats1")
+    codec_plugin = SubGroup(CodecPluginPVGroup, prefix=":Codec1")
+    ioc_stats = SubGroup(IOCStatsPVGroup, prefix=":IOCStats")
 
     # Shared among all cams and plugins
     """
-    array_rate = ADCpt(EpicsSignalRO, 'ArrayRate_RBV')
     asyn_io = ADCpt(EpicsSignal, 'AsynIO')
 
     nd_attributes_file = ADCpt(EpicsSignal, 'NDAttributesFile', string=True)
-    pool_alloc_buffers = ADCpt(EpicsSignalRO, 'PoolAllocBuffers')
-    pool_free_buffers = ADCpt(EpicsSignalRO, 'PoolFreeBuffers')
-    pool_max_buffers = ADCpt(EpicsSignalRO, 'PoolMaxBuffers')
-    pool_max_mem = ADCpt(EpicsSignalRO, 'PoolMaxMem')
-    pool_used_buffers = ADCpt(EpicsSignalRO, 'PoolUsedBuffers')
-    pool_used_mem = ADCpt(EpicsSignalRO, 'PoolUsedMem')
     """
 
+    """
+    NDArray pool
+        PoolMaxBuffers, PoolAllocBuffers, PoolFreeBuffers, PoolUsedBuffers
+            buffers in the pool, all of them are allocated when the IOC starts
+        PoolMaxMem, PoolUsedMem
+            megabytes in the pool and in buffers holding frames
+        Frames are read out into a pool of uint16 sensor frames, each DataType
+        other than UInt16 adds a pool of as many buffers of its type.
+        The PVs are written when the IOC starts, when a pool is added, after
+        each frame is published or dropped and at the end of an acquisition.
+    """
+
+    def ndarray_pools(self):
+        return [self._ndarray_pool, *self._cast_pools.values()]
+
+    def ndarray_pool(self, dtype):
+        """
+        Return the pool of NDArrays of dtype, the sensor frame pool or the
+        pool of a DataType.
+        """
+        if dtype == self._image_generator.frame.dtype:
+            return self._ndarray_pool
+        return self._cast_pools[np.dtype(dtype)]
+
+    async def write_pool_stats(self):
+        """
+        Write the Pool* PVs that changed, so monitors on them fire.
+        """
+        ndarray_pools = self.ndarray_pools()
+        pool_stats = (
+            (self.pool_max_buffers, sum(pool.max_buffers for pool in ndarray_pools)),
+            (self.pool_alloc_buffers, sum(pool.alloc_buffers for pool in ndarray_pools)),
+            (self.pool_free_buffers, sum(pool.free_buffers for pool in ndarray_pools)),
+            (self.pool_used_buffers, sum(pool.used_buffers for pool in ndarray_pools)),
+            (self.pool_max_mem, sum(pool.max_memory for pool in ndarray_pools) / 2**20),
+            (self.pool_used_mem, sum(pool.used_memory for pool in ndarray_pools) / 2**20),
+        )
+        for pool_stat_pv, value in pool_stats:
+            if pool_stat_pv.value != value:
+                await pool_stat_pv.write(value)
+
+    pool_max_buffers = pvproperty(
+        name=":{camera}:PoolMaxBuffers", dtype=ChannelType.INT, value=0, read_only=True
+    )
+    pool_alloc_buffers = pvproperty(
+        name=":{camera}:PoolAllocBuffers", dtype=ChannelType.INT, value=0, read_only=True
+    )
+    pool_free_buffers = pvproperty(
+        name=":{camera}:PoolFreeBuffers", dtype=ChannelType.INT, value=0, read_only=True
+    )
+    pool_used_buffers = pvproperty(
+        name=":{camera}:PoolUsedBuffers", dtype=ChannelType.INT, value=0, read_only=True
+    )
+    pool_max_mem = pvproperty(
+        name=":{camera}:PoolMaxMem", dtype=ChannelType.FLOAT, value=0.0, read_only=True
+    )
+    pool_used_mem = pvproperty(
+        name=":{camera}:PoolUsedMem", dtype=ChannelType.FLOAT, value=0.0, read_only=True
+    )
+
     """
     PortName_RBV
     """
 
-    @pvproperty(
+    port_name_rbv = pvproperty(
         name=":{camera}:PortName_RBV",
         dtype=ChannelType.STRING,
-        value=None,
+        value=PORT_NAME,
         read_only=True,
     )
-    async def port_name_rbv(self, instance):
-        return self._port_name_rbv
 
     """
     # Cam-specific
@@ -663,53 +1775,295 @@ class SimulatedPerkinElmerDetectorIoc(ArrayBasePVGroup):
     AcquirePeriod
     """
 
-    @pvproperty(
-        name=":{camera}:AcquirePeriod",
-        dtype=ChannelType.FLOAT,
-        value=1.0,
+    acquire_period, acquire_period_rbv = pvproperty_with_rbv(
+        name=":{camera}:AcquirePeriod", dtype=ChannelType.FLOAT, value=1.0
     )
-    async def acquire_period(self, instance):
-        return self._acquire_period
 
-    @acquire_period.putter
-    async def acquire_period(self, instance, value):
-        self._acquire_period = value
-        return value
+    """
+    AcquireTime
+    """
 
-    @pvproperty(
-        name=":{camera}:AcquirePeriod_RBV",
-        dtype=ChannelType.FLOAT,
-        value=1.0,
-        read_only=True,
+    acquire_time, acquire_time_rbv = pvproperty_with_rbv(
+        name=":{camera}:AcquireTime", dtype=ChannelType.FLOAT, value=1.0
     )
-    async def acquire_period_rbv(self, instance):
-        return self._acquire_period
+
+    async def expose_frames(self, async_lib, frame_count, dark=False):
+        """
+        Yield (frame number, NDArray) for frame_count frames, or until
+        Acquire=0 is written if frame_count is None. Dark frames are
+        generated with the shutter closed.
+
+        Each frame is yielded AcquireTime plus readout time after it started
+        and frames start every AcquirePeriod, as the timing model specifies.
+        Time spent generating frames counts towards the exposure. All times
+        are measured on the IOC clock, which may be a virtual clock.
+
+        A free-running detector does not wait for the consumer: if frame_count
+        is None, frames read out while the consumer was still busy with the
+        previous frame are dropped and counted in DroppedFrames_RBV. Otherwise
+        the next frame starts late, as if the detector buffered the frames.
+
+        Each frame is read out into an NDArray from the pool, which is released
+        when the consumer asks for the next frame. Like an areaDetector driver
+        the frame is dropped if the pool has no free buffer.
+        """
+        acquire_time = self.settings.acquire_time
+        frame_time = self._timing_model.frame_time(acquire_time)
+        frame_period = self._timing_model.frame_period(
+            acquire_time, self.settings.acquire_period
+        )
+
+        async_sleep = async_lib.library.sleep
+        frame_number = 0
+        frame_start = self._clock.monotonic()
+        while frame_count is None or frame_number < frame_count:
+            await self._clock.sleep_until(async_sleep, frame_start)
+            if self._stop_acquisition:
+                break
+            ndarray = self._ndarray_pool.alloc(
+                self._image_generator.shape, self._image_generator.frame.dtype
+            )
+            if ndarray is not None:
+                self._image_generator.generate(
+                    exposure=acquire_time, dark=dark, out=ndarray.data
+                )
+            await self._clock.sleep_until(async_sleep, frame_start + frame_time)
+            frame_number += 1
+            if ndarray is None:
+                await self.drop_frames()
+            else:
+                ndarray.timestamp = self._clock.monotonic()
+                try:
+                    yield frame_number, ndarray
+                finally:
+                    ndarray.release()
+            frame_start += frame_period
+            if frame_count is None:
+                late_seconds = self._clock.monotonic() - (frame_start + frame_time)
+                if late_seconds > 0:
+                    late_frames = int(late_seconds // frame_period) + 1
+                    await self.drop_frames(late_frames)
+                    frame_start += late_frames * frame_period
+
+    async def acquire_images(self, async_lib):
+        image_mode = self.settings.image_mode
+        trigger_mode = self.settings.trigger_mode
+        if trigger_mode == SimulatedPerkinElmerDetectorIoc.TriggerMode.FREE_RUNNING:
+            # the detector runs until Acquire=0 whatever the ImageMode
+            frame_count = None
+        else:
+            frame_count = self._timing_model.frame_count(
+                image_mode, self.settings.num_images
+            )
+
+        # a new readout region and DataType take effect with the next acquisition
+        readout_region = self._readout_region
+        dtype = ND_DATA_TYPES[self.settings.data_type]
+
+        await self.num_images_counter.write(0)
+        self._frame_averager.reset()
+        await self.reset_frame_rate()
+        self._dropped_frames = 0
+        await self.dropped_frames_rbv.write(0)
+        async for frame_number, ndarray in self.expose_frames(async_lib, frame_count):
+            await self.num_images_counter.write(frame_number)
+            self.correct_frame(ndarray.data)
+            readout_ndarray = self.read_out(ndarray, readout_region, dtype)
+            if readout_ndarray is None:
+                await self.drop_frames()
+                continue
+            try:
+                if image_mode == ImageMode.AVERAGE:
+                    self._frame_averager.add(readout_ndarray.data)
+                else:
+                    await self.publish_array(readout_ndarray)
+            finally:
+                readout_ndarray.release()
+
+        # publish the average of the frames acquired, even if Acquire=0 stopped early
+        if self._frame_averager.frame_count > 0:
+            await self.publish_image(
+                self._frame_averager.get_average, readout_region.output_shape, dtype
+            )
+
+        await self.reset_frame_rate()
+        await self.write_pool_stats()
+
+    async def drop_frames(self, frame_count=1):
+        """
+        Count frames dropped during the acquisition in DroppedFrames_RBV.
+        """
+        self._dropped_frames += frame_count
+        await self.dropped_frames_rbv.write(self._dropped_frames)
+        await self.write_pool_stats()
+
+    async def reset_frame_rate(self):
+        self._frame_rate_meter.reset()
+        await self.array_rate_rbv.write(self._frame_rate_meter.rate)
+
+    def read_out(self, ndarray, readout_region, dtype):
+        """
+        Return an NDArray of dtype of the readout region of a full sensor
+        NDArray, with a reference for the caller to release, or None if the
+        pool is exhausted and the frame must be dropped.
+
+        An unbinned region of the sensor dtype is a view of the sensor frame
+        in the same buffer. A binned region or another dtype is written into
+        an NDArray from the pool of that dtype in one pass, without temporary
+        arrays.
+        """
+        if not readout_region.binned and dtype == ndarray.data.dtype:
+            ndarray.data = readout_region.view(ndarray.data)
+            return ndarray.reserve()
+        readout_ndarray = self.ndarray_pool(dtype).alloc(readout_region.output_shape, dtype)
+        if readout_ndarray is None:
+            return None
+        readout_region.apply(ndarray.data, out=readout_ndarray.data)
+        readout_ndarray.timestamp = ndarray.timestamp
+        return readout_ndarray
+
+    def check_correction_map(self, file_setting_name, correction_map):
+        """
+        Reject a gain or pixel correction map that is not the size of the
+        sensor, the corrections are applied to full frames. Raising rejects
+        the load, so the previous map and its Available flag are kept.
+        """
+        if correction_map.shape != self._image_generator.shape:
+            raise ValueError(
+                f"{file_setting_name} map has shape {correction_map.shape}, "
+                f"not the {self._image_generator.shape} shape of the sensor"
+            )
+
+    def correct_frame(self, frame):
+        """
+        Apply the enabled corrections to a light frame in place.
+
+        As in the PerkinElmer driver the offset is subtracted first, then
+        the frame is multiplied by the gain and last bad pixels are replaced.
+        """
+        if (
+            self.settings.pe_use_offset == SimulatedPerkinElmerDetectorIoc.PEUseOffset.ENABLE
+            and self._offset_correction.available
+        ):
+            self._offset_correction.apply(frame)
+        if (
+            self.settings.pe_use_gain == SimulatedPerkinElmerDetectorIoc.PEUseGain.ENABLE
+            and self._gain_correction.available
+        ):
+            self._gain_correction.apply(frame)
+        if (
+            self.settings.pe_use_pixel_correction
+            == SimulatedPerkinElmerDetectorIoc.PEUsePixelCorrection.ENABLE
+            and self._bad_pixel_correction.available
+        ):
+            self._bad_pixel_correction.apply(frame)
+        return frame
+
+    async def publish_image(self, render_image, shape, dtype):
+        """
+        Publish an image computed after readout, such as an average.
+
+        render_image(out=...) writes the image into an NDArray of shape and
+        dtype from the pool, if the pool is exhausted the image is dropped.
+        """
+        ndarray = self.ndarray_pool(dtype).alloc(shape, dtype)
+        if ndarray is None:
+            await self.drop_frames()
+            return
+        try:
+            render_image(out=ndarray.data)
+            ndarray.timestamp = self._clock.monotonic()
+            await self.publish_array(ndarray)
+        finally:
+            ndarray.release()
+
+    async def publish_array(self, ndarray):
+        """
+        Write the 2D frame of an NDArray to ArrayData and its size to
+        ArraySize*_RBV and pass the NDArray to the plugins.
+
+        Channel Access has no unsigned types so like areaDetector UInt16 frames
+        are served as DBR_SHORT and UInt32 frames as DBR_LONG, which are views
+        of the frame, not copies, unless the frame is a region view of the
+        sensor and must be flattened. The native type of ArrayData follows the
+        frame dtype, clients that connected while another DataType was served
+        read the frame converted to the old type until they reconnect.
+        The NDArray stays reserved until ArrayData serves the next frame.
+        Clients must set EPICS_CA_MAX_ARRAY_BYTES large enough for a full frame.
+        """
+        frame = ndarray.data
+        self.settings.array_counter += 1
+        ndarray.unique_id = self.settings.array_counter
+        await self.array_counter_rbv.write(self.settings.array_counter)
+
+        size_y, size_x = frame.shape
+        if self.array_size_x_rbv.value != size_x:
+            await self.array_size_x_rbv.write(size_x)
+        if self.array_size_y_rbv.value != size_y:
+            await self.array_size_y_rbv.write(size_y)
+        if self.array_size_rbv.value != frame.nbytes:
+            await self.array_size_rbv.write(frame.nbytes)
+        channel_type, wire_dtype = self.ARRAY_DATA_TYPES[frame.dtype]
+        self.array_data.data_type = channel_type
+        await self.array_data.write(frame.reshape(-1).view(wire_dtype))
+        if self._array_data_ndarray is not None:
+            self._array_data_ndarray.release()
+        self._array_data_ndarray = ndarray.reserve()
+
+        if self._frame_rate_meter.count_frame():
+            await self.array_rate_rbv.write(self._frame_rate_meter.rate)
+        await self.dispatch_array(ndarray)
+        await self.write_pool_stats()
 
     """
-    AcquireTime
+    ArrayData
+        the most recent frame, flattened, its native type follows DataType
     """
 
-    @pvproperty(
-        name=":{camera}:AcquireTime",
-        dtype=ChannelType.FLOAT,
-        value=1.0,
+    # the Channel Access type of ArrayData and the signed dtype of the
+    # frame view it serves for each DataType
+    ARRAY_DATA_TYPES = {
+        ND_DATA_TYPES["UInt16"]: (ChannelType.INT, np.int16),
+        ND_DATA_TYPES["Int32"]: (ChannelType.LONG, np.int32),
+        ND_DATA_TYPES["UInt32"]: (ChannelType.LONG, np.int32),
+        ND_DATA_TYPES["Float32"]: (ChannelType.FLOAT, np.float32),
+    }
+
+    array_data = pvproperty(
+        name=":{camera}:ArrayData",
+        dtype=ChannelType.INT,
+        max_length=MAX_SIZE_X * MAX_SIZE_Y,
+        value=[0],
+        read_only=True,
     )
-    async def acquire_time(self, instance):
-        return self._acquire_time
 
-    @acquire_time.putter
-    async def acquire_time(self, instance, value):
-        self._acquire_time = value
-        return value
+    """
+    ArrayCounter
+        incremented for every published frame, write 0 to reset it
+    ArrayRate_RBV
+        published frames per second, measured on the IOC clock
+    DroppedFrames_RBV
+        frames dropped during the most recent acquisition, because the
+        detector was free-running or because the NDArray pool was exhausted
+    """
 
-    @pvproperty(
-        name=":{camera}:AcquireTime_RBV",
+    array_counter, array_counter_rbv = pvproperty_with_rbv(
+        name=":{camera}:ArrayCounter", dtype=ChannelType.INT, value=0
+    )
+
+    array_rate_rbv = pvproperty(
+        name=":{camera}:ArrayRate_RBV",
         dtype=ChannelType.FLOAT,
-        value=1.0,
+        value=0.0,
+        read_only=True,
+    )
+
+    dropped_frames_rbv = pvproperty(
+        name=":{camera}:DroppedFrames_RBV",
+        dtype=ChannelType.INT,
+        value=0,
         read_only=True,
     )
-    async def acquire_time_rbv(self, instance):
-        return self._acquire_time
 
     """
     array_size = DDC(ad_group(EpicsSignalRO,
@@ -717,12 +2071,110 @@ class SimulatedPerkinElmerDetectorIoc(ArrayBasePVGroup):
                                ('array_size_y', 'ArraySizeY_RBV'),
                                ('array_size_z', 'ArraySizeZ_RBV'))),
                      doc='Size of the array in the XYZ dimensions')
+    """
+
+    array_size_x_rbv = pvproperty(
+        name=":{camera}:ArraySizeX_RBV", dtype=ChannelType.INT, value=0, read_only=True
+    )
+
+    array_size_y_rbv = pvproperty(
+        name=":{camera}:ArraySizeY_RBV", dtype=ChannelType.INT, value=0, read_only=True
+    )
+
+    """
+    ArraySize_RBV
+        bytes in the most recent frame
+    """
+
+    array_size_rbv = pvproperty(
+        name=":{camera}:ArraySize_RBV", dtype=ChannelType.LONG, value=0, read_only=True
+    )
+
+    """
+    DataType
+        the type frames are cast to when they are read out, one of the
+        areaDetector NDDataType names, only UInt16, Int32, UInt32 and Float32
+        are supported. Frames are cast in one pass into a buffer preallocated
+        for the type when it is selected. A new DataType takes effect with
+        the next acquisition.
+    ColorMode
+        the PerkinElmer detectors are monochrome, only Mono is supported
+    """
+
+    class DataType:
+        UINT16 = "UInt16"
+        INT32 = "Int32"
+        UINT32 = "UInt32"
+        FLOAT32 = "Float32"
+
+    SUPPORTED_DATA_TYPES = (DataType.UINT16, DataType.INT32, DataType.UINT32, DataType.FLOAT32)
+
+    data_type = pvproperty(
+        name=":{camera}:DataType",
+        dtype=ChannelType.ENUM,
+        enum_strings=tuple(ND_DATA_TYPES),
+        value=DataType.UINT16,
+    )
+
+    @data_type.putter
+    @stores_setting
+    async def data_type(self, instance, value):
+        if value not in SimulatedPerkinElmerDetectorIoc.SUPPORTED_DATA_TYPES:
+            raise ValueError(
+                f"DataType must be one of "
+                f"{SimulatedPerkinElmerDetectorIoc.SUPPORTED_DATA_TYPES}, not {value}"
+            )
+        dtype = ND_DATA_TYPES[value]
+        if dtype != self._image_generator.frame.dtype and dtype not in self._cast_pools:
+            self._cast_pools[dtype] = NDArrayPool(
+                max_buffers=self._ndarray_pool.max_buffers,
+                buffer_bytes=self._image_generator.frame.size * dtype.itemsize,
+            )
+            await self.write_pool_stats()
+        self.settings.data_type = value
+        await self.data_type_rbv.write(value)
+        return value
+
+    # an mbbi record, ophyd reads DataType_RBV.DISA to describe the frames
+    data_type_rbv = pvproperty(
+        name=":{camera}:DataType_RBV",
+        dtype=ChannelType.ENUM,
+        enum_strings=tuple(ND_DATA_TYPES),
+        value=DataType.UINT16,
+        read_only=True,
+        record="mbbi",
+    )
+
+    class ColorMode:
+        MONO = "Mono"
+
+    COLOR_MODES = ("Mono", "Bayer", "RGB1", "RGB2", "RGB3", "YUV444", "YUV422", "YUV411")
+
+    color_mode = pvproperty(
+        name=":{camera}:ColorMode",
+        dtype=ChannelType.ENUM,
+        enum_strings=COLOR_MODES,
+        value=ColorMode.MONO,
+    )
 
-    array_size_bytes = ADCpt(EpicsSignalRO, 'ArraySize_RBV')
-    bin_x = ADCpt(SignalWithRBV, 'BinX')
-    bin_y = ADCpt(SignalWithRBV, 'BinY')
-    color_mode = ADCpt(SignalWithRBV, 'ColorMode')
-    data_type = ADCpt(SignalWithRBV, 'DataType')
+    @color_mode.putter
+    @stores_setting
+    async def color_mode(self, instance, value):
+        if value != SimulatedPerkinElmerDetectorIoc.ColorMode.MONO:
+            raise ValueError(f"ColorMode must be Mono, not {value}")
+        self.settings.color_mode = value
+        await self.color_mode_rbv.write(value)
+        return value
+
+    color_mode_rbv = pvproperty(
+        name=":{camera}:ColorMode_RBV",
+        dtype=ChannelType.ENUM,
+        enum_strings=COLOR_MODES,
+        value=ColorMode.MONO,
+        read_only=True,
+    )
+
+    """
     detector_state = ADCpt(EpicsSignalRO, 'DetectorState_RBV')
     frame_type = ADCpt(SignalWithRBV, 'FrameType')
     gain = ADCpt(SignalWithRBV, 'Gain')
@@ -738,27 +2190,9 @@ class SimulatedPerkinElmerDetectorIoc(ArrayBasePVGroup):
         3 - Average  (specific to the Perkin-Elmer detector)
     """
 
-    @pvproperty(
-        name=":{camera}:ImageMode",
-        dtype=ChannelType.INT,
-        value=0,
-    )
-    async def image_mode(self, instance):
-        return self._image_mode
-
-    @image_mode.putter
-    async def image_mode(self, instance, value):
-        self._image_mode = value
-        return value
-
-    @pvproperty(
-        name=":{camera}:ImageMode_RBV",
-        dtype=ChannelType.INT,
-        value=0,
-        read_only=True,
+    image_mode, image_mode_rbv = pvproperty_with_rbv(
+        name=":{camera}:ImageMode", dtype=ChannelType.INT, value=0, lower=0, upper=3
     )
-    async def image_mode_rbv(self, instance):
-        return self._image_mode
 
     # using dtype=ChannelType.CHAR and max_length=1024 results in un-JSON-able
     # data in the start document
@@ -781,11 +2215,199 @@ class SimulatedPerkinElmerDetectorIoc(ArrayBasePVGroup):
                             (('max_size_x', 'MaxSizeX_RBV'),
                              ('max_size_y', 'MaxSizeY_RBV'))),
                    doc='Maximum sensor size in the XY directions')
+    """
+
+    max_size_x_rbv = pvproperty(
+        name=":{camera}:MaxSizeX_RBV",
+        dtype=ChannelType.INT,
+        value=MAX_SIZE_X,
+        read_only=True,
+    )
+
+    max_size_y_rbv = pvproperty(
+        name=":{camera}:MaxSizeY_RBV",
+        dtype=ChannelType.INT,
+        value=MAX_SIZE_Y,
+        read_only=True,
+    )
 
-    min_x = ADCpt(SignalWithRBV, 'MinX')
-    min_y = ADCpt(SignalWithRBV, 'MinY')
+    @max_size_y_rbv.startup
+    async def max_size_y_rbv(self, instance, async_lib):
+        await self.write_initial_values()
+
+    async def write_initial_values(self):
+        """
+        Write the sensor size, which is known only when the IOC is created, to
+        MaxSizeX_RBV, MaxSizeY_RBV, SizeX and SizeY and the readout region
+        RBVs, and the sizes of the NDArray pools to the Pool* PVs. This is
+        called when the IOC starts.
+
+        Every other readback is written by the putter of its setpoint, or
+        where the IOC changes it, so monitors on readbacks fire.
+        """
+        size_y, size_x = self._readout_region.sensor_shape
+        await self.max_size_x_rbv.write(size_x)
+        await self.max_size_y_rbv.write(size_y)
+        await self.size_x.write(size_x)
+        await self.size_y.write(size_y)
+        await self.write_pool_stats()
 
     """
+    Readout region
+        MinX, MinY      first pixel of the region
+        SizeX, SizeY    size of the region in unbinned pixels
+        BinX, BinY      pixels summed into each binned pixel
+        ReverseX, ReverseY
+            0 - No
+            1 - Yes
+        The region is clamped to the sensor and the sizes are cut to whole
+        bins, the _RBV PVs show the region that is read out. A new region
+        takes effect with the next acquisition. ArraySizeX_RBV and
+        ArraySizeY_RBV are the binned size.
+    """
+
+    class Reverse:
+        NO = int(0)
+        YES = int(1)
+
+    async def update_readout_region(self):
+        """
+        Clamp the region written to MinX through ReverseY to the sensor and
+        write the region that will be read out to the _RBV PVs.
+        """
+        settings = self.settings
+        self._readout_region = ReadoutRegion(
+            self._image_generator.shape,
+            min_x=settings.min_x,
+            min_y=settings.min_y,
+            size_x=settings.size_x,
+            size_y=settings.size_y,
+            bin_x=settings.bin_x,
+            bin_y=settings.bin_y,
+            reverse_x=settings.reverse_x == SimulatedPerkinElmerDetectorIoc.Reverse.YES,
+            reverse_y=settings.reverse_y == SimulatedPerkinElmerDetectorIoc.Reverse.YES,
+        )
+        readout_region = self._readout_region
+        for rbv, value in (
+            (self.min_x_rbv, readout_region.min_x),
+            (self.min_y_rbv, readout_region.min_y),
+            (self.size_x_rbv, readout_region.size_x),
+            (self.size_y_rbv, readout_region.size_y),
+            (self.bin_x_rbv, readout_region.bin_x),
+            (self.bin_y_rbv, readout_region.bin_y),
+            (self.reverse_x_rbv, int(readout_region.reverse_x)),
+            (self.reverse_y_rbv, int(readout_region.reverse_y)),
+        ):
+            if rbv.value != value:
+                await rbv.write(value)
+
+    min_x = pvproperty(name=":{camera}:MinX", dtype=ChannelType.INT, value=0)
+
+    @min_x.putter
+    @stores_setting
+    async def min_x(self, instance, value):
+        self.settings.min_x = value
+        await self.update_readout_region()
+        return value
+
+    min_x_rbv = pvproperty(
+        name=":{camera}:MinX_RBV", dtype=ChannelType.INT, value=0, read_only=True
+    )
+
+    min_y = pvproperty(name=":{camera}:MinY", dtype=ChannelType.INT, value=0)
+
+    @min_y.putter
+    @stores_setting
+    async def min_y(self, instance, value):
+        self.settings.min_y = value
+        await self.update_readout_region()
+        return value
+
+    min_y_rbv = pvproperty(
+        name=":{camera}:MinY_RBV", dtype=ChannelType.INT, value=0, read_only=True
+    )
+
+    size_x = pvproperty(name=":{camera}:SizeX", dtype=ChannelType.INT, value=MAX_SIZE_X)
+
+    @size_x.putter
+    @stores_setting
+    async def size_x(self, instance, value):
+        self.settings.size_x = value
+        await self.update_readout_region()
+        return value
+
+    size_x_rbv = pvproperty(
+        name=":{camera}:SizeX_RBV", dtype=ChannelType.INT, value=MAX_SIZE_X, read_only=True
+    )
+
+    size_y = pvproperty(name=":{camera}:SizeY", dtype=ChannelType.INT, value=MAX_SIZE_Y)
+
+    @size_y.putter
+    @stores_setting
+    async def size_y(self, instance, value):
+        self.settings.size_y = value
+        await self.update_readout_region()
+        return value
+
+    size_y_rbv = pvproperty(
+        name=":{camera}:SizeY_RBV", dtype=ChannelType.INT, value=MAX_SIZE_Y, read_only=True
+    )
+
+    bin_x = pvproperty(name=":{camera}:BinX", dtype=ChannelType.INT, value=1)
+
+    @bin_x.putter
+    @stores_setting
+    async def bin_x(self, instance, value):
+        self.settings.bin_x = value
+        await self.update_readout_region()
+        return value
+
+    bin_x_rbv = pvproperty(
+        name=":{camera}:BinX_RBV", dtype=ChannelType.INT, value=1, read_only=True
+    )
+
+    bin_y = pvproperty(name=":{camera}:BinY", dtype=ChannelType.INT, value=1)
+
+    @bin_y.putter
+    @stores_setting
+    async def bin_y(self, instance, value):
+        self.settings.bin_y = value
+        await self.update_readout_region()
+        return value
+
+    bin_y_rbv = pvproperty(
+        name=":{camera}:BinY_RBV", dtype=ChannelType.INT, value=1, read_only=True
+    )
+
+    reverse_x = pvproperty(
+        name=":{camera}:ReverseX", dtype=ChannelType.INT, value=Reverse.NO
+    )
+
+    @reverse_x.putter
+    @stores_setting
+    async def reverse_x(self, instance, value):
+        self.settings.reverse_x = value
+        await self.update_readout_region()
+        return value
+
+    reverse_x_rbv = pvproperty(
+        name=":{camera}:ReverseX_RBV", dtype=ChannelType.INT, value=Reverse.NO, read_only=True
+    )
+
+    reverse_y = pvproperty(
+        name=":{camera}:ReverseY", dtype=ChannelType.INT, value=Reverse.NO
+    )
+
+    @reverse_y.putter
+    @stores_setting
+    async def reverse_y(self, instance, value):
+        self.settings.reverse_y = value
+        await self.update_readout_region()
+        return value
+
+    reverse_y_rbv = pvproperty(
+        name=":{camera}:ReverseY_RBV", dtype=ChannelType.INT, value=Reverse.NO, read_only=True
+    )
 
     num_exposures = pvproperty(name=":{camera}:NumExposures", value=1)
     num_exposures_rbv = pvproperty(
@@ -801,24 +2423,9 @@ class SimulatedPerkinElmerDetectorIoc(ArrayBasePVGroup):
     NumImages
     """
 
-    @pvproperty(
-        name=":{camera}:NumImages",
-        dtype=ChannelType.INT,
-        value=0,
-    )
-    async def num_images(self, instance):
-        return self._num_images
-
-    @num_images.putter
-    async def num_images(self, instance, value):
-        self._num_images = value
-        return value
-
-    @pvproperty(
-        name=":{camera}:NumImages_RBV", dtype=ChannelType.INT, value=0, read_only=True
+    num_images, num_images_rbv = pvproperty_with_rbv(
+        name=":{camera}:NumImages", dtype=ChannelType.INT, value=0
     )
-    async def num_images_rbv(self, instance):
-        return self._num_images
 
     num_images_counter = pvproperty(
         name=":{camera}:NumImagesCounter_RBV", read_only=True, value=0
@@ -826,10 +2433,6 @@ class SimulatedPerkinElmerDetectorIoc(ArrayBasePVGroup):
 
     """
     read_status = ADCpt(EpicsSignal, 'ReadStatus')
-    reverse = DDC(ad_group(SignalWithRBV,
-                           (('reverse_x', 'ReverseX'),
-                            ('reverse_y', 'ReverseY'))
-                           ))
 
     shutter_close_delay = ADCpt(SignalWithRBV, 'ShutterCloseDelay')
     shutter_close_epics = ADCpt(EpicsSignal, 'ShutterCloseEPICS')
@@ -842,11 +2445,6 @@ class SimulatedPerkinElmerDetectorIoc(ArrayBasePVGroup):
     shutter_status_epics = ADCpt(EpicsSignalRO, 'ShutterStatusEPICS_RBV')
     shutter_status = ADCpt(EpicsSignalRO, 'ShutterStatus_RBV')
 
-    size = DDC(ad_group(SignalWithRBV,
-                        (('size_x', 'SizeX'),
-                         ('size_y', 'SizeY'))
-                        ))
-
     status_message = ADCpt(EpicsSignalRO, 'StatusMessage_RBV', string=True)
     string_from_server = ADCpt(EpicsSignalRO, 'StringFromServer_RBV', string=True)
     string_to_server = ADCpt(EpicsSignalRO, 'StringToServer_RBV', string=True)
@@ -859,25 +2457,9 @@ class SimulatedPerkinElmerDetectorIoc(ArrayBasePVGroup):
     TriggerMode (Internal, External, Free Running, Soft Trigger)
     """
 
-    @pvproperty(
+    trigger_mode, trigger_mode_rbv = pvproperty_with_rbv(
         name=":{camera}:TriggerMode", dtype=ChannelType.INT, value=TriggerMode.INTERNAL
     )
-    async def trigger_mode(self, instance):
-        return self._trigger_mode
-
-    @trigger_mode.putter
-    async def trigger_mode(self, instance, value):
-        self._trigger_mode = value
-        return value
-
-    @pvproperty(
-        name=":{camera}:TriggerMode_RBV",
-        dtype=ChannelType.INT,
-        value=TriggerMode.INTERNAL,
-        read_only=True,
-    )
-    async def trigger_mode_rbv(self, instance):
-        return self._trigger_mode
 
     # pe_acquire_gain = ADCpt(EpicsSignal, 'PEAcquireGain')
 
@@ -908,20 +2490,53 @@ class SimulatedPerkinElmerDetectorIoc(ArrayBasePVGroup):
 
         if value == SimulatedPerkinElmerDetectorIoc.PEAcquireOffset.ACQUIRE:
             instance.async_event.clear()
+            self._stop_acquisition = False
             try:
 
                 await instance.write(SimulatedPerkinElmerDetectorIoc.PEAcquireOffset.ACQUIRE)
-                await self.acquire_rbv.write(SimulatedPerkinElmerDetectorIoc.PEAcquireOffset.ACQUIRE)
+                await self.pe_acquire_offset_rbv.write(
+                    SimulatedPerkinElmerDetectorIoc.PEAcquireOffset.ACQUIRE
+                )
 
-                # await instance.async_lib.library.sleep(self.exposure_time.value)
-                await instance.async_lib.library.sleep(2)
+                await self.acquire_offset_images(instance.async_lib)
 
             finally:
                 instance.async_event.set()
+                await self.pe_acquire_offset_rbv.write(
+                    SimulatedPerkinElmerDetectorIoc.PEAcquireOffset.DONE
+                )
 
-        await self.acquire_rbv.write(SimulatedPerkinElmerDetectorIoc.PEAcquireOffset.DONE)
         return SimulatedPerkinElmerDetectorIoc.PEAcquireOffset.DONE
 
+    async def acquire_offset_images(self, async_lib):
+        """
+        Average PENumOffsetFrames dark frames into the offset image.
+
+        The average is also published like a light frame so it can be
+        written by the file plugins, as the dark image of pe_count.
+        """
+        offset_frame_count = max(int(self.settings.pe_num_offset_frames), 1)
+        self._offset_averager.reset()
+        async for frame_number, ndarray in self.expose_frames(
+            async_lib, offset_frame_count, dark=True
+        ):
+            self._offset_averager.add(ndarray.data)
+
+        if self._offset_averager.frame_count > 0:
+            offset_image = self._offset_averager.get_average()
+            self._offset_correction.set_offset(offset_image)
+            await self.pe_offset_available.write(
+                SimulatedPerkinElmerDetectorIoc.PEOffsetAvailable.AVAILABLE
+            )
+
+            # the offset image covers the sensor, publish its readout region
+            readout_region = self._readout_region
+            await self.publish_image(
+                functools.partial(readout_region.apply, offset_image),
+                readout_region.output_shape,
+                ND_DATA_TYPES[self.settings.data_type],
+            )
+
     @pe_acquire_offset.startup
     async def pe_acquire_offset(self, instance, async_lib):
         instance.async_lib = async_lib
@@ -962,12 +2577,8 @@ class SimulatedPerkinElmerDetectorIoc(ArrayBasePVGroup):
     # pe_dwell_time = ADCpt(SignalWithRBV, 'PEDwellTime')
     # pe_frame_buff_index = ADCpt(EpicsSignal, 'PEFrameBuffIndex')
     # pe_gain = ADCpt(SignalWithRBV, 'PEGain')
-    # pe_gain_available = ADCpt(EpicsSignal, 'PEGainAvailable')
-    # pe_gain_file = ADCpt(EpicsSignal, 'PEGainFile')
     # pe_image_number = ADCpt(EpicsSignal, 'PEImageNumber')
     # pe_initialize = ADCpt(EpicsSignal, 'PEInitialize')
-    # pe_load_gain_file = ADCpt(EpicsSignal, 'PELoadGainFile')
-    # pe_load_pixel_correction = ADCpt(EpicsSignal, 'PELoadPixelCorrection')
     # pe_num_frame_buffers = ADCpt(SignalWithRBV, 'PENumFrameBuffers')
     # pe_num_frames_to_skip = ADCpt(SignalWithRBV, 'PENumFramesToSkip')
     # pe_num_gain_frames = ADCpt(EpicsSignal, 'PENumGainFrames')
@@ -978,38 +2589,160 @@ class SimulatedPerkinElmerDetectorIoc(ArrayBasePVGroup):
     pe_num_offset_frames = ADCpt(EpicsSignal, 'PENumOffsetFrames')
     """
 
-    @pvproperty(
-        name=":{camera}:PENumOffsetFrames",
-        dtype=ChannelType.INT,
-        value=1,
+    pe_num_offset_frames, pe_num_offset_frames_rbv = pvproperty_with_rbv(
+        name=":{camera}:PENumOffsetFrames", dtype=ChannelType.INT, value=1
     )
-    async def pe_num_offset_frames(self, instance):
-        return self._pe_num_offset_frames
 
-    @pe_num_offset_frames.putter
-    async def pe_num_offset_frames(self, instance, value):
-        self._pe_num_offset_frames = value
-        return value
+    class PEOffsetAvailable:
+        NOT_AVAILABLE = int(0)
+        AVAILABLE = int(1)
+
+    pe_offset_available = pvproperty(
+        name=":{camera}:PEOffsetAvailable",
+        dtype=ChannelType.INT,
+        value=PEOffsetAvailable.NOT_AVAILABLE,
+        read_only=True,
+    )
 
-    # pe_offset_available = ADCpt(EpicsSignal, 'PEOffsetAvailable')
-    # pe_pixel_correction_available = ADCpt(EpicsSignal,
-    #                                       'PEPixelCorrectionAvailable')
-    # pe_pixel_correction_file = ADCpt(EpicsSignal, 'PEPixelCorrectionFile')
     # pe_save_gain_file = ADCpt(EpicsSignal, 'PESaveGainFile')
     # pe_skip_frames = ADCpt(SignalWithRBV, 'PESkipFrames')
     # pe_sync_time = ADCpt(SignalWithRBV, 'PESyncTime')
     # pe_system_id = ADCpt(EpicsSignal, 'PESystemID')
     # pe_trigger = ADCpt(EpicsSignal, 'PETrigger')
-    # pe_use_gain = ADCpt(EpicsSignal, 'PEUseGain')
-    # pe_use_offset = ADCpt(EpicsSignal, 'PEUseOffset')
-    # pe_use_pixel_correction = ADCpt(EpicsSignal, 'PEUsePixelCorrection')
+
+    class PEUseOffset:
+        DISABLE = int(0)
+        ENABLE = int(1)
+
+    pe_use_offset, pe_use_offset_rbv = pvproperty_with_rbv(
+        name=":{camera}:PEUseOffset", dtype=ChannelType.INT, value=PEUseOffset.DISABLE
+    )
+
+    """
+    Gain and pixel correction
+        PEGainFile and PEPixelCorrectionFile are local .npy or TIFF files,
+        writing 1 to PELoadGainFile or PELoadPixelCorrection loads them.
+        A pixel correction map marks bad pixels with non-zero values.
+    """
+
+    class PELoad:
+        DONE = int(0)
+        LOAD = int(1)
+
+    class PEGainAvailable:
+        NOT_AVAILABLE = int(0)
+        AVAILABLE = int(1)
+
+    class PEUseGain:
+        DISABLE = int(0)
+        ENABLE = int(1)
+
+    class PEPixelCorrectionAvailable:
+        NOT_AVAILABLE = int(0)
+        AVAILABLE = int(1)
+
+    class PEUsePixelCorrection:
+        DISABLE = int(0)
+        ENABLE = int(1)
+
+    pe_gain_file, pe_gain_file_rbv = pvproperty_with_rbv(
+        name=":{camera}:PEGainFile", dtype=ChannelType.CHAR, max_length=1024, value=""
+    )
+
+    @pvproperty(
+        name=":{camera}:PELoadGainFile",
+        dtype=ChannelType.INT,
+        value=PELoad.DONE,
+    )
+    async def pe_load_gain_file(self, instance):
+        return SimulatedPerkinElmerDetectorIoc.PELoad.DONE
+
+    @pe_load_gain_file.putter
+    async def pe_load_gain_file(self, instance, value):
+        if value == SimulatedPerkinElmerDetectorIoc.PELoad.LOAD:
+            gain_map = await run_in_thread(
+                instance.async_lib, load_correction_map, self.settings.pe_gain_file
+            )
+            self.check_correction_map("PEGainFile", gain_map)
+            self._gain_correction.set_gain(gain_map)
+            await self.pe_gain_available.write(
+                SimulatedPerkinElmerDetectorIoc.PEGainAvailable.AVAILABLE
+            )
+        return SimulatedPerkinElmerDetectorIoc.PELoad.DONE
+
+    @pe_load_gain_file.startup
+    async def pe_load_gain_file(self, instance, async_lib):
+        instance.async_lib = async_lib
+
+    pe_gain_available = pvproperty(
+        name=":{camera}:PEGainAvailable",
+        dtype=ChannelType.INT,
+        value=PEGainAvailable.NOT_AVAILABLE,
+        read_only=True,
+    )
+
+    pe_use_gain, pe_use_gain_rbv = pvproperty_with_rbv(
+        name=":{camera}:PEUseGain", dtype=ChannelType.INT, value=PEUseGain.DISABLE
+    )
+
+    pe_pixel_correction_file, pe_pixel_correction_file_rbv = pvproperty_with_rbv(
+        name=":{camera}:PEPixelCorrectionFile",
+        dtype=ChannelType.CHAR,
+        max_length=1024,
+        value="",
+    )
+
+    @pvproperty(
+        name=":{camera}:PELoadPixelCorrection",
+        dtype=ChannelType.INT,
+        value=PELoad.DONE,
+    )
+    async def pe_load_pixel_correction(self, instance):
+        return SimulatedPerkinElmerDetectorIoc.PELoad.DONE
+
+    @pe_load_pixel_correction.putter
+    async def pe_load_pixel_correction(self, instance, value):
+        if value == SimulatedPerkinElmerDetectorIoc.PELoad.LOAD:
+            pixel_correction_map = await run_in_thread(
+                instance.async_lib,
+                load_correction_map,
+                self.settings.pe_pixel_correction_file,
+            )
+            self.check_correction_map("PEPixelCorrectionFile", pixel_correction_map)
+            # finding the neighbours of the bad pixels takes a while for large maps
+            await run_in_thread(
+                instance.async_lib,
+                self._bad_pixel_correction.set_bad_pixels,
+                pixel_correction_map,
+            )
+            await self.pe_pixel_correction_available.write(
+                SimulatedPerkinElmerDetectorIoc.PEPixelCorrectionAvailable.AVAILABLE
+            )
+        return SimulatedPerkinElmerDetectorIoc.PELoad.DONE
+
+    @pe_load_pixel_correction.startup
+    async def pe_load_pixel_correction(self, instance, async_lib):
+        instance.async_lib = async_lib
+
+    pe_pixel_correction_available = pvproperty(
+        name=":{camera}:PEPixelCorrectionAvailable",
+        dtype=ChannelType.INT,
+        value=PEPixelCorrectionAvailable.NOT_AVAILABLE,
+        read_only=True,
+    )
+
+    pe_use_pixel_correction, pe_use_pixel_correction_rbv = pvproperty_with_rbv(
+        name=":{camera}:PEUsePixelCorrection",
+        dtype=ChannelType.INT,
+        value=PEUsePixelCorrection.DISABLE,
+    )
 
 
 if __name__ == "__main__":
     """
         python ophyd_addon/simulated_perkin_elmer_detector_ioc.py --list-pvs --prefix="XF:07BM-ES[Det:PE1]"
     """
-    ioc_options, run_options = ioc_arg_parser(
+    parser, split_args = template_arg_parser(
         # default_prefix="simple:",
         default_prefix="XF:07BM-ES[Det:PE12]",
         desc=dedent(SimulatedPerkinElmerDetectorIoc.__doc__),
@@ -1017,5 +2750,65 @@ if __name__ == "__main__":
             camera="cam1",
         ),
     )
-    ioc = SimulatedPerkinElmerDetectorIoc(**ioc_options)
+    parser.add_argument(
+        "--readout-time",
+        type=float,
+        default=0.0667,
+        help="Seconds to read out each frame, default: 0.0667",
+    )
+    parser.add_argument(
+        "--time-scale",
+        default=os.environ.get(TIME_SCALE_ENV, 1.0),
+        help=(
+            "Virtual seconds per real second or 'simulated' for a clock that "
+            f"does not wait, default: ${TIME_SCALE_ENV} or 1.0"
+        ),
+    )
+    parser.add_argument(
+        "--pool-max-buffers",
+        type=int,
+        default=10,
+        help="Number of frame buffers in the NDArray pool, default: 10",
+    )
+    parser.add_argument(
+        "--stats-file",
+        default=None,
+        help="Write the getter and putter latency histograms here as JSON on shutdown",
+    )
+    parser.add_argument(
+        "--replay",
+        default=None,
+        help=(
+            "Serve the frames of a .npy or raw file, or a directory of them, "
+            "in a loop instead of simulated frames"
+        ),
+    )
+    parser.add_argument(
+        "--replay-shape",
+        type=int,
+        nargs=2,
+        default=None,
+        help="Frame size y x of replayed raw files, .npy files record their shape",
+    )
+    parser.add_argument(
+        "--replay-dtype",
+        default="uint16",
+        help="Data type of replayed raw files, default: uint16",
+    )
+    args = parser.parse_args()
+    ioc_options, run_options = split_args(args)
+    if args.replay is None:
+        image_generator = None
+    else:
+        image_generator = ReplayImageGenerator(
+            args.replay, shape=args.replay_shape, dtype=args.replay_dtype
+        )
+    ioc = SimulatedPerkinElmerDetectorIoc(
+        image_generator=image_generator,
+        readout_time=args.readout_time,
+        clock=make_clock(args.time_scale),
+        pool_max_buffers=args.pool_max_buffers,
+        stats_file=args.stats_file,
+        **ioc_options,
+    )
     run(ioc.pvdb, **run_options)
@@ -0,0 +1,111 @@
+class ImageMode:
+    """
+    areaDetector ImageMode values, AVERAGE is specific to the PerkinElmer detector.
+    """
+
+    SINGLE = int(0)
+    MULTIPLE = int(1)
+    CONTINUOUS = int(2)
+    AVERAGE = int(3)
+
+
+class AcquisitionTimingModel:
+    """
+    Derive simulated acquisition timing from areaDetector parameters.
+
+    Each frame takes AcquireTime plus a fixed readout time. Frames start
+    every AcquirePeriod seconds unless exposure and readout take longer
+    than AcquirePeriod, in which case frames follow each other without a gap.
+
+    Parameters
+    ----------
+    readout_time: float
+        seconds to read out one frame, the PerkinElmer XRD 1621 reads out
+        at about 15 frames per second
+    """
+
+    def __init__(self, readout_time=0.0667):
+        self.readout_time = readout_time
+
+    def frame_count(self, image_mode, num_images):
+        """
+        Return the number of frames for one acquisition, None for CONTINUOUS.
+
+        MULTIPLE and AVERAGE acquire NumImages frames, AVERAGE publishes only
+        their average.
+        """
+        if image_mode == ImageMode.SINGLE:
+            return 1
+        elif image_mode in (ImageMode.MULTIPLE, ImageMode.AVERAGE):
+            return max(int(num_images), 1)
+        elif image_mode == ImageMode.CONTINUOUS:
+            return None
+        else:
+            raise ValueError(f"unknown ImageMode {image_mode}")
+
+    def frame_time(self, acquire_time):
+        """
+        Return the seconds from the start of one frame until it is read out.
+        """
+        return max(acquire_time, 0.0) + self.readout_time
+
+    def frame_period(self, acquire_time, acquire_period):
+        """
+        Return the seconds from the start of one frame to the start of the next.
+        """
+        return max(acquire_period, self.frame_time(acquire_time))
+
+    def acquisition_time(self, image_mode, num_images, acquire_time, acquire_period):
+        """
+        Return the seconds for one acquisition, None for CONTINUOUS.
+
+        There is no wait for AcquirePeriod after the last frame.
+        """
+        frame_count = self.frame_count(image_mode, num_images)
+        if frame_count is None:
+            return None
+        return (frame_count - 1) * self.frame_period(
+            acquire_time, acquire_period
+        ) + self.frame_time(acquire_time)
+
+
+class FrameRateMeter:
+    """
+    Measure frames per second on a clock, like areaDetector's ArrayRate_RBV.
+
+    The rate is the number of frames counted in the last complete interval
+    divided by its length, it is updated once per interval.
+
+    Parameters
+    ----------
+    clock: a clock from ophyd_addon.virtual_clock
+        the rate is measured in frames per virtual second
+    interval: float
+        seconds between rate updates
+    """
+
+    def __init__(self, clock, interval=1.0):
+        self.clock = clock
+        self.interval = interval
+        self.rate = 0.0
+        self._frame_count = 0
+        self._interval_start = clock.monotonic()
+
+    def reset(self):
+        self.rate = 0.0
+        self._frame_count = 0
+        self._interval_start = self.clock.monotonic()
+
+    def count_frame(self):
+        """
+        Count one frame, return True if the rate was updated.
+        """
+        self._frame_count += 1
+        now = self.clock.monotonic()
+        elapsed = now - self._interval_start
+        if elapsed < self.interval:
+            return False
+        self.rate = self._frame_count / elapsed
+        self._frame_count = 0
+        self._interval_start = now
+        return True
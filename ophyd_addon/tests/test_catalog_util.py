@@ -0,0 +1,35 @@
+import ophyd_addon
+from ophyd_addon.benchmarks.import_time import measure_import
+from ophyd_addon.catalog_util import LazyCatalog
+
+
+def test_import_does_not_build_catalog():
+    assert isinstance(ophyd_addon.mab_catalog_instance, LazyCatalog)
+    assert not ophyd_addon.mab_catalog_instance.is_built
+
+    # import in a fresh interpreter so other tests can not interfere
+    result = measure_import(repeat=1)
+    assert result["heavy_modules"] == []
+
+
+def test_lazy_catalog():
+    factory_calls = []
+
+    def factory():
+        factory_calls.append(1)
+        return {"a": 1, "b": 2}
+
+    lazy_catalog = LazyCatalog(factory)
+    assert not lazy_catalog.is_built
+    assert "not built" in repr(lazy_catalog)
+    assert len(factory_calls) == 0
+
+    assert lazy_catalog["a"] == 1
+    assert lazy_catalog.is_built
+    assert sorted(lazy_catalog) == ["a", "b"]
+    assert len(lazy_catalog) == 2
+    assert "b" in lazy_catalog
+    assert sorted(lazy_catalog.keys()) == ["a", "b"]
+
+    # the catalog is built only once
+    assert len(factory_calls) == 1
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from ophyd_addon.areadetector.codec import decode_array
+from ophyd_addon.codec import NO_CODEC, available_codecs, compress, decompress
+from ophyd_addon.simulated_images import DiffractionImageGenerator
+
+
+def test_available_codecs():
+    # zlib is in the standard library
+    assert "zlib" in available_codecs()
+
+
+@pytest.mark.parametrize("codec", [NO_CODEC, *available_codecs()])
+def test_compress_decompress(codec):
+    frame = DiffractionImageGenerator(shape=(64, 48), seed=0).generate(exposure=1.0)
+    compressed = compress(codec, frame)
+    if codec != NO_CODEC:
+        assert len(compressed) < frame.nbytes
+    decompressed = decompress(codec, compressed, frame.nbytes)
+    np.testing.assert_array_equal(np.frombuffer(decompressed, dtype=frame.dtype), frame.ravel())
+
+    # the uint8 array read from ArrayData decodes to a read-only frame
+    decoded = decode_array(
+        np.frombuffer(compressed, dtype=np.uint8), codec, frame.shape, frame.dtype
+    )
+    np.testing.assert_array_equal(decoded, frame)
+    assert not decoded.flags.writeable
+
+    with pytest.raises(ValueError):
+        decode_array(compressed, codec, (64, 47), frame.dtype)
+
+
+@pytest.mark.parametrize("codec", [NO_CODEC, *available_codecs()])
+def test_compress_big_endian(codec):
+    # frames are compressed little-endian whatever their byte order
+    frame = DiffractionImageGenerator(shape=(64, 48), seed=0).generate(exposure=1.0)
+    big_endian_frame = frame.astype(frame.dtype.newbyteorder(">"))
+    compressed = compress(codec, big_endian_frame)
+    assert compressed == compress(codec, frame.astype(frame.dtype.newbyteorder("<")))
+
+    decoded = decode_array(
+        np.frombuffer(compressed, dtype=np.uint8), codec, frame.shape, frame.dtype
+    )
+    np.testing.assert_array_equal(decoded, frame)
+
+
+def test_unknown_codec():
+    with pytest.raises(ValueError):
+        compress("JPEG", np.zeros((2, 2), dtype=np.uint16))
+    with pytest.raises(ValueError):
+        decompress("JPEG", b"", 8)
@@ -0,0 +1,59 @@
+import pytest
+
+from ophyd import Component as Cpt, Device, Signal
+
+from ophyd_addon.device_registry import DeviceRegistry
+
+
+class SimpleDevice(Device):
+    a = Cpt(Signal, value=1)
+    b = Cpt(Signal, value=2, lazy=True)
+
+
+def test_device_registry():
+    registry = DeviceRegistry(SimpleDevice, name="simple")
+    assert "prefix1:" not in registry
+
+    device_1 = registry.get("prefix1:")
+    assert "prefix1:" in registry
+    assert device_1.prefix == "prefix1:"
+    # the registry returns the cached device
+    assert registry.get("prefix1:") is device_1
+
+    # each prefix gets its own device
+    device_2 = registry.get("prefix2:", name="simple2")
+    assert device_2 is not device_1
+    assert device_2.name == "simple2"
+
+    # lazy signals are connected only when they are named
+    assert set(registry.connection_times["prefix1:"]) == {"a"}
+    registry.get("prefix3:", signal_names=["b"])
+    assert set(registry.connection_times["prefix3:"]) == {"a", "b"}
+
+    registry.clear()
+    assert "prefix1:" not in registry
+    assert registry.connection_times == {}
+
+
+class UnconnectedSignal(Signal):
+    @property
+    def connected(self):
+        return False
+
+
+class UnconnectedDevice(Device):
+    a = Cpt(Signal, value=1)
+    # a PV the IOC does not serve
+    missing = Cpt(UnconnectedSignal, value=0, lazy=True)
+
+
+def test_connect_device_lazy_signals():
+    registry = DeviceRegistry(UnconnectedDevice, name="unconnected")
+    # an unused lazy signal does not stop the device from connecting
+    registry.get("prefix1:", timeout=0.1)
+    assert set(registry.connection_times["prefix1:"]) == {"a"}
+
+    with pytest.raises(TimeoutError, match="missing"):
+        registry.get("prefix2:", timeout=0.1, signal_names=["missing"])
+    # a device that did not connect is not cached
+    assert "prefix2:" not in registry
@@ -0,0 +1,303 @@
+import numpy as np
+import pytest
+
+from ophyd_addon.frame_processing import (
+    BackgroundOffsetScale,
+    BadPixelCorrection,
+    FrameAverager,
+    FrameStatistics,
+    GainCorrection,
+    OffsetCorrection,
+    ReadoutRegion,
+    load_correction_map,
+)
+
+
+def test_frame_averager():
+    frame_averager = FrameAverager()
+    with pytest.raises(ValueError):
+        frame_averager.get_average()
+
+    frames = [np.full((4, 5), fill_value, dtype=np.uint16) for fill_value in (1, 2, 2, 60000)]
+    for frame in frames:
+        frame_averager.add(frame)
+    assert frame_averager.frame_count == 4
+    average = frame_averager.get_average()
+    assert average.dtype == np.uint16
+    # (1 + 2 + 2 + 60000) / 4 = 15001.25, no overflow in the running sum
+    np.testing.assert_array_equal(average, 15001)
+
+    # the next average reuses the same buffers
+    frame_averager.add(np.full((4, 5), 3, dtype=np.uint16))
+    frame_averager.add(np.full((4, 5), 4, dtype=np.uint16))
+    next_average = frame_averager.get_average()
+    assert next_average is average
+    # 3.5 rounds to 4
+    np.testing.assert_array_equal(next_average, 4)
+
+    # the average can be written into a caller's buffer
+    frame_averager.add(np.full((4, 5), 5, dtype=np.uint16))
+    out = np.zeros((4, 5), dtype=np.uint16)
+    assert frame_averager.get_average(out=out) is out
+    np.testing.assert_array_equal(out, 5)
+
+
+def test_frame_averager_float():
+    frame_averager = FrameAverager()
+    frame_averager.add(np.full((2, 2), 1.0, dtype=np.float32))
+    frame_averager.add(np.full((2, 2), 2.0, dtype=np.float32))
+    average = frame_averager.get_average()
+    assert average.dtype == np.float32
+    np.testing.assert_allclose(average, 1.5)
+
+
+def test_frame_averager_32_bit_integers():
+    frame_averager = FrameAverager()
+    # float32 has a 24 bit mantissa and would round these
+    frame_averager.add(np.full((2, 2), 2**24 + 1, dtype=np.uint32))
+    frame_averager.add(np.full((2, 2), 2**31 + 3, dtype=np.uint32))
+    assert frame_averager.sum_dtype(np.uint32) == np.uint64
+    average = frame_averager.get_average()
+    assert average.dtype == np.uint32
+    np.testing.assert_array_equal(average, (2**24 + 1 + 2**31 + 3) // 2)
+
+    frame_averager.add(np.full((2, 2), -(2**30) - 1, dtype=np.int32))
+    frame_averager.add(np.full((2, 2), -(2**30) - 2, dtype=np.int32))
+    assert frame_averager.sum_dtype(np.int32) == np.int64
+    # -1073741825.5 rounds to the nearest integer, half up
+    np.testing.assert_array_equal(frame_averager.get_average(), -(2**30) - 1)
+
+    assert frame_averager.sum_dtype(np.float32) == np.float64
+
+
+def test_offset_correction():
+    offset_correction = OffsetCorrection()
+    assert not offset_correction.available
+    with pytest.raises(ValueError):
+        offset_correction.apply(np.zeros((2, 2), dtype=np.uint16))
+
+    offset_image = np.array([[100, 100], [200, 200]], dtype=np.uint16)
+    offset_correction.set_offset(offset_image)
+    assert offset_correction.available
+    # the offset is a copy
+    offset_image[:] = 0
+    np.testing.assert_array_equal(offset_correction.offset, [[100, 100], [200, 200]])
+
+    frame = np.array([[150, 50], [1200, 0]], dtype=np.uint16)
+    corrected_frame = offset_correction.apply(frame)
+    assert corrected_frame is frame
+    # no unsigned underflow
+    np.testing.assert_array_equal(frame, [[50, 0], [1000, 0]])
+
+    offset_correction.clear()
+    assert not offset_correction.available
+
+
+def test_load_correction_map(tmp_path):
+    correction_map_path = tmp_path / "gain.npy"
+    np.save(correction_map_path, np.ones((3, 4), dtype=np.float32))
+    assert load_correction_map(correction_map_path).shape == (3, 4)
+
+    np.save(correction_map_path, np.ones(3))
+    with pytest.raises(ValueError):
+        load_correction_map(correction_map_path)
+
+
+def test_gain_correction():
+    gain_correction = GainCorrection()
+    assert not gain_correction.available
+    with pytest.raises(ValueError):
+        gain_correction.apply(np.zeros((2, 2), dtype=np.uint16))
+
+    # the mean of the good gains is 1.0, the zero gain is left unchanged
+    gain_correction.set_gain([[0.5, 1.5], [1.0, 0.0]])
+    assert gain_correction.available
+    np.testing.assert_allclose(gain_correction.multiplier, [[2.0, 2 / 3], [1.0, 1.0]])
+
+    frame = np.array([[40000, 300], [7, 9]], dtype=np.uint16)
+    corrected_frame = gain_correction.apply(frame)
+    assert corrected_frame is frame
+    # 80000 is clipped to the uint16 maximum
+    np.testing.assert_array_equal(frame, [[65535, 200], [7, 9]])
+
+    float_frame = np.ones((2, 2), dtype=np.float32)
+    gain_correction.apply(float_frame)
+    np.testing.assert_allclose(float_frame, [[2.0, 2 / 3], [1.0, 1.0]])
+
+
+def test_bad_pixel_correction():
+    bad_pixel_correction = BadPixelCorrection()
+    assert not bad_pixel_correction.available
+    with pytest.raises(ValueError):
+        bad_pixel_correction.apply(np.zeros((3, 3), dtype=np.uint16))
+
+    pixel_correction_map = np.zeros((3, 4), dtype=np.uint8)
+    # a corner pixel, two adjacent bad pixels
+    pixel_correction_map[0, 0] = 1
+    pixel_correction_map[1, 2] = 1
+    pixel_correction_map[1, 3] = 1
+    bad_pixel_correction.set_bad_pixels(pixel_correction_map)
+    assert bad_pixel_correction.bad_pixel_count == 3
+
+    frame = np.array(
+        [
+            [9999, 10, 20, 30],
+            [40, 50, 9999, 9999],
+            [60, 70, 80, 91],
+        ],
+        dtype=np.uint16,
+    )
+    corrected_frame = bad_pixel_correction.apply(frame)
+    assert corrected_frame is frame
+    np.testing.assert_array_equal(
+        frame,
+        [
+            # (10 + 40 + 50) / 3
+            [33, 10, 20, 30],
+            # (10 + 20 + 30 + 50 + 70 + 80 + 91) / 7 and (20 + 30 + 80 + 91) / 4
+            [40, 50, 50, 55],
+            [60, 70, 80, 91],
+        ],
+    )
+
+    with pytest.raises(ValueError):
+        bad_pixel_correction.apply(np.zeros((4, 3), dtype=np.uint16))
+
+
+def test_readout_region_view():
+    frame = np.arange(6 * 8, dtype=np.uint16).reshape((6, 8))
+
+    readout_region = ReadoutRegion(frame.shape)
+    assert readout_region.output_shape == (6, 8)
+    np.testing.assert_array_equal(readout_region.view(frame), frame)
+
+    readout_region = ReadoutRegion(
+        frame.shape, min_x=2, min_y=1, size_x=3, size_y=4, reverse_x=True, reverse_y=True
+    )
+    assert readout_region.output_shape == (4, 3)
+    region = readout_region.view(frame)
+    assert np.shares_memory(region, frame)
+    np.testing.assert_array_equal(region, frame[1:5, 2:5][::-1, ::-1])
+
+    out = np.zeros(readout_region.output_shape, dtype=np.uint16)
+    np.testing.assert_array_equal(readout_region.apply(frame, out=out), region)
+
+    with pytest.raises(ValueError):
+        readout_region.view(np.zeros((8, 6), dtype=np.uint16))
+
+
+def test_readout_region_clamp():
+    # the region is clamped to the sensor and cut to whole bins
+    readout_region = ReadoutRegion((6, 8), min_x=5, min_y=-1, size_x=10, size_y=0, bin_x=2)
+    assert (readout_region.min_x, readout_region.size_x, readout_region.bin_x) == (5, 2, 2)
+    assert (readout_region.min_y, readout_region.size_y, readout_region.bin_y) == (0, 1, 1)
+    assert readout_region.output_shape == (1, 1)
+
+    readout_region = ReadoutRegion((6, 8), min_x=100, bin_y=10)
+    assert (readout_region.min_x, readout_region.size_x) == (7, 1)
+    assert (readout_region.size_y, readout_region.bin_y) == (6, 6)
+
+
+def test_readout_region_bin():
+    frame = np.arange(6 * 8, dtype=np.uint16).reshape((6, 8))
+    readout_region = ReadoutRegion(frame.shape, min_x=1, size_x=7, bin_x=2, bin_y=3, reverse_x=True)
+    assert readout_region.binned
+    assert readout_region.output_shape == (2, 3)
+    with pytest.raises(ValueError):
+        readout_region.view(frame)
+
+    out = np.zeros(readout_region.output_shape, dtype=np.uint16)
+    assert readout_region.bin(frame, out=out) is out
+    expected = frame[:, 1:7].reshape((2, 3, 3, 2)).sum(axis=(1, 3))[:, ::-1]
+    np.testing.assert_array_equal(out, expected)
+
+    # binned sums are clipped rather than wrapped
+    frame[:] = 60000
+    readout_region.apply(frame, out=out)
+    assert np.all(out == np.iinfo(np.uint16).max)
+
+
+def test_background_offset_scale():
+    background_offset_scale = BackgroundOffsetScale()
+    assert not background_offset_scale.background_available
+    frame = np.array([[0, 10], [100, 65000]], dtype=np.uint16)
+    out = np.empty_like(frame)
+    with pytest.raises(ValueError):
+        background_offset_scale.apply(frame, out, subtract_background=True)
+
+    # without a background or scale and offset the frame is copied
+    background_offset_scale.apply(frame, out)
+    np.testing.assert_array_equal(out, frame)
+
+    background_offset_scale.set_background(np.full((2, 2), 20, dtype=np.uint16))
+    assert background_offset_scale.background_available
+    assert background_offset_scale.background_shape == (2, 2)
+    background_offset_scale.apply(frame, out, subtract_background=True, scale=2.0, offset=5.0)
+    # negative and overflowing pixels are clipped
+    np.testing.assert_array_equal(out, [[0, 0], [165, 65535]])
+    np.testing.assert_array_equal(frame, [[0, 10], [100, 65000]])
+
+    float_out = np.empty(frame.shape, dtype=np.float32)
+    background_offset_scale.apply(frame, float_out, subtract_background=True, scale=0.5, offset=0.0)
+    np.testing.assert_array_equal(float_out, [[-10, -5], [40, 32490]])
+
+    with pytest.raises(ValueError):
+        background_offset_scale.apply(
+            np.zeros((3, 3), dtype=np.uint16),
+            np.zeros((3, 3), dtype=np.uint16),
+            subtract_background=True,
+        )
+    background_offset_scale.clear_background()
+    assert not background_offset_scale.background_available
+
+
+def test_frame_statistics():
+    rng = np.random.default_rng(0)
+    frame = rng.integers(1, 1000, size=(30, 40), dtype=np.uint16)
+    frame[3, 5] = 5000
+    frame[20, 7] = 0
+    frame_statistics = FrameStatistics()
+    statistics = frame_statistics.compute(frame)
+
+    assert statistics["min_value"] == 0
+    assert (statistics["min_x"], statistics["min_y"]) == (7, 20)
+    assert statistics["max_value"] == 5000
+    assert (statistics["max_x"], statistics["max_y"]) == (5, 3)
+    assert statistics["total"] == frame.sum()
+    assert statistics["mean_value"] == pytest.approx(frame.mean())
+    assert statistics["sigma"] == pytest.approx(frame.std())
+
+    y, x = np.indices(frame.shape)
+    weights = frame.astype(np.float64) / frame.sum()
+    centroid_x = np.sum(weights * x)
+    centroid_y = np.sum(weights * y)
+    sigma_x = np.sqrt(np.sum(weights * (x - centroid_x) ** 2))
+    sigma_y = np.sqrt(np.sum(weights * (y - centroid_y) ** 2))
+    covariance_xy = np.sum(weights * (x - centroid_x) * (y - centroid_y))
+    assert statistics["centroid_x"] == pytest.approx(centroid_x)
+    assert statistics["centroid_y"] == pytest.approx(centroid_y)
+    assert statistics["sigma_x"] == pytest.approx(sigma_x)
+    assert statistics["sigma_y"] == pytest.approx(sigma_y)
+    assert statistics["sigma_xy"] == pytest.approx(covariance_xy / (sigma_x * sigma_y))
+
+    # a frame of zeros has no centroid
+    statistics = frame_statistics.compute(np.zeros_like(frame))
+    assert statistics["centroid_x"] == 0.0
+    assert "centroid_x" not in frame_statistics.compute(frame, centroid=False)
+
+
+@pytest.mark.parametrize("dtype", [np.uint16, np.float32])
+def test_frame_statistics_histogram(dtype):
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 1000, size=(30, 40)).astype(dtype)
+    counts, below, above, entropy = FrameStatistics.histogram(frame, 50, 100, 900)
+
+    expected_counts, _ = np.histogram(frame, bins=50, range=(100, 900))
+    np.testing.assert_array_equal(counts, expected_counts)
+    assert below == np.count_nonzero(frame < 100)
+    assert above == np.count_nonzero(frame > 900)
+    probabilities = expected_counts[expected_counts > 0] / expected_counts.sum()
+    assert entropy == pytest.approx(-np.sum(probabilities * np.log(probabilities)))
+
+    with pytest.raises(ValueError):
+        FrameStatistics.histogram(frame, 50, 900, 100)
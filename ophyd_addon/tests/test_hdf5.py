@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from ophyd_addon.hdf5 import DATASET_PATH, HDF5FrameWriter
+
+
+@pytest.mark.parametrize("compression", ["None", "zlib"])
+def test_hdf5_frame_writer(tmp_path, compression):
+    h5py = pytest.importorskip("h5py")
+
+    frames = np.arange(5 * 7 * 12, dtype=np.uint16).reshape((5, 7, 12))
+    hdf5_file_path = tmp_path / "frames.h5"
+    with HDF5FrameWriter(
+        hdf5_file_path,
+        frame_shape=(7, 12),
+        dtype=np.uint16,
+        frames_per_chunk=2,
+        compression=compression,
+        compression_level=4,
+    ) as hdf5_frame_writer:
+        hdf5_frame_writer.append(frames[:1])
+        hdf5_frame_writer.append(frames[1:])
+        assert hdf5_frame_writer.frame_count == 5
+    assert hdf5_frame_writer.closed
+
+    with h5py.File(hdf5_file_path, "r") as h5_file:
+        dataset = h5_file[DATASET_PATH]
+        assert dataset.chunks == (2, 7, 12)
+        assert dataset.compression == (None if compression == "None" else "gzip")
+        np.testing.assert_array_equal(dataset[()], frames)
+
+
+def test_hdf5_frame_writer_errors(tmp_path):
+    pytest.importorskip("h5py")
+
+    with pytest.raises(ValueError):
+        HDF5FrameWriter(tmp_path / "frames.h5", (7, 12), np.uint16, compression="jpeg")
+
+    hdf5_frame_writer = HDF5FrameWriter(tmp_path / "frames.h5", (7, 12), np.uint16)
+    with pytest.raises(ValueError):
+        hdf5_frame_writer.append([np.zeros((12, 7), dtype=np.uint16)])
+    assert hdf5_frame_writer.frame_count == 0
+    hdf5_frame_writer.close()
+    with pytest.raises(ValueError):
+        hdf5_frame_writer.append([np.zeros((7, 12), dtype=np.uint16)])
@@ -0,0 +1,212 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from caproto import ChannelType
+from caproto.server import PVGroup, pvproperty
+
+from ophyd_addon.ioc_util import (
+    CpuMeter,
+    LatencyHistogram,
+    LoopLagMeter,
+    PVLatencyMeter,
+    pvproperty_with_rbv,
+    rbv_settings,
+    stores_setting,
+)
+
+
+def test_loop_lag_meter():
+    latency_histogram = LatencyHistogram()
+    loop_lag_meter = LoopLagMeter(interval=0.01, latency_histogram=latency_histogram)
+    # the part of a caproto AsyncLibraryLayer LoopLagMeter uses
+    async_lib = SimpleNamespace(library=asyncio)
+
+    async def block_loop():
+        loop_lag_task = asyncio.ensure_future(loop_lag_meter.run(async_lib))
+        await asyncio.sleep(0.05)
+        # hold the event loop so the next wake up is late
+        time.sleep(0.1)
+        await asyncio.sleep(0.05)
+        loop_lag_task.cancel()
+
+    asyncio.run(block_loop())
+    assert loop_lag_meter.sample_count > 2
+    assert loop_lag_meter.max_lag > 0.05
+    assert 0 < loop_lag_meter.mean_lag < loop_lag_meter.max_lag
+    assert latency_histogram.count == loop_lag_meter.sample_count
+
+    loop_lag_meter.reset()
+    assert loop_lag_meter.sample_count == 0
+    assert loop_lag_meter.mean_lag == 0.0
+    # the histogram keeps every sample
+    assert latency_histogram.count > 2
+
+
+def test_cpu_meter():
+    cpu_meter = CpuMeter()
+    t0 = time.monotonic()
+    while time.monotonic() - t0 < 0.1:
+        pass
+    # busy waiting uses about one core
+    assert cpu_meter.sample() > 50
+    time.sleep(0.1)
+    assert cpu_meter.sample() < 50
+
+
+def test_latency_histogram():
+    latency_histogram = LatencyHistogram()
+    assert latency_histogram.quantile(0.5) == 0.0
+    for latency in (0.0, 1.5e-6, 3e-6, 3e-6, 1e-3, 1000.0):
+        latency_histogram.add(latency)
+
+    bucket_upper_bounds = LatencyHistogram.bucket_upper_bounds()
+    assert latency_histogram.counts[0] == 1
+    assert latency_histogram.counts[1] == 1
+    assert latency_histogram.counts[2] == 2
+    assert latency_histogram.counts[bucket_upper_bounds.index(2 ** 10 * 1e-6)] == 1
+    # the last bucket counts everything longer
+    assert latency_histogram.counts[-1] == 1
+    assert sum(latency_histogram.counts) == latency_histogram.count == 6
+
+    assert latency_histogram.quantile(0.5) == 4e-6
+    assert latency_histogram.quantile(1.0) == bucket_upper_bounds[-1]
+    summary = latency_histogram.summary()
+    assert summary["count"] == 6
+    assert summary["max"] == 1000.0
+    assert summary["mean"] == pytest.approx((1000.0 + 1e-3 + 7.5e-6) / 6)
+
+    merged_histogram = LatencyHistogram()
+    merged_histogram.merge(latency_histogram)
+    merged_histogram.merge(latency_histogram)
+    assert merged_histogram.count == 12
+    assert merged_histogram.counts[2] == 4
+
+    latency_histogram.reset()
+    assert latency_histogram.count == 0
+    assert sum(latency_histogram.counts) == 0
+    assert latency_histogram.max_latency == 0.0
+
+
+def test_pv_latency_meter():
+    class TimedGroup(PVGroup):
+        readback = pvproperty(value=0, dtype=ChannelType.INT, read_only=True)
+
+        @pvproperty(value=0, dtype=ChannelType.INT)
+        async def setpoint(self, instance):
+            return 1
+
+        @setpoint.putter
+        async def setpoint(self, instance, value):
+            await asyncio.sleep(0.01)
+            return value
+
+    timed_group = TimedGroup(prefix="timed:")
+    pv_latency_meter = PVLatencyMeter(timed_group.pvdb)
+    # only PVs with a getter or putter are timed
+    assert list(pv_latency_meter.get_latency) == ["timed:setpoint"]
+    assert list(pv_latency_meter.put_latency) == ["timed:setpoint"]
+
+    async def read_and_write():
+        await timed_group.setpoint.write(5)
+        await timed_group.setpoint.write(6)
+        await timed_group.setpoint.read(ChannelType.INT)
+
+    asyncio.run(read_and_write())
+    # caproto writes the value a getter returns, which calls the putter too
+    put_latency = pv_latency_meter.put_latency["timed:setpoint"]
+    assert put_latency.count == 3
+    assert put_latency.max_latency >= 0.01
+    assert pv_latency_meter.get_latency["timed:setpoint"].count == 1
+    assert pv_latency_meter.total(pv_latency_meter.put_latency).count == 3
+
+    summary = pv_latency_meter.summary()
+    assert summary["put"]["timed:setpoint"]["count"] == 3
+
+    pv_latency_meter.reset()
+    assert pv_latency_meter.summary() == {"get": {}, "put": {}}
+
+
+def test_pvproperty_with_rbv():
+    class SettingsGroup(PVGroup):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.settings = rbv_settings(self)
+
+        mode, mode_rbv = pvproperty_with_rbv(
+            name="Mode", dtype=ChannelType.ENUM, enum_strings=("Off", "On"), value="Off"
+        )
+        level, level_rbv = pvproperty_with_rbv(
+            name="Level", dtype=ChannelType.INT, value=6, lower=0, upper=9
+        )
+
+    class OnGroup(SettingsGroup):
+        mode, mode_rbv = pvproperty_with_rbv(
+            name="Mode", dtype=ChannelType.ENUM, enum_strings=("Off", "On"), value="On"
+        )
+
+    settings_group = SettingsGroup(prefix="settings:")
+    assert list(settings_group.pvdb) == [
+        "settings:Mode",
+        "settings:Mode_RBV",
+        "settings:Level",
+        "settings:Level_RBV",
+    ]
+    assert settings_group.settings.as_dict() == {"mode": "Off", "level": 6}
+    # the settings have a slot for each setpoint and nothing else
+    assert not hasattr(settings_group.settings, "__dict__")
+    with pytest.raises(AttributeError):
+        settings_group.settings.other = 1
+
+    async def write_setpoints():
+        await settings_group.mode.write("On")
+        await settings_group.level.write(9)
+        with pytest.raises(ValueError, match="Level must be from 0 to 9, not 10"):
+            await settings_group.level.write(10)
+
+    asyncio.run(write_setpoints())
+    assert settings_group.settings.as_dict() == {"mode": "On", "level": 9}
+    assert settings_group.mode_rbv.value == "On"
+    assert settings_group.level_rbv.value == 9
+
+    # a subclass overrides the initial value of a setpoint and its readback
+    on_group = OnGroup(prefix="on:")
+    assert on_group.settings.as_dict() == {"mode": "On", "level": 6}
+    assert on_group.mode_rbv.value == "On"
+    assert type(on_group.settings) is not type(settings_group.settings)
+
+
+def test_stores_setting():
+    class SettingsGroup(PVGroup):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.settings = rbv_settings(self)
+            self.binned = None
+
+        mode, mode_rbv = pvproperty_with_rbv(
+            name="Mode", dtype=ChannelType.ENUM, enum_strings=("Off", "On"), value="Off"
+        )
+        bin_x = pvproperty(name="BinX", dtype=ChannelType.INT, value=1)
+
+        @bin_x.putter
+        @stores_setting
+        async def bin_x(self, instance, value):
+            self.settings.bin_x = value
+            self.binned = value > 1
+            return value
+
+        # not marked, so it has no setting
+        other = pvproperty(name="Other", dtype=ChannelType.INT, value=0)
+
+        @other.putter
+        async def other(self, instance, value):
+            return value
+
+    settings_group = SettingsGroup(prefix="settings:")
+    assert settings_group.settings.as_dict() == {"mode": "Off", "bin_x": 1}
+
+    asyncio.run(settings_group.bin_x.write(2))
+    assert settings_group.settings.bin_x == 2
+    assert settings_group.binned
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from ophyd_addon.ndarray_pool import NDArrayPool
+
+
+def test_ndarray_pool():
+    pool = NDArrayPool(max_buffers=2, buffer_bytes=4 * 5 * 2)
+    assert pool.alloc_buffers == 2
+    assert pool.free_buffers == 2
+    assert pool.used_buffers == 0
+    assert pool.max_memory == 80
+    assert pool.used_memory == 0
+
+    ndarray_1 = pool.alloc((4, 5), np.uint16)
+    assert ndarray_1.data.shape == (4, 5)
+    assert ndarray_1.data.dtype == np.uint16
+    ndarray_2 = pool.alloc((2, 5), np.float32)
+    assert pool.free_buffers == 0
+    assert pool.used_buffers == 2
+    assert pool.used_memory == 80
+
+    # the pool is exhausted
+    assert pool.alloc((4, 5), np.uint16) is None
+
+    # the buffer is not freed until the last reference is released
+    ndarray_1.reserve()
+    ndarray_1.release()
+    assert pool.free_buffers == 0
+    ndarray_1.release()
+    assert pool.free_buffers == 1
+    with pytest.raises(RuntimeError):
+        ndarray_1.release()
+    with pytest.raises(RuntimeError):
+        ndarray_1.reserve()
+
+    # the freed buffer is reused without copying
+    ndarray_3 = pool.alloc((4, 5), np.uint16)
+    assert np.shares_memory(ndarray_3.data, ndarray_1.data)
+
+    ndarray_2.release()
+    ndarray_3.release()
+    assert pool.free_buffers == 2
+    assert pool.used_memory == 0
+
+
+def test_ndarray_pool_buffer_size():
+    pool = NDArrayPool(max_buffers=1, buffer_bytes=8)
+    with pytest.raises(ValueError):
+        pool.alloc((2, 3), np.uint16)
+    with pytest.raises(ValueError):
+        NDArrayPool(max_buffers=0, buffer_bytes=8)
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from ophyd_addon.replay_images import ReplayImageGenerator
+
+
+def test_replay_directory(tmp_path):
+    frames = np.arange(5 * 3 * 4, dtype=np.uint16).reshape((5, 3, 4))
+    # one stacked file and one single frame file, replayed in order of file name
+    np.save(tmp_path / "a.npy", frames[:4])
+    np.save(tmp_path / "b.npy", frames[4])
+    (tmp_path / "notes.txt").write_text("not a frame")
+
+    replay_image_generator = ReplayImageGenerator(tmp_path)
+    assert replay_image_generator.shape == (3, 4)
+    assert replay_image_generator.frame.dtype == np.uint16
+    assert replay_image_generator.frame_count == 5
+
+    out = np.empty((3, 4), dtype=np.uint16)
+    for frame in [*frames, *frames[:2]]:
+        assert replay_image_generator.generate(exposure=0.1, out=out) is out
+        np.testing.assert_array_equal(out, frame)
+    # without out the preallocated frame is overwritten
+    assert replay_image_generator.generate() is replay_image_generator.frame
+    np.testing.assert_array_equal(replay_image_generator.frame, frames[2])
+
+
+def test_replay_raw_file(tmp_path):
+    frames = np.arange(3 * 2 * 2, dtype=np.float32).reshape((3, 2, 2))
+    raw_path = tmp_path / "frames.raw"
+    frames.tofile(raw_path)
+
+    with pytest.raises(ValueError):
+        ReplayImageGenerator(raw_path)
+    with pytest.raises(ValueError):
+        ReplayImageGenerator(raw_path, shape=(2, 5), dtype=np.float32)
+
+    replay_image_generator = ReplayImageGenerator(raw_path, shape=(2, 2), dtype=np.float32)
+    assert replay_image_generator.frame_count == 3
+    for frame in [*frames, frames[0]]:
+        np.testing.assert_array_equal(replay_image_generator.generate(), frame)
+
+
+def test_replay_mismatched_files(tmp_path):
+    np.save(tmp_path / "a.npy", np.zeros((3, 4), dtype=np.uint16))
+    np.save(tmp_path / "b.npy", np.zeros((4, 3), dtype=np.uint16))
+    with pytest.raises(ValueError):
+        ReplayImageGenerator(tmp_path)
+
+    with pytest.raises(ValueError):
+        ReplayImageGenerator(tmp_path / "empty")
@@ -0,0 +1,45 @@
+import pytest
+
+from caproto.threading.client import Context as CaprotoThreadingClient
+
+from ophyd_addon.simulated_detector_host import (
+    detector_prefixes,
+    split_prefixes,
+    start_detector_processes,
+)
+
+
+def test_split_prefixes():
+    prefixes = detector_prefixes("Sim[det{}]", 5)
+    assert prefixes == ["Sim[det1]", "Sim[det2]", "Sim[det3]", "Sim[det4]", "Sim[det5]"]
+
+    assert split_prefixes(prefixes, 1) == [prefixes]
+    assert split_prefixes(prefixes, 2) == [prefixes[:3], prefixes[3:]]
+    assert split_prefixes(prefixes, 3) == [prefixes[:2], prefixes[2:4], prefixes[4:]]
+    # no process without detectors
+    assert split_prefixes(prefixes[:2], 3) == [prefixes[:1], prefixes[1:2]]
+
+    with pytest.raises(ValueError):
+        split_prefixes(prefixes, 0)
+
+
+def test_detector_processes():
+    prefixes = detector_prefixes("Host[det{}]", 3)
+    detector_processes = start_detector_processes(
+        split_prefixes(prefixes, 2), shape=(64, 64), report_interval=1.0
+    )
+    try:
+        assert all(detector_process.is_alive() for detector_process in detector_processes)
+        client = CaprotoThreadingClient()
+        acquire_time_pvs = client.get_pvs(
+            *(f"{prefix}:cam1:AcquireTime" for prefix in prefixes)
+        )
+        # each detector is served independently
+        for acquire_time, acquire_time_pv in enumerate(acquire_time_pvs, start=1):
+            acquire_time_pv.write(acquire_time / 10, wait=True)
+        for acquire_time, acquire_time_pv in enumerate(acquire_time_pvs, start=1):
+            assert acquire_time_pv.read().data[0] == pytest.approx(acquire_time / 10)
+    finally:
+        for detector_process in detector_processes:
+            detector_process.terminate()
+            detector_process.join()
@@ -0,0 +1,27 @@
+import numpy as np
+
+from ophyd_addon.simulated_images import DiffractionImageGenerator
+
+
+def test_diffraction_image_generator():
+    image_generator = DiffractionImageGenerator(shape=(256, 512), seed=1)
+    assert image_generator.size_x == 512
+    assert image_generator.size_y == 256
+
+    frame = image_generator.generate(exposure=1.0)
+    assert frame.shape == (256, 512)
+    assert frame.dtype == np.uint16
+
+    # the beam stop shadow is darker than the rest of the frame
+    assert frame[128, 256] < frame.mean()
+
+    # frames are rendered into the same buffer
+    next_frame = image_generator.generate(exposure=2.0)
+    assert next_frame is frame
+
+    # a longer exposure has more counts above the offset
+    dark_total = image_generator.generate(exposure=1.0, dark=True).sum(dtype=np.int64)
+    one_second_total = image_generator.generate(exposure=1.0).sum(dtype=np.int64)
+    ten_second_total = image_generator.generate(exposure=10.0).sum(dtype=np.int64)
+    assert one_second_total > dark_total
+    assert (ten_second_total - dark_total) > 5 * (one_second_total - dark_total)
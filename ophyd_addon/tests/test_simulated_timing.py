@@ -0,0 +1,70 @@
+import pytest
+
+from ophyd_addon.simulated_timing import AcquisitionTimingModel, FrameRateMeter, ImageMode
+
+
+def test_frame_count():
+    timing_model = AcquisitionTimingModel()
+    assert timing_model.frame_count(ImageMode.SINGLE, num_images=10) == 1
+    assert timing_model.frame_count(ImageMode.MULTIPLE, num_images=10) == 10
+    assert timing_model.frame_count(ImageMode.AVERAGE, num_images=10) == 10
+    # NumImages=0 still acquires one frame
+    assert timing_model.frame_count(ImageMode.MULTIPLE, num_images=0) == 1
+    assert timing_model.frame_count(ImageMode.CONTINUOUS, num_images=10) is None
+
+    with pytest.raises(ValueError):
+        timing_model.frame_count(image_mode=4, num_images=1)
+
+
+def test_acquisition_time():
+    timing_model = AcquisitionTimingModel(readout_time=0.1)
+
+    # AcquirePeriod is longer than exposure plus readout
+    assert timing_model.frame_period(acquire_time=1.0, acquire_period=2.0) == 2.0
+    assert timing_model.acquisition_time(
+        ImageMode.MULTIPLE, num_images=3, acquire_time=1.0, acquire_period=2.0
+    ) == pytest.approx(2 * 2.0 + 1.1)
+
+    # AcquirePeriod is shorter than exposure plus readout
+    assert timing_model.frame_period(acquire_time=1.0, acquire_period=0.5) == 1.1
+    assert timing_model.acquisition_time(
+        ImageMode.AVERAGE, num_images=3, acquire_time=1.0, acquire_period=0.5
+    ) == pytest.approx(3 * 1.1)
+
+    assert (
+        timing_model.acquisition_time(
+            ImageMode.CONTINUOUS, num_images=3, acquire_time=1.0, acquire_period=0.5
+        )
+        is None
+    )
+
+
+class ManualClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+
+def test_frame_rate_meter():
+    clock = ManualClock()
+    frame_rate_meter = FrameRateMeter(clock, interval=1.0)
+    assert frame_rate_meter.rate == 0.0
+
+    # 4 frames per second, the rate is updated by the frame at 1.0 seconds
+    for _ in range(3):
+        clock.now += 0.25
+        assert not frame_rate_meter.count_frame()
+    clock.now += 0.25
+    assert frame_rate_meter.count_frame()
+    assert frame_rate_meter.rate == pytest.approx(4.0)
+
+    # 2 frames per second
+    for _ in range(2):
+        clock.now += 0.5
+        frame_rate_meter.count_frame()
+    assert frame_rate_meter.rate == pytest.approx(2.0)
+
+    frame_rate_meter.reset()
+    assert frame_rate_meter.rate == 0.0
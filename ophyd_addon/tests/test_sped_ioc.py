@@ -1,32 +1,55 @@
+import asyncio
 from contextlib import contextmanager
+import json
 import multiprocessing
+import os
+import signal
 import time
 
+import numpy as np
+import pytest
+
+from bluesky import RunEngine
 from caproto.server import run
 from caproto.threading.client import Context as CaprotoThreadingClient
 
 from ophyd_addon.simulated_perkin_elmer_detector_ioc import (
     PluginBasePVGroup,
     FilePluginPVGroup,
+    FileHDF5PluginPVGroup,
+    FileTiffPluginPVGroup,
     ArrayBasePVGroup,
     SimulatedPerkinElmerDetectorIoc,
 )
-from ophyd_addon.areadetector.document_builders import NewPerkinElmerDetector
+from ophyd_addon.areadetector.codec import decode_array
+from ophyd_addon.areadetector.document_builders import (
+    NewPerkinElmerDetector,
+    NewPerkinElmerDetectorWithHDF5,
+    PerkinElmerCamera,
+)
+from ophyd_addon.codec import NO_CODEC, available_codecs
+from ophyd_addon.device_registry import connect_device
+from ophyd_addon.ndarray_pool import ND_DATA_TYPES
+from ophyd_addon.perkin_elmer_diffraction_plan import PE_COUNT_SIGNALS, pe_count
+from ophyd_addon.replay_images import ReplayImageGenerator
+from ophyd_addon.simulated_images import DiffractionImageGenerator
+from ophyd_addon.virtual_clock import ScaledClock, SimulatedClock
 
 
 @contextmanager
-def ioc_process():
+def ioc_process(prefix="Sim[det1]", **ioc_kwargs):
     # this function will run in the external process created below
     def start_ioc():
         logger = multiprocessing.get_logger()
         logger.warning("starting ioc")
 
         ioc = SimulatedPerkinElmerDetectorIoc(
-            prefix="Sim[det1]",
+            prefix=prefix,
             name="ioc",
             macros=dict(
                 camera="cam1",
             ),
+            **ioc_kwargs,
         )
         logger.warning(ioc.pvdb)
         run(ioc.pvdb, module_name="caproto.asyncio.server")
@@ -101,6 +124,26 @@ def test_pv_file_name():
         )
 
 
+def test_file_plugin_is_abstract():
+    # the TIFF and HDF5 plugins write the files
+    with pytest.raises(TypeError, match="write_image_file"):
+        FilePluginPVGroup(prefix="Sim[det1]:File1")
+
+
+def test_default_file_template():
+    # each file plugin names its files with its own extension while
+    # FileTemplate is empty
+    tiff_plugin = FileTiffPluginPVGroup(prefix="Sim[det1]:TIFF1")
+    hdf5_plugin = FileHDF5PluginPVGroup(prefix="Sim[det1]:HDF1")
+    for file_plugin in (tiff_plugin, hdf5_plugin):
+        assert file_plugin.settings.file_template == ""
+        file_plugin.settings.file_name = "frame"
+        file_plugin.settings.file_number = 7
+
+    assert tiff_plugin.get_full_file_name() == "frame_007.tif"
+    assert hdf5_plugin.get_full_file_name() == "frame_007.h5"
+
+
 def test_array_base():
     with ioc_process() as ioc:
         client = CaprotoThreadingClient()
@@ -152,3 +195,1449 @@ def test_trigger_mode():
             assert trigger_mode_readback == trigger_mode_client
             assert trigger_mode_setpoint == trigger_mode_server
             assert trigger_mode_readback == trigger_mode_server
+
+
+def test_readback_monitors():
+    """
+    Are readbacks written when the IOC starts and posted to monitors when
+    their setpoints are written?
+    """
+    with ioc_process(image_generator=DiffractionImageGenerator(shape=(64, 48))):
+        client = CaprotoThreadingClient()
+        (
+            max_size_x_rbv_pv,
+            size_y_rbv_pv,
+            proc_enable_callbacks_rbv_pv,
+            proc_nd_array_port_rbv_pv,
+            acquire_time_pv,
+            acquire_time_rbv_pv,
+            file_name_pv,
+            file_name_rbv_pv,
+            bin_x_pv,
+            size_x_rbv_pv,
+        ) = client.get_pvs(
+            "Sim[det1]:cam1:MaxSizeX_RBV",
+            "Sim[det1]:cam1:SizeY_RBV",
+            "Sim[det1]:Proc1:EnableCallbacks_RBV",
+            "Sim[det1]:Proc1:NDArrayPort_RBV",
+            "Sim[det1]:cam1:AcquireTime",
+            "Sim[det1]:cam1:AcquireTime_RBV",
+            "Sim[det1]:TIFF1:FileName",
+            "Sim[det1]:TIFF1:FileName_RBV",
+            "Sim[det1]:cam1:BinX",
+            "Sim[det1]:cam1:SizeX_RBV",
+        )
+        assert max_size_x_rbv_pv.read().data[0] == 48
+        assert size_y_rbv_pv.read().data[0] == 64
+        # Proc1 starts with EnableCallbacks=Disable and receives the camera's arrays
+        assert proc_enable_callbacks_rbv_pv.read().data[0] == 0
+        assert proc_nd_array_port_rbv_pv.read().data[0] == b"PE1"
+
+        monitored_values = {}
+
+        def monitor_callback(sub, response):
+            monitored_values.setdefault(sub.pv.name, []).append(response.data)
+
+        rbv_pvs = (acquire_time_rbv_pv, file_name_rbv_pv, size_x_rbv_pv)
+        for rbv_pv in rbv_pvs:
+            rbv_pv.subscribe().add_callback(monitor_callback)
+
+        def wait_for_monitors(update_count):
+            t0 = time.monotonic()
+            while any(
+                len(monitored_values.get(rbv_pv.name, [])) < update_count
+                for rbv_pv in rbv_pvs
+            ):
+                assert time.monotonic() - t0 < 2, monitored_values
+                time.sleep(0.05)
+
+        # the first update of a subscription is the current value
+        wait_for_monitors(1)
+        acquire_time_pv.write(0.25, wait=True)
+        file_name_pv.write("monitored", wait=True)
+        # SizeX_RBV is the 48 pixel wide sensor cut to whole bins of 5 pixels
+        bin_x_pv.write(5, wait=True)
+        # the readbacks are not read, only monitored
+        wait_for_monitors(2)
+        assert monitored_values["Sim[det1]:cam1:AcquireTime_RBV"][-1][0] == 0.25
+        assert (
+            monitored_values["Sim[det1]:TIFF1:FileName_RBV"][-1].tobytes().decode()
+            == "monitored"
+        )
+        assert monitored_values["Sim[det1]:cam1:SizeX_RBV"][-1][0] == 45
+
+
+def test_acquire_array_data():
+    with ioc_process():
+        client = CaprotoThreadingClient()
+        acquire_pv, array_data_pv, size_x_pv, size_y_pv = client.get_pvs(
+            "Sim[det1]:cam1:Acquire",
+            "Sim[det1]:cam1:ArrayData",
+            "Sim[det1]:cam1:ArraySizeX_RBV",
+            "Sim[det1]:cam1:ArraySizeY_RBV",
+        )
+
+        acquire_pv.write(ArrayBasePVGroup.Acquire.ACQUIRE, wait=True, timeout=10)
+
+        size_x = int(size_x_pv.read().data[0])
+        size_y = int(size_y_pv.read().data[0])
+        assert size_x == SimulatedPerkinElmerDetectorIoc.MAX_SIZE_X
+        assert size_y == SimulatedPerkinElmerDetectorIoc.MAX_SIZE_Y
+
+        # uint16 pixels are served as DBR_SHORT
+        array_data = array_data_pv.read(timeout=10).data.view(">u2")
+        assert len(array_data) == size_x * size_y
+        assert array_data.max() > 0
+
+
+def test_acquire_timing():
+    with ioc_process():
+        client = CaprotoThreadingClient()
+        (
+            acquire_pv,
+            acquire_time_pv,
+            acquire_period_pv,
+            image_mode_pv,
+            num_images_pv,
+            num_images_counter_pv,
+        ) = client.get_pvs(
+            "Sim[det1]:cam1:Acquire",
+            "Sim[det1]:cam1:AcquireTime",
+            "Sim[det1]:cam1:AcquirePeriod",
+            "Sim[det1]:cam1:ImageMode",
+            "Sim[det1]:cam1:NumImages",
+            "Sim[det1]:cam1:NumImagesCounter_RBV",
+        )
+        acquire_time_pv.write(0.2, wait=True)
+        acquire_period_pv.write(0.5, wait=True)
+        image_mode_pv.write(1, wait=True)  # Multiple
+        num_images_pv.write(3, wait=True)
+
+        # caproto holds only weak references to callbacks
+        counter_updates = []
+
+        def counter_callback(sub, response):
+            counter_updates.append(response.data[0])
+
+        counter_subscription = num_images_counter_pv.subscribe()
+        counter_subscription.add_callback(counter_callback)
+
+        t0 = time.monotonic()
+        acquire_pv.write(ArrayBasePVGroup.Acquire.ACQUIRE, wait=True, timeout=10)
+        acquisition_time = time.monotonic() - t0
+
+        # two periods plus one exposure and readout
+        expected_time = 2 * 0.5 + 0.2 + 0.0667
+        assert expected_time <= acquisition_time < expected_time + 0.5
+        assert num_images_counter_pv.read().data[0] == 3
+        # the last monitor can arrive after the put completes
+        deadline = time.monotonic() + 2
+        while counter_updates[-1:] != [3] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert counter_updates[-3:] == [1, 2, 3]
+
+
+def test_acquire_scaled_clock():
+    with ioc_process(clock=ScaledClock(time_scale=20)):
+        client = CaprotoThreadingClient()
+        acquire_pv, acquire_time_pv = client.get_pvs(
+            "Sim[det1]:cam1:Acquire", "Sim[det1]:cam1:AcquireTime"
+        )
+        acquire_time_pv.write(10.0, wait=True)
+
+        t0 = time.monotonic()
+        acquire_pv.write(ArrayBasePVGroup.Acquire.ACQUIRE, wait=True, timeout=10)
+        acquisition_time = time.monotonic() - t0
+
+        # 10 virtual seconds take half a real second
+        assert 0.5 <= acquisition_time < 1.5
+
+
+def test_write_file(tmp_path):
+    with ioc_process():
+        client = CaprotoThreadingClient()
+        (
+            array_callbacks_pv,
+            acquire_pv,
+            file_path_pv,
+            file_name_pv,
+            file_template_pv,
+            file_number_pv,
+            write_file_pv,
+            write_file_rbv_pv,
+            auto_increment_pv,
+            full_file_name_rbv_pv,
+            file_path_exists_rbv_pv,
+        ) = client.get_pvs(
+            "Sim[det1]:cam1:ArrayCallbacks",
+            "Sim[det1]:cam1:Acquire",
+            "Sim[det1]:TIFF1:FilePath",
+            "Sim[det1]:TIFF1:FileName",
+            "Sim[det1]:TIFF1:FileTemplate",
+            "Sim[det1]:TIFF1:FileNumber",
+            "Sim[det1]:TIFF1:WriteFile",
+            "Sim[det1]:TIFF1:WriteFile_RBV",
+            "Sim[det1]:TIFF1:AutoIncrement",
+            "Sim[det1]:TIFF1:FullFileName_RBV",
+            "Sim[det1]:TIFF1:FilePathExists_RBV",
+        )
+        array_callbacks_pv.write(ArrayBasePVGroup.ArrayCallbacks.ENABLE, wait=True)
+        file_path_pv.write(str(tmp_path / "tiff"), wait=True)
+        file_name_pv.write("frame", wait=True)
+        file_template_pv.write("%s%s_%6.6d.tiff", wait=True)
+        file_number_pv.write(7, wait=True)
+
+        acquire_pv.write(ArrayBasePVGroup.Acquire.ACQUIRE, wait=True, timeout=10)
+        # the put completes when the file has been written
+        write_file_pv.write(FilePluginPVGroup.WriteFile.WRITE, wait=True, timeout=10)
+
+        tiff_file_path = tmp_path / "tiff" / "frame_000007.tiff"
+        assert tiff_file_path.exists()
+        frame_bytes = (
+            SimulatedPerkinElmerDetectorIoc.MAX_SIZE_X
+            * SimulatedPerkinElmerDetectorIoc.MAX_SIZE_Y
+            * 2
+        )
+        assert tiff_file_path.stat().st_size > frame_bytes
+        assert write_file_rbv_pv.read().data[0] == FilePluginPVGroup.WriteFileRBV.DONE
+        assert full_file_name_rbv_pv.read().data.tobytes().decode() == str(tiff_file_path)
+        # AutoIncrement is No
+        assert file_number_pv.read().data[0] == 7
+
+        # the directory exists now
+        file_path_pv.write(str(tmp_path / "tiff"), wait=True)
+        assert file_path_exists_rbv_pv.read().data[0] == 1
+        auto_increment_pv.write(1, wait=True)  # Yes
+        write_file_pv.write(FilePluginPVGroup.WriteFile.WRITE, wait=True, timeout=10)
+        assert (tmp_path / "tiff" / "frame_000007.tiff").exists()
+        assert file_number_pv.read().data[0] == 8
+        write_file_pv.write(FilePluginPVGroup.WriteFile.WRITE, wait=True, timeout=10)
+        assert (tmp_path / "tiff" / "frame_000008.tiff").exists()
+
+
+def test_acquire_average():
+    with ioc_process():
+        client = CaprotoThreadingClient()
+        (
+            acquire_pv,
+            acquire_rbv_pv,
+            acquire_time_pv,
+            image_mode_pv,
+            image_mode_rbv_pv,
+            num_images_pv,
+            num_images_counter_pv,
+            array_data_pv,
+        ) = client.get_pvs(
+            "Sim[det1]:cam1:Acquire",
+            "Sim[det1]:cam1:Acquire_RBV",
+            "Sim[det1]:cam1:AcquireTime",
+            "Sim[det1]:cam1:ImageMode",
+            "Sim[det1]:cam1:ImageMode_RBV",
+            "Sim[det1]:cam1:NumImages",
+            "Sim[det1]:cam1:NumImagesCounter_RBV",
+            "Sim[det1]:cam1:ArrayData",
+        )
+        acquire_time_pv.write(0.1, wait=True)
+        image_mode_pv.write(3, wait=True)  # Average
+        num_images_pv.write(5, wait=True)
+
+        acquire_pv.write(ArrayBasePVGroup.Acquire.ACQUIRE, wait=True, timeout=10)
+        assert num_images_counter_pv.read().data[0] == 5
+
+        average = array_data_pv.read(timeout=10).data.view(">u2")
+        assert average.max() > 0
+        assert acquire_rbv_pv.read().data[0] == ArrayBasePVGroup.Acquire.DONE
+
+        # ImageMode is 0 to 3, the server rejects 4 without a reply
+        image_mode_pv.write(4, wait=False)
+        assert image_mode_rbv_pv.read().data[0] == 3
+        acquire_pv.write(ArrayBasePVGroup.Acquire.ACQUIRE, wait=True, timeout=10)
+        assert acquire_rbv_pv.read().data[0] == ArrayBasePVGroup.Acquire.DONE
+
+
+def test_acquire_offset():
+    with ioc_process():
+        client = CaprotoThreadingClient()
+        (
+            acquire_pv,
+            acquire_time_pv,
+            pe_acquire_offset_pv,
+            pe_acquire_offset_rbv_pv,
+            pe_num_offset_frames_pv,
+            pe_offset_available_pv,
+            pe_use_offset_pv,
+            array_data_pv,
+        ) = client.get_pvs(
+            "Sim[det1]:cam1:Acquire",
+            "Sim[det1]:cam1:AcquireTime",
+            "Sim[det1]:cam1:PEAcquireOffset",
+            "Sim[det1]:cam1:PEAcquireOffset_RBV",
+            "Sim[det1]:cam1:PENumOffsetFrames",
+            "Sim[det1]:cam1:PEOffsetAvailable",
+            "Sim[det1]:cam1:PEUseOffset",
+            "Sim[det1]:cam1:ArrayData",
+        )
+        acquire_time_pv.write(0.1, wait=True)
+        assert pe_offset_available_pv.read().data[0] == 0
+
+        pe_num_offset_frames_pv.write(3, wait=True)
+        # caproto holds only weak references to callbacks
+        pe_acquire_offset_rbv_values = []
+
+        def pe_acquire_offset_rbv_callback(sub, response):
+            pe_acquire_offset_rbv_values.append(response.data[0])
+
+        subscription = pe_acquire_offset_rbv_pv.subscribe()
+        subscription.add_callback(pe_acquire_offset_rbv_callback)
+        pe_acquire_offset_pv.write(1, wait=True, timeout=10)
+        assert pe_offset_available_pv.read().data[0] == 1
+        # PEAcquireOffset_RBV is Acquire while the dark frames are taken
+        deadline = time.monotonic() + 5
+        while pe_acquire_offset_rbv_values[-2:] != [1, 0] and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert pe_acquire_offset_rbv_values[-2:] == [1, 0]
+        subscription.clear()
+        dark = array_data_pv.read(timeout=10).data.view(">u2").astype(int)
+        assert dark.min() > 0
+
+        pe_use_offset_pv.write(1, wait=True)
+        acquire_pv.write(ArrayBasePVGroup.Acquire.ACQUIRE, wait=True, timeout=10)
+        corrected = array_data_pv.read(timeout=10).data.view(">u2").astype(int)
+        # the offset level is gone, leaving the diffraction signal
+        assert corrected.mean() < dark.mean()
+        assert corrected.max() > 0
+
+
+def test_gain_and_pixel_correction(tmp_path):
+    frame_shape = (
+        SimulatedPerkinElmerDetectorIoc.MAX_SIZE_Y,
+        SimulatedPerkinElmerDetectorIoc.MAX_SIZE_X,
+    )
+    gain_file_path = tmp_path / "gain.npy"
+    np.save(gain_file_path, np.ones(frame_shape, dtype=np.float32))
+    pixel_correction_map = np.zeros(frame_shape, dtype=np.uint8)
+    pixel_correction_map[0, 0] = 1
+    pixel_correction_file_path = tmp_path / "pixel_correction.npy"
+    np.save(pixel_correction_file_path, pixel_correction_map)
+    wrong_size_file_path = tmp_path / "wrong_size.npy"
+    np.save(wrong_size_file_path, np.ones((16, 16), dtype=np.float32))
+
+    with ioc_process():
+        client = CaprotoThreadingClient()
+        (
+            acquire_pv,
+            acquire_time_pv,
+            gain_file_pv,
+            load_gain_file_pv,
+            gain_available_pv,
+            use_gain_pv,
+            pixel_correction_file_pv,
+            load_pixel_correction_pv,
+            pixel_correction_available_pv,
+            use_pixel_correction_pv,
+            array_data_pv,
+        ) = client.get_pvs(
+            "Sim[det1]:cam1:Acquire",
+            "Sim[det1]:cam1:AcquireTime",
+            "Sim[det1]:cam1:PEGainFile",
+            "Sim[det1]:cam1:PELoadGainFile",
+            "Sim[det1]:cam1:PEGainAvailable",
+            "Sim[det1]:cam1:PEUseGain",
+            "Sim[det1]:cam1:PEPixelCorrectionFile",
+            "Sim[det1]:cam1:PELoadPixelCorrection",
+            "Sim[det1]:cam1:PEPixelCorrectionAvailable",
+            "Sim[det1]:cam1:PEUsePixelCorrection",
+            "Sim[det1]:cam1:ArrayData",
+        )
+        acquire_time_pv.write(0.1, wait=True)
+        assert gain_available_pv.read().data[0] == 0
+        assert pixel_correction_available_pv.read().data[0] == 0
+
+        gain_file_pv.write(str(gain_file_path), wait=True)
+        load_gain_file_pv.write(1, wait=True, timeout=10)
+        assert gain_available_pv.read().data[0] == 1
+        pixel_correction_file_pv.write(str(pixel_correction_file_path), wait=True)
+        load_pixel_correction_pv.write(1, wait=True, timeout=10)
+        assert pixel_correction_available_pv.read().data[0] == 1
+
+        # maps that are not the size of the sensor are rejected without a
+        # reply and the maps loaded before are kept
+        gain_file_pv.write(str(wrong_size_file_path), wait=True)
+        load_gain_file_pv.write(1, wait=False)
+        pixel_correction_file_pv.write(str(wrong_size_file_path), wait=True)
+        load_pixel_correction_pv.write(1, wait=False)
+        time.sleep(1)
+        assert gain_available_pv.read().data[0] == 1
+        assert pixel_correction_available_pv.read().data[0] == 1
+
+        use_gain_pv.write(1, wait=True)
+        use_pixel_correction_pv.write(1, wait=True)
+        acquire_pv.write(ArrayBasePVGroup.Acquire.ACQUIRE, wait=True, timeout=10)
+        frame = array_data_pv.read(timeout=10).data.view(">u2").reshape(frame_shape)
+        # the bad corner pixel is the mean of its 3 neighbours
+        neighbour_mean = (int(frame[0, 1]) + int(frame[1, 0]) + int(frame[1, 1])) / 3
+        assert abs(int(frame[0, 0]) - neighbour_mean) <= 0.5
+
+
+def test_acquire_continuous():
+    with ioc_process(image_generator=DiffractionImageGenerator(shape=(64, 64))):
+        client = CaprotoThreadingClient()
+        (
+            acquire_pv,
+            acquire_time_pv,
+            acquire_period_pv,
+            trigger_mode_pv,
+            array_counter_rbv_pv,
+            array_rate_rbv_pv,
+            dropped_frames_rbv_pv,
+        ) = client.get_pvs(
+            "Sim[det1]:cam1:Acquire",
+            "Sim[det1]:cam1:AcquireTime",
+            "Sim[det1]:cam1:AcquirePeriod",
+            "Sim[det1]:cam1:TriggerMode",
+            "Sim[det1]:cam1:ArrayCounter_RBV",
+            "Sim[det1]:cam1:ArrayRate_RBV",
+            "Sim[det1]:cam1:DroppedFrames_RBV",
+        )
+        acquire_time_pv.write(0.05, wait=True)
+        # exposure and readout take about 0.12 seconds
+        acquire_period_pv.write(0.2, wait=True)
+        trigger_mode_pv.write(SimulatedPerkinElmerDetectorIoc.TriggerMode.FREE_RUNNING, wait=True)
+
+        acquire_pv.write(ArrayBasePVGroup.Acquire.ACQUIRE, wait=False)
+        time.sleep(2.5)
+        array_rate = array_rate_rbv_pv.read().data[0]
+        assert array_rate == pytest.approx(5.0, rel=0.2)
+        acquire_pv.write(ArrayBasePVGroup.Acquire.DONE, wait=True, timeout=10)
+
+        array_counter = array_counter_rbv_pv.read().data[0]
+        dropped_frames = dropped_frames_rbv_pv.read().data[0]
+        # about 12 frames were exposed in 2.5 seconds
+        assert 8 <= array_counter + dropped_frames <= 15
+        # the rate is 0 when the detector is not acquiring
+        assert array_rate_rbv_pv.read().data[0] == 0.0
+
+
+def test_ndarray_pool():
+    with ioc_process(
+        image_generator=DiffractionImageGenerator(shape=(64, 64)), pool_max_buffers=1
+    ):
+        client = CaprotoThreadingClient()
+        (
+            acquire_pv,
+            acquire_time_pv,
+            image_mode_pv,
+            num_images_pv,
+            array_counter_rbv_pv,
+            dropped_frames_rbv_pv,
+            pool_max_buffers_pv,
+            pool_free_buffers_pv,
+            pool_used_buffers_pv,
+            pool_max_mem_pv,
+            pool_used_mem_pv,
+        ) = client.get_pvs(
+            "Sim[det1]:cam1:Acquire",
+            "Sim[det1]:cam1:AcquireTime",
+            "Sim[det1]:cam1:ImageMode",
+            "Sim[det1]:cam1:NumImages",
+            "Sim[det1]:cam1:ArrayCounter_RBV",
+            "Sim[det1]:cam1:DroppedFrames_RBV",
+            "Sim[det1]:cam1:PoolMaxBuffers",
+            "Sim[det1]:cam1:PoolFreeBuffers",
+            "Sim[det1]:cam1:PoolUsedBuffers",
+            "Sim[det1]:cam1:PoolMaxMem",
+            "Sim[det1]:cam1:PoolUsedMem",
+        )
+        assert pool_max_buffers_pv.read().data[0] == 1
+        assert pool_free_buffers_pv.read().data[0] == 1
+        assert pool_max_mem_pv.read().data[0] == pytest.approx(64 * 64 * 2 / 2**20)
+        assert pool_used_mem_pv.read().data[0] == 0.0
+
+        # the pool statistics are posted to monitors as frames use the pool
+        monitored_values = {}
+
+        def monitor_callback(sub, response):
+            monitored_values[sub.pv.name] = response.data[0]
+
+        pool_pvs = (pool_free_buffers_pv, pool_used_buffers_pv, pool_used_mem_pv)
+        for pool_pv in pool_pvs:
+            pool_pv.subscribe().add_callback(monitor_callback)
+
+        acquire_time_pv.write(0.01, wait=True)
+        image_mode_pv.write(1, wait=True)  # Multiple
+        num_images_pv.write(3, wait=True)
+        acquire_pv.write(ArrayBasePVGroup.Acquire.ACQUIRE, wait=True, timeout=10)
+
+        # ArrayData holds the only buffer so the next two frames are dropped
+        assert array_counter_rbv_pv.read().data[0] == 1
+        assert dropped_frames_rbv_pv.read().data[0] == 2
+        expected_values = {
+            "Sim[det1]:cam1:PoolFreeBuffers": 0,
+            "Sim[det1]:cam1:PoolUsedBuffers": 1,
+            "Sim[det1]:cam1:PoolUsedMem": pytest.approx(64 * 64 * 2 / 2**20),
+        }
+        t0 = time.monotonic()
+        while monitored_values != expected_values:
+            assert time.monotonic() - t0 < 2, monitored_values
+            time.sleep(0.05)
+
+
+def test_capture_and_stream(tmp_path):
+    with ioc_process(image_generator=DiffractionImageGenerator(shape=(64, 64))):
+        client = CaprotoThreadingClient()
+        (
+            array_callbacks_pv,
+            acquire_pv,
+            acquire_time_pv,
+            image_mode_pv,
+            num_images_pv,
+            file_path_pv,
+            file_name_pv,
+            file_template_pv,
+            file_number_pv,
+            file_write_mode_pv,
+            auto_increment_pv,
+            num_capture_pv,
+            num_captured_rbv_pv,
+            capture_pv,
+            capture_rbv_pv,
+        ) = client.get_pvs(
+            "Sim[det1]:cam1:ArrayCallbacks",
+            "Sim[det1]:cam1:Acquire",
+            "Sim[det1]:cam1:AcquireTime",
+            "Sim[det1]:cam1:ImageMode",
+            "Sim[det1]:cam1:NumImages",
+            "Sim[det1]:TIFF1:FilePath",
+            "Sim[det1]:TIFF1:FileName",
+            "Sim[det1]:TIFF1:FileTemplate",
+            "Sim[det1]:TIFF1:FileNumber",
+            "Sim[det1]:TIFF1:FileWriteMode",
+            "Sim[det1]:TIFF1:AutoIncrement",
+            "Sim[det1]:TIFF1:NumCapture",
+            "Sim[det1]:TIFF1:NumCaptured_RBV",
+            "Sim[det1]:TIFF1:Capture",
+            "Sim[det1]:TIFF1:Capture_RBV",
+        )
+        array_callbacks_pv.write(ArrayBasePVGroup.ArrayCallbacks.ENABLE, wait=True)
+        # files are written before Acquire completes, as ophyd stages plugins
+        (blocking_callbacks_pv,) = client.get_pvs("Sim[det1]:TIFF1:BlockingCallbacks")
+        blocking_callbacks_pv.write(1, wait=True)  # Yes
+        acquire_time_pv.write(0.01, wait=True)
+        image_mode_pv.write(1, wait=True)  # Multiple
+        num_images_pv.write(3, wait=True)
+        file_template_pv.write("%s%s_%3.3d.tiff", wait=True)
+        file_number_pv.write(1, wait=True)
+        auto_increment_pv.write(1, wait=True)  # Yes
+
+        # Capture buffers 3 frames and writes them when the third arrives
+        file_path_pv.write(str(tmp_path / "capture"), wait=True)
+        file_name_pv.write("capture", wait=True)
+        file_write_mode_pv.write(1, wait=True)  # Capture
+        num_capture_pv.write(3, wait=True)
+        capture_pv.write(1, wait=True)
+        assert capture_rbv_pv.read(data_type="native").data[0] == 1
+        acquire_pv.write(ArrayBasePVGroup.Acquire.ACQUIRE, wait=True, timeout=10)
+
+        assert sorted(path.name for path in (tmp_path / "capture").iterdir()) == [
+            "capture_001.tiff",
+            "capture_002.tiff",
+            "capture_003.tiff",
+        ]
+        assert num_captured_rbv_pv.read().data[0] == 3
+        assert capture_rbv_pv.read(data_type="native").data[0] == 0
+        assert file_number_pv.read().data[0] == 4
+
+        # Stream writes the first 2 of 3 frames as they arrive
+        file_path_pv.write(str(tmp_path / "stream"), wait=True)
+        file_name_pv.write("stream", wait=True)
+        file_write_mode_pv.write(2, wait=True)  # Stream
+        num_capture_pv.write(2, wait=True)
+        capture_pv.write(1, wait=True)
+        acquire_pv.write(ArrayBasePVGroup.Acquire.ACQUIRE, wait=True, timeout=10)
+
+        assert sorted(path.name for path in (tmp_path / "stream").iterdir()) == [
+            "stream_004.tiff",
+            "stream_005.tiff",
+        ]
+        assert num_captured_rbv_pv.read().data[0] == 2
+        assert capture_rbv_pv.read(data_type="native").data[0] == 0
+
+
+def test_hdf5_capture_and_stream(tmp_path):
+    h5py = pytest.importorskip("h5py")
+
+    with ioc_process(image_generator=DiffractionImageGenerator(shape=(64, 64))):
+        client = CaprotoThreadingClient()
+        (
+            array_callbacks_pv,
+            acquire_pv,
+            acquire_time_pv,
+            image_mode_pv,
+            num_images_pv,
+            file_path_pv,
+            file_name_pv,
+            file_template_pv,
+            file_number_pv,
+            file_write_mode_pv,
+            auto_increment_pv,
+            num_capture_pv,
+            capture_pv,
+            compression_pv,
+            num_frames_chunks_pv,
+            full_file_name_rbv_pv,
+        ) = client.get_pvs(
+            "Sim[det1]:cam1:ArrayCallbacks",
+            "Sim[det1]:cam1:Acquire",
+            "Sim[det1]:cam1:AcquireTime",
+            "Sim[det1]:cam1:ImageMode",
+            "Sim[det1]:cam1:NumImages",
+            "Sim[det1]:HDF1:FilePath",
+            "Sim[det1]:HDF1:FileName",
+            "Sim[det1]:HDF1:FileTemplate",
+            "Sim[det1]:HDF1:FileNumber",
+            "Sim[det1]:HDF1:FileWriteMode",
+            "Sim[det1]:HDF1:AutoIncrement",
+            "Sim[det1]:HDF1:NumCapture",
+            "Sim[det1]:HDF1:Capture",
+            "Sim[det1]:HDF1:Compression",
+            "Sim[det1]:HDF1:NumFramesChunks",
+            "Sim[det1]:HDF1:FullFileName_RBV",
+        )
+        array_callbacks_pv.write(ArrayBasePVGroup.ArrayCallbacks.ENABLE, wait=True)
+        # files are written before Acquire completes, as ophyd stages plugins
+        (blocking_callbacks_pv,) = client.get_pvs("Sim[det1]:HDF1:BlockingCallbacks")
+        blocking_callbacks_pv.write(1, wait=True)  # Yes
+        acquire_time_pv.write(0.01, wait=True)
+        image_mode_pv.write(1, wait=True)  # Multiple
+        num_images_pv.write(3, wait=True)
+        file_path_pv.write(str(tmp_path), wait=True)
+        file_template_pv.write("%s%s_%3.3d.h5", wait=True)
+        file_number_pv.write(1, wait=True)
+        auto_increment_pv.write(1, wait=True)  # Yes
+        compression_pv.write(1, wait=True)  # zlib
+        num_frames_chunks_pv.write(2, wait=True)
+
+        # Stream appends the frames of two acquisitions to one file, which is
+        # closed when Capture=0 ends the capture
+        file_name_pv.write("stream", wait=True)
+        file_write_mode_pv.write(2, wait=True)  # Stream
+        num_capture_pv.write(0, wait=True)
+        capture_pv.write(1, wait=True)
+        acquire_pv.write(ArrayBasePVGroup.Acquire.ACQUIRE, wait=True, timeout=10)
+        acquire_pv.write(ArrayBasePVGroup.Acquire.ACQUIRE, wait=True, timeout=10)
+        capture_pv.write(0, wait=True)
+
+        stream_file_path = tmp_path / "stream_001.h5"
+        assert full_file_name_rbv_pv.read().data.tobytes().decode() == str(stream_file_path)
+        assert file_number_pv.read().data[0] == 2
+        with h5py.File(stream_file_path, "r") as h5_file:
+            dataset = h5_file["/entry/data/data"]
+            assert dataset.shape == (6, 64, 64)
+            assert dataset.dtype == np.uint16
+            assert dataset.chunks == (2, 64, 64)
+            assert dataset.compression == "gzip"
+
+        # Capture writes NumCapture frames to one file when the capture completes
+        file_name_pv.write("capture", wait=True)
+        file_write_mode_pv.write(1, wait=True)  # Capture
+        num_capture_pv.write(3, wait=True)
+        capture_pv.write(1, wait=True)
+        acquire_pv.write(ArrayBasePVGroup.Acquire.ACQUIRE, wait=True, timeout=10)
+
+        with h5py.File(tmp_path / "capture_002.h5", "r") as h5_file:
+            assert h5_file["/entry/data/data"].shape == (3, 64, 64)
+        assert sorted(path.name for path in tmp_path.iterdir()) == [
+            "capture_002.h5",
+            "stream_001.h5",
+        ]
+
+
+def test_readout_region():
+    with ioc_process(image_generator=DiffractionImageGenerator(shape=(64, 64))):
+        client = CaprotoThreadingClient()
+        (
+            acquire_pv,
+            acquire_time_pv,
+            array_data_pv,
+            array_size_x_pv,
+            array_size_y_pv,
+            max_size_x_pv,
+            min_x_pv,
+            min_x_rbv_pv,
+            size_x_pv,
+            size_x_rbv_pv,
+            size_y_pv,
+            bin_x_pv,
+            bin_y_pv,
+            bin_y_rbv_pv,
+            reverse_y_pv,
+            reverse_y_rbv_pv,
+        ) = client.get_pvs(
+            "Sim[det1]:cam1:Acquire",
+            "Sim[det1]:cam1:AcquireTime",
+            "Sim[det1]:cam1:ArrayData",
+            "Sim[det1]:cam1:ArraySizeX_RBV",
+            "Sim[det1]:cam1:ArraySizeY_RBV",
+            "Sim[det1]:cam1:MaxSizeX_RBV",
+            "Sim[det1]:cam1:MinX",
+            "Sim[det1]:cam1:MinX_RBV",
+            "Sim[det1]:cam1:SizeX",
+            "Sim[det1]:cam1:SizeX_RBV",
+            "Sim[det1]:cam1:SizeY",
+            "Sim[det1]:cam1:BinX",
+            "Sim[det1]:cam1:BinY",
+            "Sim[det1]:cam1:BinY_RBV",
+            "Sim[det1]:cam1:ReverseY",
+            "Sim[det1]:cam1:ReverseY_RBV",
+        )
+        acquire_time_pv.write(0.01, wait=True)
+
+        def acquire_array():
+            acquire_pv.write(ArrayBasePVGroup.Acquire.ACQUIRE, wait=True, timeout=10)
+            size_x = array_size_x_pv.read().data[0]
+            size_y = array_size_y_pv.read().data[0]
+            array_data = array_data_pv.read(timeout=10).data.view(">u2")
+            assert len(array_data) == size_x * size_y
+            return array_data.reshape((size_y, size_x))
+
+        assert max_size_x_pv.read().data[0] == 64
+        assert size_x_pv.read().data[0] == 64
+        full_frame = acquire_array()
+        assert full_frame.shape == (64, 64)
+
+        # the region is clamped to the sensor
+        min_x_pv.write(40, wait=True)
+        size_x_pv.write(32, wait=True)
+        assert min_x_rbv_pv.read().data[0] == 40
+        assert size_x_rbv_pv.read().data[0] == 24
+        size_y_pv.write(16, wait=True)
+        reverse_y_pv.write(1, wait=True)
+        assert reverse_y_rbv_pv.read().data[0] == 1
+        assert acquire_array().shape == (16, 24)
+
+        # sizes are cut to whole bins and pixels are summed
+        min_x_pv.write(0, wait=True)
+        size_x_pv.write(64, wait=True)
+        size_y_pv.write(64, wait=True)
+        bin_x_pv.write(2, wait=True)
+        bin_y_pv.write(3, wait=True)
+        assert bin_y_rbv_pv.read().data[0] == 3
+        binned_frame = acquire_array()
+        assert binned_frame.shape == (21, 32)
+        assert binned_frame.mean() == pytest.approx(6 * full_frame.mean(), rel=0.2)
+
+
+def test_data_type():
+    with ioc_process(image_generator=DiffractionImageGenerator(shape=(64, 64))):
+        client = CaprotoThreadingClient()
+        (
+            acquire_pv,
+            acquire_time_pv,
+            array_size_pv,
+            data_type_pv,
+            data_type_rbv_pv,
+            color_mode_pv,
+            color_mode_rbv_pv,
+            pool_max_buffers_pv,
+        ) = client.get_pvs(
+            "Sim[det1]:cam1:Acquire",
+            "Sim[det1]:cam1:AcquireTime",
+            "Sim[det1]:cam1:ArraySize_RBV",
+            "Sim[det1]:cam1:DataType",
+            "Sim[det1]:cam1:DataType_RBV",
+            "Sim[det1]:cam1:ColorMode",
+            "Sim[det1]:cam1:ColorMode_RBV",
+            "Sim[det1]:cam1:PoolMaxBuffers",
+        )
+        acquire_time_pv.write(0.01, wait=True)
+        assert data_type_rbv_pv.read().data[0] == 3
+        assert color_mode_rbv_pv.read().data[0] == 0
+        pool_max_buffers = pool_max_buffers_pv.read().data[0]
+
+        def acquire_array():
+            acquire_pv.write(ArrayBasePVGroup.Acquire.ACQUIRE, wait=True, timeout=10)
+            # a new connection sees the native type of the frame
+            (array_data_pv,) = CaprotoThreadingClient().get_pvs("Sim[det1]:cam1:ArrayData")
+            return array_data_pv.read(timeout=10).data
+
+        uint16_frame = acquire_array()
+        assert uint16_frame.dtype == np.dtype(">i2")
+        assert array_size_pv.read().data[0] == 64 * 64 * 2
+
+        # Float32
+        data_type_pv.write(8, wait=True)
+        assert data_type_rbv_pv.read().data[0] == 8
+        # a pool of Float32 buffers is preallocated
+        assert pool_max_buffers_pv.read().data[0] == 2 * pool_max_buffers
+        float32_frame = acquire_array()
+        assert float32_frame.dtype == np.dtype(">f4")
+        assert array_size_pv.read().data[0] == 64 * 64 * 4
+        assert np.all(float32_frame == np.rint(float32_frame))
+        assert float32_frame.mean() == pytest.approx(uint16_frame.mean(), rel=0.2)
+
+        # Int32
+        data_type_pv.write(4, wait=True)
+        assert acquire_array().dtype == np.dtype(">i4")
+
+        # Int8 and RGB1 are not supported, the server rejects them without a reply
+        data_type_pv.write(0, wait=False)
+        assert data_type_rbv_pv.read().data[0] == 4
+        color_mode_pv.write(2, wait=False)
+        assert color_mode_rbv_pv.read().data[0] == 0
+
+
+def test_plugin_queue(tmp_path):
+    h5py = pytest.importorskip("h5py")
+
+    # the simulated clock reads frames out as fast as the IOC can, faster
+    # than the HDF5 plugin compresses them
+    with ioc_process(
+        image_generator=DiffractionImageGenerator(shape=(512, 512)), clock=SimulatedClock()
+    ):
+        client = CaprotoThreadingClient()
+        (
+            array_callbacks_pv,
+            acquire_pv,
+            image_mode_pv,
+            num_images_pv,
+            file_path_pv,
+            file_name_pv,
+            file_write_mode_pv,
+            auto_increment_pv,
+            compression_pv,
+            z_level_pv,
+            num_capture_pv,
+            num_captured_rbv_pv,
+            capture_pv,
+            full_file_name_rbv_pv,
+            blocking_callbacks_pv,
+            queue_size_pv,
+            queue_free_pv,
+            dropped_arrays_pv,
+            dropped_arrays_rbv_pv,
+        ) = client.get_pvs(
+            "Sim[det1]:cam1:ArrayCallbacks",
+            "Sim[det1]:cam1:Acquire",
+            "Sim[det1]:cam1:ImageMode",
+            "Sim[det1]:cam1:NumImages",
+            "Sim[det1]:HDF1:FilePath",
+            "Sim[det1]:HDF1:FileName",
+            "Sim[det1]:HDF1:FileWriteMode",
+            "Sim[det1]:HDF1:AutoIncrement",
+            "Sim[det1]:HDF1:Compression",
+            "Sim[det1]:HDF1:ZLevel",
+            "Sim[det1]:HDF1:NumCapture",
+            "Sim[det1]:HDF1:NumCaptured_RBV",
+            "Sim[det1]:HDF1:Capture",
+            "Sim[det1]:HDF1:FullFileName_RBV",
+            "Sim[det1]:HDF1:BlockingCallbacks",
+            "Sim[det1]:HDF1:QueueSize",
+            "Sim[det1]:HDF1:QueueFree",
+            "Sim[det1]:HDF1:DroppedArrays",
+            "Sim[det1]:HDF1:DroppedArrays_RBV",
+        )
+        array_callbacks_pv.write(ArrayBasePVGroup.ArrayCallbacks.ENABLE, wait=True)
+        image_mode_pv.write(1, wait=True)  # Multiple
+        num_images_pv.write(20, wait=True)
+        file_path_pv.write(str(tmp_path), wait=True)
+        file_name_pv.write("stream", wait=True)
+        file_write_mode_pv.write(2, wait=True)  # Stream
+        auto_increment_pv.write(1, wait=True)  # Yes
+        compression_pv.write(1, wait=True)  # zlib
+        z_level_pv.write(9, wait=True)
+        num_capture_pv.write(0, wait=True)
+
+        assert blocking_callbacks_pv.read().data[0] == 0  # No
+        assert queue_size_pv.read().data[0] == PluginBasePVGroup.DEFAULT_QUEUE_SIZE
+        queue_size_pv.write(2, wait=True)
+        assert queue_free_pv.read().data[0] == 2
+
+        def stream_frames():
+            capture_pv.write(1, wait=True)
+            acquire_pv.write(ArrayBasePVGroup.Acquire.ACQUIRE, wait=True, timeout=10)
+            # the plugin catches up after the acquisition
+            deadline = time.monotonic() + 10
+            while queue_free_pv.read().data[0] < 2:
+                assert time.monotonic() < deadline
+                time.sleep(0.05)
+            capture_pv.write(0, wait=True, timeout=10)
+            return num_captured_rbv_pv.read().data[0], dropped_arrays_rbv_pv.read().data[0]
+
+        # frames that arrive while the queue is full are dropped
+        num_captured, dropped_arrays = stream_frames()
+        assert dropped_arrays > 0
+        assert num_captured + dropped_arrays == 20
+        full_file_name = full_file_name_rbv_pv.read().data.tobytes().decode()
+        with h5py.File(full_file_name, "r") as h5_file:
+            assert h5_file["/entry/data/data"].shape[0] == num_captured
+
+        dropped_arrays_pv.write(0, wait=True)
+        assert dropped_arrays_rbv_pv.read().data[0] == 0
+
+        # with BlockingCallbacks=Yes the camera waits for the plugin
+        blocking_callbacks_pv.write(1, wait=True)
+        assert stream_frames() == (20, 0)
+
+
+def test_plugin_chain(tmp_path):
+    tifffile = pytest.importorskip("tifffile")
+
+    with ioc_process(image_generator=DiffractionImageGenerator(shape=(64, 64))):
+        client = CaprotoThreadingClient()
+        (
+            array_callbacks_pv,
+            acquire_pv,
+            acquire_time_pv,
+            array_data_pv,
+            cam_port_name_pv,
+            proc_enable_callbacks_pv,
+            proc_blocking_callbacks_pv,
+            proc_nd_array_port_pv,
+            proc_nd_array_port_rbv_pv,
+            proc_enable_offset_scale_pv,
+            proc_scale_pv,
+            proc_offset_pv,
+            tiff_blocking_callbacks_pv,
+            tiff_nd_array_port_pv,
+            tiff_nd_array_port_rbv_pv,
+            tiff_array_counter_rbv_pv,
+            tiff_file_path_pv,
+            tiff_file_name_pv,
+            tiff_write_file_pv,
+            tiff_full_file_name_rbv_pv,
+            hdf5_array_counter_rbv_pv,
+        ) = client.get_pvs(
+            "Sim[det1]:cam1:ArrayCallbacks",
+            "Sim[det1]:cam1:Acquire",
+            "Sim[det1]:cam1:AcquireTime",
+            "Sim[det1]:cam1:ArrayData",
+            "Sim[det1]:cam1:PortName_RBV",
+            "Sim[det1]:Proc1:EnableCallbacks",
+            "Sim[det1]:Proc1:BlockingCallbacks",
+            "Sim[det1]:Proc1:NDArrayPort",
+            "Sim[det1]:Proc1:NDArrayPort_RBV",
+            "Sim[det1]:Proc1:EnableOffsetScale",
+            "Sim[det1]:Proc1:Scale",
+            "Sim[det1]:Proc1:Offset",
+            "Sim[det1]:TIFF1:BlockingCallbacks",
+            "Sim[det1]:TIFF1:NDArrayPort",
+            "Sim[det1]:TIFF1:NDArrayPort_RBV",
+            "Sim[det1]:TIFF1:ArrayCounter_RBV",
+            "Sim[det1]:TIFF1:FilePath",
+            "Sim[det1]:TIFF1:FileName",
+            "Sim[det1]:TIFF1:WriteFile",
+            "Sim[det1]:TIFF1:FullFileName_RBV",
+            "Sim[det1]:HDF1:ArrayCounter_RBV",
+        )
+        # every plugin receives the camera's arrays until NDArrayPort is written
+        assert cam_port_name_pv.read().data[0] == b"PE1"
+        assert tiff_nd_array_port_rbv_pv.read().data[0] == b"PE1"
+        assert proc_nd_array_port_rbv_pv.read().data[0] == b"PE1"
+
+        # cam -> Proc1 -> TIFF1 and cam -> HDF1
+        array_callbacks_pv.write(ArrayBasePVGroup.ArrayCallbacks.ENABLE, wait=True)
+        acquire_time_pv.write(0.01, wait=True)
+        proc_enable_callbacks_pv.write(1, wait=True)
+        proc_blocking_callbacks_pv.write(1, wait=True)
+        proc_enable_offset_scale_pv.write(1, wait=True)
+        proc_scale_pv.write(2.0, wait=True)
+        proc_offset_pv.write(10.0, wait=True)
+        tiff_blocking_callbacks_pv.write(1, wait=True)
+        tiff_nd_array_port_pv.write("PROC1", wait=True)
+        assert tiff_nd_array_port_rbv_pv.read().data[0] == b"PROC1"
+
+        # Proc1 can not receive the arrays of the TIFF1 plugin it feeds,
+        # the server rejects the write without a reply
+        proc_nd_array_port_pv.write("FileTIFF1", wait=False)
+        assert proc_nd_array_port_rbv_pv.read().data[0] == b"PE1"
+
+        acquire_pv.write(ArrayBasePVGroup.Acquire.ACQUIRE, wait=True, timeout=10)
+        frame = array_data_pv.read(timeout=10).data.view(">u2").reshape((64, 64))
+        assert tiff_array_counter_rbv_pv.read().data[0] == 1
+        assert hdf5_array_counter_rbv_pv.read().data[0] == 1
+
+        tiff_file_path_pv.write(str(tmp_path), wait=True)
+        tiff_file_name_pv.write("processed", wait=True)
+        tiff_write_file_pv.write(FilePluginPVGroup.WriteFile.WRITE, wait=True, timeout=10)
+        full_file_name = tiff_full_file_name_rbv_pv.read().data.tobytes().decode()
+        processed_frame = tifffile.imread(full_file_name)
+        # the camera frame is not changed by Proc1
+        np.testing.assert_array_equal(
+            processed_frame, np.minimum(frame.astype(np.uint32) * 2 + 10, 65535)
+        )
+
+
+def test_stats_plugin():
+    with ioc_process(image_generator=DiffractionImageGenerator(shape=(64, 64))):
+        client = CaprotoThreadingClient()
+        (
+            array_callbacks_pv,
+            acquire_pv,
+            acquire_time_pv,
+            array_data_pv,
+            stats_plugin_type_rbv_pv,
+            stats_enable_callbacks_pv,
+            stats_blocking_callbacks_pv,
+            stats_compute_histogram_pv,
+            stats_hist_size_pv,
+            stats_hist_min_pv,
+            stats_hist_max_pv,
+            stats_array_counter_rbv_pv,
+            stats_min_value_rbv_pv,
+            stats_max_value_rbv_pv,
+            stats_max_x_rbv_pv,
+            stats_max_y_rbv_pv,
+            stats_mean_value_rbv_pv,
+            stats_sigma_rbv_pv,
+            stats_total_rbv_pv,
+            stats_centroid_x_rbv_pv,
+            stats_centroid_y_rbv_pv,
+            stats_histogram_rbv_pv,
+            stats_hist_below_rbv_pv,
+        ) = client.get_pvs(
+            "Sim[det1]:cam1:ArrayCallbacks",
+            "Sim[det1]:cam1:Acquire",
+            "Sim[det1]:cam1:AcquireTime",
+            "Sim[det1]:cam1:ArrayData",
+            "Sim[det1]:Stats1:PluginType_RBV",
+            "Sim[det1]:Stats1:EnableCallbacks",
+            "Sim[det1]:Stats1:BlockingCallbacks",
+            "Sim[det1]:Stats1:ComputeHistogram",
+            "Sim[det1]:Stats1:HistSize",
+            "Sim[det1]:Stats1:HistMin",
+            "Sim[det1]:Stats1:HistMax",
+            "Sim[det1]:Stats1:ArrayCounter_RBV",
+            "Sim[det1]:Stats1:MinValue_RBV",
+            "Sim[det1]:Stats1:MaxValue_RBV",
+            "Sim[det1]:Stats1:MaxX_RBV",
+            "Sim[det1]:Stats1:MaxY_RBV",
+            "Sim[det1]:Stats1:MeanValue_RBV",
+            "Sim[det1]:Stats1:Sigma_RBV",
+            "Sim[det1]:Stats1:Total_RBV",
+            "Sim[det1]:Stats1:CentroidX_RBV",
+            "Sim[det1]:Stats1:CentroidY_RBV",
+            "Sim[det1]:Stats1:Histogram_RBV",
+            "Sim[det1]:Stats1:HistBelow_RBV",
+        )
+        assert stats_plugin_type_rbv_pv.read().data.tobytes().decode().startswith("NDPluginStats")
+
+        # Stats1 starts disabled, as ophyd enables it when it is staged
+        array_callbacks_pv.write(ArrayBasePVGroup.ArrayCallbacks.ENABLE, wait=True)
+        acquire_time_pv.write(0.01, wait=True)
+        acquire_pv.write(ArrayBasePVGroup.Acquire.ACQUIRE, wait=True, timeout=10)
+        assert stats_array_counter_rbv_pv.read().data[0] == 0
+
+        stats_enable_callbacks_pv.write(1, wait=True)
+        stats_blocking_callbacks_pv.write(1, wait=True)
+        stats_compute_histogram_pv.write(1, wait=True)
+        stats_hist_size_pv.write(16, wait=True)
+        stats_hist_min_pv.write(1000.0, wait=True)
+        stats_hist_max_pv.write(2000.0, wait=True)
+        acquire_pv.write(ArrayBasePVGroup.Acquire.ACQUIRE, wait=True, timeout=10)
+        frame = array_data_pv.read(timeout=10).data.view(">u2").reshape((64, 64))
+        assert stats_array_counter_rbv_pv.read().data[0] == 1
+
+        assert stats_min_value_rbv_pv.read().data[0] == frame.min()
+        assert stats_max_value_rbv_pv.read().data[0] == frame.max()
+        max_y, max_x = np.unravel_index(np.argmax(frame), frame.shape)
+        assert stats_max_x_rbv_pv.read().data[0] == max_x
+        assert stats_max_y_rbv_pv.read().data[0] == max_y
+        assert stats_mean_value_rbv_pv.read().data[0] == pytest.approx(frame.mean())
+        assert stats_sigma_rbv_pv.read().data[0] == pytest.approx(frame.std())
+        assert stats_total_rbv_pv.read().data[0] == frame.sum()
+        y, x = np.indices(frame.shape)
+        assert stats_centroid_x_rbv_pv.read().data[0] == pytest.approx(
+            np.sum(frame * x) / frame.sum()
+        )
+        assert stats_centroid_y_rbv_pv.read().data[0] == pytest.approx(
+            np.sum(frame * y) / frame.sum()
+        )
+        expected_histogram, _ = np.histogram(frame, bins=16, range=(1000.0, 2000.0))
+        np.testing.assert_array_equal(stats_histogram_rbv_pv.read().data, expected_histogram)
+        assert stats_hist_below_rbv_pv.read().data[0] == np.count_nonzero(frame < 1000)
+
+
+def test_new_perkin_elmer_detector_stats(tmp_path):
+    """
+    Stage, trigger and read the ophyd NewPerkinElmerDetector against the simulated IOC.
+    """
+    with ioc_process(image_generator=DiffractionImageGenerator(shape=(64, 64))):
+        pe_detector = NewPerkinElmerDetector("Sim[det1]:", name="pe")
+        pe_detector.tiff_writer.resource_root_path = tmp_path
+        pe_detector.wait_for_connection(timeout=10)
+        pe_detector.cam.acquire_time.put(0.01, wait=True)
+        pe_detector.cam.num_images.put(1, wait=True)
+
+        # the configuration is limited to PVs the IOC serves
+        configuration = pe_detector.stats1.read_configuration()
+        assert configuration["pe_stats1_compute_statistics"]["value"] == "Yes"
+        assert configuration["pe_stats1_hist_size"]["value"] == 256
+        assert "pe_stats1_enable" in pe_detector.stats1.describe_configuration()
+
+        pe_detector.stage()
+        try:
+            pe_detector.trigger().wait(timeout=10)
+            reading = pe_detector.stats1.read()
+        finally:
+            pe_detector.unstage()
+
+        client = CaprotoThreadingClient()
+        (array_data_pv,) = client.get_pvs("Sim[det1]:cam1:ArrayData")
+        frame = array_data_pv.read(timeout=10).data.view(">u2").reshape((64, 64))
+        assert reading["pe_stats1_total"]["value"] == frame.sum()
+        _, x = np.indices(frame.shape)
+        assert reading["pe_stats1_centroid_x"]["value"] == pytest.approx(
+            np.sum(frame * x) / frame.sum()
+        )
+
+
+def test_new_perkin_elmer_detector_tiff(tmp_path):
+    """
+    Each TIFF datum refers to the file written by the WriteFile after its
+    trigger, even if AutoSave was Yes before staging.
+    """
+    with ioc_process(
+        prefix="Sim[tiff]", image_generator=DiffractionImageGenerator(shape=(64, 64))
+    ):
+        pe_detector = NewPerkinElmerDetector("Sim[tiff]:", name="pe")
+        pe_detector.tiff_writer.resource_root_path = tmp_path
+        pe_detector.wait_for_connection(timeout=10)
+        pe_detector.cam.acquire_time.put(0.01, wait=True)
+        pe_detector.cam.num_images.put(1, wait=True)
+        pe_detector.cam.array_callbacks.put(1, wait=True)
+        # frames reach the plugin before Acquire completes
+        pe_detector.tiff_writer.blocking_callbacks.put(1, wait=True)
+        pe_detector.tiff_writer.auto_save.put(1, wait=True)  # Yes
+
+        pe_detector.stage()
+        try:
+            readings = []
+            for _ in range(2):
+                pe_detector.trigger().wait(timeout=10)
+                readings.append(pe_detector.read())
+                pe_detector.tiff_writer.write_file.put(1, wait=True)
+            asset_docs = list(pe_detector.collect_asset_docs())
+        finally:
+            pe_detector.unstage()
+        assert pe_detector.tiff_writer.auto_save.get(as_string=True) == "Yes"
+
+        (resource,) = [
+            doc for name, doc in asset_docs if name == "resource" and doc["spec"] == "AD_TIFF"
+        ]
+        datums = [
+            doc
+            for name, doc in asset_docs
+            if name == "datum" and doc["resource"] == resource["uid"]
+        ]
+        assert [reading["pe_image"]["value"] for reading in readings] == [
+            datum["datum_id"] for datum in datums
+        ]
+        write_path = tmp_path / resource["resource_path"]
+        datum_file_names = [
+            resource["resource_kwargs"]["template"]
+            % ("", resource["resource_kwargs"]["filename"], datum["datum_kwargs"]["point_number"])
+            for datum in datums
+        ]
+        # only the two WriteFile puts wrote files
+        assert sorted(path.name for path in write_path.iterdir()) == datum_file_names
+
+        # AutoSave writes every frame while the detector is not staged
+        client = CaprotoThreadingClient()
+        (acquire_pv,) = client.get_pvs("Sim[tiff]:cam1:Acquire")
+        acquire_pv.write(ArrayBasePVGroup.Acquire.ACQUIRE, wait=True, timeout=10)
+        assert len(list(write_path.iterdir())) == 3
+
+
+def test_new_perkin_elmer_detector_hdf5(tmp_path):
+    """
+    Stage, trigger and read the HDF5 writer of NewPerkinElmerDetectorWithHDF5,
+    then read its frames back through the AD_HDF5 handler.
+    """
+    pytest.importorskip("h5py")
+    handlers = pytest.importorskip("area_detector_handlers.handlers")
+
+    with ioc_process(
+        prefix="Sim[hdf5]", image_generator=DiffractionImageGenerator(shape=(64, 64))
+    ):
+        pe_detector = NewPerkinElmerDetectorWithHDF5("Sim[hdf5]:", name="pe")
+        pe_detector.tiff_writer.resource_root_path = tmp_path
+        pe_detector.hdf5_writer.resource_root_path = tmp_path
+        pe_detector.wait_for_connection(timeout=10)
+        pe_detector.cam.acquire_time.put(0.25, wait=True)
+        pe_detector.cam.num_images.put(2, wait=True)
+
+        client = CaprotoThreadingClient()
+        (array_data_pv,) = client.get_pvs("Sim[hdf5]:cam1:ArrayData")
+
+        def count(trigger_count):
+            pe_detector.stage()
+            try:
+                readings = []
+                for _ in range(trigger_count):
+                    pe_detector.trigger().wait(timeout=10)
+                    readings.append(pe_detector.read())
+                assert "pe_image_hdf5" in pe_detector.describe()
+                last_frame = array_data_pv.read(timeout=10).data.view(">u2")
+                asset_docs = list(pe_detector.collect_asset_docs())
+            finally:
+                # unstage closes the file
+                pe_detector.unstage()
+
+            (resource,) = [
+                doc
+                for name, doc in asset_docs
+                if name == "resource" and doc["spec"] == "AD_HDF5"
+            ]
+            datums = [
+                doc
+                for name, doc in asset_docs
+                if name == "datum" and doc["resource"] == resource["uid"]
+            ]
+            # the TIFF datums keep pe_image
+            assert [reading["pe_image_hdf5"]["value"] for reading in readings] == [
+                datum["datum_id"] for datum in datums
+            ]
+            assert all(
+                reading["pe_image"]["value"].split("/")[0] != resource["uid"]
+                for reading in readings
+            )
+            assert [datum["datum_kwargs"]["point_number"] for datum in datums] == list(
+                range(trigger_count)
+            )
+
+            handler = handlers.AreaDetectorHDF5Handler(
+                os.path.join(resource["root"], resource["resource_path"]),
+                **resource["resource_kwargs"],
+            )
+            try:
+                # the handler returns dask arrays, read them before close
+                frames = [
+                    np.asarray(handler(**datum["datum_kwargs"])) for datum in datums
+                ]
+            finally:
+                handler.close()
+            return resource, frames, last_frame.reshape((64, 64))
+
+        resource, frames, last_frame = count(trigger_count=3)
+        assert resource["resource_kwargs"]["frame_per_point"] == 2
+        assert [point_frames.shape for point_frames in frames] == [(2, 64, 64)] * 3
+        assert np.array_equal(frames[-1][-1], last_frame)
+
+        # an Average acquisition publishes one frame per trigger
+        pe_detector.stage_sigs["cam.image_mode"] = (
+            PerkinElmerCamera.PerkinElmerImageMode.AVERAGE
+        )
+        resource, frames, last_frame = count(trigger_count=2)
+        assert resource["resource_kwargs"]["frame_per_point"] == 1
+        assert [point_frames.shape for point_frames in frames] == [(1, 64, 64)] * 2
+        assert np.array_equal(frames[-1][-1], last_frame)
+
+
+def test_pe_count():
+    """
+    Run pe_count against the simulated IOC, each dark frame must be acquired
+    before it is written.
+    """
+    # ophyd shares one Channel Access context, its Sim[det1] PVs may still be
+    # searching for the IOC of an earlier test
+    with ioc_process(
+        prefix="Sim[pe_count]", image_generator=DiffractionImageGenerator(shape=(64, 64))
+    ):
+        # as get_pe_detector connects it
+        pe_detector = NewPerkinElmerDetector("Sim[pe_count]:", name="pe")
+        connect_device(pe_detector, timeout=10, signal_names=PE_COUNT_SIGNALS)
+        # the dark frames published between triggers are not captured to HDF5
+        assert "hdf5_writer" not in pe_detector.component_names
+
+        RE = RunEngine({})
+
+        async def wait_for_status(msg):
+            loop = asyncio.get_running_loop()
+            for status in msg.args:
+                await loop.run_in_executor(None, status.wait, 10)
+
+        RE.register_command("wait_for_status", wait_for_status)
+
+        # cam ArrayCounter_RBV when each file is written
+        write_file_array_counters = []
+
+        def msg_hook(msg):
+            if msg.command == "set" and msg.obj is pe_detector.tiff_writer.write_file:
+                write_file_array_counters.append(pe_detector.cam.array_counter.get())
+
+        RE.msg_hook = msg_hook
+        document_names = []
+        RE(
+            pe_count(
+                "pe_count",
+                exposure=0.5,
+                num_repetitions=2,
+                delay=0,
+                pe_detector=pe_detector,
+            ),
+            lambda name, doc: document_names.append(name),
+        )
+
+        # a dark frame and a light frame for each repetition
+        assert write_file_array_counters == [1, 2, 3, 4]
+        assert document_names.count("event") == 2
+
+
+def test_codec_plugin():
+    with ioc_process(image_generator=DiffractionImageGenerator(shape=(64, 64))):
+        client = CaprotoThreadingClient()
+        (
+            array_callbacks_pv,
+            acquire_pv,
+            acquire_time_pv,
+            array_data_pv,
+            codec_enable_callbacks_pv,
+            codec_blocking_callbacks_pv,
+            codec_compressor_pv,
+            codec_compressor_rbv_pv,
+            codec_array_data_pv,
+            codec_codec_rbv_pv,
+            codec_compressed_size_rbv_pv,
+            codec_comp_factor_rbv_pv,
+            codec_array_size0_rbv_pv,
+            codec_array_size1_rbv_pv,
+            codec_data_type_rbv_pv,
+        ) = client.get_pvs(
+            "Sim[det1]:cam1:ArrayCallbacks",
+            "Sim[det1]:cam1:Acquire",
+            "Sim[det1]:cam1:AcquireTime",
+            "Sim[det1]:cam1:ArrayData",
+            "Sim[det1]:Codec1:EnableCallbacks",
+            "Sim[det1]:Codec1:BlockingCallbacks",
+            "Sim[det1]:Codec1:Compressor",
+            "Sim[det1]:Codec1:Compressor_RBV",
+            "Sim[det1]:Codec1:ArrayData",
+            "Sim[det1]:Codec1:Codec_RBV",
+            "Sim[det1]:Codec1:CompressedSize_RBV",
+            "Sim[det1]:Codec1:CompFactor_RBV",
+            "Sim[det1]:Codec1:ArraySize0_RBV",
+            "Sim[det1]:Codec1:ArraySize1_RBV",
+            "Sim[det1]:Codec1:DataType_RBV",
+        )
+        compressors = [
+            compressor.decode()
+            for compressor in codec_compressor_pv.read(data_type="control").metadata.enum_strings
+        ]
+        assert compressors[codec_compressor_rbv_pv.read().data[0]] == available_codecs()[0]
+
+        array_callbacks_pv.write(ArrayBasePVGroup.ArrayCallbacks.ENABLE, wait=True)
+        acquire_time_pv.write(0.01, wait=True)
+        codec_enable_callbacks_pv.write(1, wait=True)
+        codec_blocking_callbacks_pv.write(1, wait=True)
+        codec_compressor_pv.write(compressors.index("zlib"), wait=True)
+
+        acquire_pv.write(ArrayBasePVGroup.Acquire.ACQUIRE, wait=True, timeout=10)
+        frame = array_data_pv.read(timeout=10).data.view(">u2").reshape((64, 64))
+        compressed = codec_array_data_pv.read(timeout=10).data
+        assert codec_codec_rbv_pv.read().data.tobytes().decode() == "zlib"
+        assert codec_compressed_size_rbv_pv.read().data[0] == len(compressed)
+        assert codec_comp_factor_rbv_pv.read().data[0] == pytest.approx(
+            frame.nbytes / len(compressed)
+        )
+        data_type = list(ND_DATA_TYPES.values())[codec_data_type_rbv_pv.read().data[0]]
+        decoded = decode_array(
+            compressed,
+            codec_codec_rbv_pv.read().data.tobytes().decode(),
+            shape=(codec_array_size1_rbv_pv.read().data[0], codec_array_size0_rbv_pv.read().data[0]),
+            dtype=data_type,
+        )
+        np.testing.assert_array_equal(decoded, frame)
+
+        # codecs that are not installed are rejected without a reply
+        missing_codecs = [
+            codec for codec in compressors if codec not in (NO_CODEC, *available_codecs())
+        ]
+        if missing_codecs:
+            codec_compressor_pv.write(compressors.index(missing_codecs[0]), wait=False)
+            assert codec_compressor_rbv_pv.read().data[0] == compressors.index("zlib")
+
+
+def test_replay_frames(tmp_path):
+    frames = np.arange(3 * 64 * 64, dtype=np.uint16).reshape((3, 64, 64))
+    np.save(tmp_path / "frames.npy", frames)
+
+    with ioc_process(image_generator=ReplayImageGenerator(tmp_path / "frames.npy")):
+        client = CaprotoThreadingClient()
+        array_callbacks_pv, acquire_pv, acquire_time_pv, array_data_pv = client.get_pvs(
+            "Sim[det1]:cam1:ArrayCallbacks",
+            "Sim[det1]:cam1:Acquire",
+            "Sim[det1]:cam1:AcquireTime",
+            "Sim[det1]:cam1:ArrayData",
+        )
+        array_callbacks_pv.write(ArrayBasePVGroup.ArrayCallbacks.ENABLE, wait=True)
+        acquire_time_pv.write(0.01, wait=True)
+        # the recorded frames are served in order, then again from the first
+        for frame in [*frames, frames[0]]:
+            acquire_pv.write(ArrayBasePVGroup.Acquire.ACQUIRE, wait=True, timeout=10)
+            array_data = array_data_pv.read(timeout=10).data.view(">u2").reshape((64, 64))
+            np.testing.assert_array_equal(array_data, frame)
+
+
+def test_replay_frames_larger_than_sensor(tmp_path):
+    frame_shape = (SimulatedPerkinElmerDetectorIoc.MAX_SIZE_Y + 1, 16)
+    np.save(tmp_path / "frames.npy", np.zeros((1, *frame_shape), dtype=np.uint16))
+
+    # ArrayData could not hold these frames
+    with pytest.raises(ValueError, match=r"frames of shape \(2049, 16\) are larger"):
+        SimulatedPerkinElmerDetectorIoc(
+            prefix="Sim[det1]",
+            macros=dict(camera="cam1"),
+            image_generator=ReplayImageGenerator(tmp_path / "frames.npy"),
+        )
+
+
+def test_ioc_stats(tmp_path):
+    stats_file_path = tmp_path / "ioc_stats.json"
+    with ioc_process(
+        image_generator=DiffractionImageGenerator(shape=(64, 64)), stats_file=stats_file_path
+    ) as ioc:
+        client = CaprotoThreadingClient()
+        (
+            acquire_time_pv,
+            file_name_pv,
+            update_interval_pv,
+            put_count_rbv_pv,
+            put_latency_max_rbv_pv,
+            slowest_put_rbv_pv,
+            summary_rbv_pv,
+            loop_lag_max_rbv_pv,
+            stats_file_pv,
+        ) = client.get_pvs(
+            "Sim[det1]:cam1:AcquireTime",
+            "Sim[det1]:TIFF1:FileName",
+            "Sim[det1]:IOCStats:UpdateInterval",
+            "Sim[det1]:IOCStats:PutCount_RBV",
+            "Sim[det1]:IOCStats:PutLatencyMax_RBV",
+            "Sim[det1]:IOCStats:SlowestPut_RBV",
+            "Sim[det1]:IOCStats:Summary_RBV",
+            "Sim[det1]:IOCStats:LoopLagMax_RBV",
+            "Sim[det1]:IOCStats:StatsFile",
+        )
+        assert stats_file_pv.read().data.tobytes().decode() == str(stats_file_path)
+        update_interval_pv.write(0.1, wait=True)
+        acquire_time_pv.write(0.5, wait=True)
+        file_name_pv.write("stats", wait=True)
+        # the update already waiting keeps the previous interval of 1s
+        time.sleep(1.5)
+
+        assert put_count_rbv_pv.read().data[0] >= 3
+        assert put_latency_max_rbv_pv.read().data[0] > 0
+        assert slowest_put_rbv_pv.read().data.tobytes().decode().startswith("Sim[det1]:")
+        assert loop_lag_max_rbv_pv.read().data[0] >= 0
+        summary = json.loads(summary_rbv_pv.read().data.tobytes().decode())
+        assert summary["put"]["Sim[det1]:TIFF1:FileName"]["count"] >= 1
+
+        # the IOC writes StatsFile when it shuts down on SIGINT
+        os.kill(ioc.pid, signal.SIGINT)
+        ioc.join(timeout=10)
+        with open(stats_file_path) as stats_file:
+            stats = json.load(stats_file)
+        assert stats["prefix"] == "Sim[det1]"
+        assert stats["put"]["Sim[det1]:cam1:AcquireTime"]["count"] >= 1
+        assert sum(stats["put"]["Sim[det1]:cam1:AcquireTime"]["counts"]) >= 1
+        assert len(stats["bucket_upper_bounds"]) == len(stats["loop_lag"]["counts"])
@@ -0,0 +1,25 @@
+import numpy as np
+import pytest
+
+from ophyd_addon.tiff import tiff_header, write_tiff
+
+
+@pytest.mark.parametrize("dtype", [np.uint8, np.uint16, np.int32, np.uint32, np.float32])
+def test_write_tiff(tmp_path, dtype):
+    tifffile = pytest.importorskip("tifffile")
+
+    image = np.arange(7 * 12, dtype=dtype).reshape((7, 12))
+    tiff_file_path = tmp_path / "image.tiff"
+    write_tiff(tiff_file_path, image)
+
+    assert tiff_file_path.stat().st_size == len(tiff_header(image)) + image.nbytes
+    tiff_image = tifffile.imread(tiff_file_path)
+    assert tiff_image.dtype == image.dtype
+    np.testing.assert_array_equal(tiff_image, image)
+
+
+def test_write_tiff_errors(tmp_path):
+    with pytest.raises(ValueError):
+        write_tiff(tmp_path / "image.tiff", np.zeros((2, 3, 4), dtype=np.uint16))
+    with pytest.raises(ValueError):
+        write_tiff(tmp_path / "image.tiff", np.zeros((2, 3), dtype=np.complex64))
@@ -0,0 +1,63 @@
+import asyncio
+import time
+
+import pytest
+
+import bluesky.plan_stubs as bps
+from bluesky import RunEngine
+
+from ophyd_addon.virtual_clock import (
+    RealClock,
+    ScaledClock,
+    SimulatedClock,
+    install_clock,
+    make_clock,
+)
+
+
+def test_make_clock():
+    assert isinstance(make_clock(1), RealClock)
+    assert isinstance(make_clock("10"), ScaledClock)
+    assert make_clock("10").time_scale == 10.0
+    assert isinstance(make_clock("simulated"), SimulatedClock)
+
+    with pytest.raises(ValueError):
+        make_clock(-1)
+
+
+def test_scaled_clock():
+    clock = ScaledClock(time_scale=100)
+
+    t0 = time.monotonic()
+    virtual_t0 = clock.monotonic()
+    asyncio.run(clock.sleep(asyncio.sleep, 20))
+    assert time.monotonic() - t0 < 1.0
+    assert clock.monotonic() - virtual_t0 >= 20
+
+
+def test_simulated_clock():
+    clock = SimulatedClock()
+
+    t0 = time.monotonic()
+    asyncio.run(clock.sleep(asyncio.sleep, 3600))
+    assert time.monotonic() - t0 < 1.0
+    assert clock.monotonic() == 3600
+
+    # a deadline in the past does not move the clock back
+    asyncio.run(clock.sleep_until(asyncio.sleep, 10))
+    assert clock.monotonic() == 3600
+
+
+def test_run_engine_clock():
+    clock = SimulatedClock()
+    RE = RunEngine()
+    install_clock(RE, clock)
+
+    def plan():
+        yield from bps.sleep(60)
+        yield from bps.sleep(0.5)
+
+    t0 = time.monotonic()
+    RE(plan())
+    assert time.monotonic() - t0 < 5.0
+    assert clock.monotonic() == 60.5
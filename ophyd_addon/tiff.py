@@ -0,0 +1,82 @@
+import struct
+import sys
+
+import numpy as np
+
+
+# TIFF tag field types
+_SHORT = 3
+_LONG = 4
+
+# TIFF SampleFormat values by numpy dtype kind
+_SAMPLE_FORMAT = {"u": 1, "i": 2, "f": 3}
+
+
+def tiff_header(image):
+    """
+    Return the header and image file directory of an uncompressed TIFF.
+
+    The image data follows the returned bytes as a single strip, so
+    write_tiff() can write the image buffer directly without copying it.
+
+    Parameters
+    ----------
+    image: numpy.ndarray
+        2D array of unsigned integers, signed integers or floats in
+        native byte order
+    """
+    if image.ndim != 2:
+        raise ValueError(f"expected a 2D image, not {image.ndim}D")
+    if image.dtype.kind not in _SAMPLE_FORMAT:
+        raise ValueError(f"can not write {image.dtype} images as TIFF")
+
+    byte_order = "<" if sys.byteorder == "little" else ">"
+    size_y, size_x = image.shape
+    tags = (
+        # (tag, field type, value)
+        (256, _LONG, size_x),  # ImageWidth
+        (257, _LONG, size_y),  # ImageLength
+        (258, _SHORT, image.dtype.itemsize * 8),  # BitsPerSample
+        (259, _SHORT, 1),  # Compression: none
+        (262, _SHORT, 1),  # PhotometricInterpretation: BlackIsZero
+        (273, _LONG, None),  # StripOffsets, filled in below
+        (277, _SHORT, 1),  # SamplesPerPixel
+        (278, _LONG, size_y),  # RowsPerStrip
+        (279, _LONG, image.nbytes),  # StripByteCounts
+        (339, _SHORT, _SAMPLE_FORMAT[image.dtype.kind]),  # SampleFormat
+    )
+    # 8 byte header, then the IFD: entry count, entries, next IFD offset
+    data_offset = 8 + 2 + 12 * len(tags) + 4
+
+    header = [
+        b"II" if byte_order == "<" else b"MM",
+        struct.pack(f"{byte_order}HI", 42, 8),
+        struct.pack(f"{byte_order}H", len(tags)),
+    ]
+    for tag, field_type, value in tags:
+        if value is None:
+            value = data_offset
+        if field_type == _SHORT:
+            # SHORT values are left-justified in the 4 byte value field
+            header.append(struct.pack(f"{byte_order}HHIHH", tag, field_type, 1, value, 0))
+        else:
+            header.append(struct.pack(f"{byte_order}HHII", tag, field_type, 1, value))
+    # no next IFD
+    header.append(struct.pack(f"{byte_order}I", 0))
+
+    return b"".join(header)
+
+
+def write_tiff(file_path, image):
+    """
+    Write a 2D numpy array as an uncompressed single-strip TIFF.
+
+    This is a minimal writer for the simulated IOC, the files can be read by
+    tifffile and therefore by the ADC_TIFF handler.
+    """
+    image = np.ascontiguousarray(image)
+    if not image.dtype.isnative:
+        image = image.astype(image.dtype.newbyteorder("="))
+    with open(file_path, "wb") as tiff_file:
+        tiff_file.write(tiff_header(image))
+        tiff_file.write(memoryview(image).cast("B"))
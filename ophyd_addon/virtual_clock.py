@@ -0,0 +1,117 @@
+import asyncio
+import math
+import os
+import time
+
+
+# set this in the environment of both the simulated IOC and the RunEngine
+# process to run them on the same virtual time, for example
+#     OPHYD_ADDON_TIME_SCALE=60         one real second is one virtual minute
+#     OPHYD_ADDON_TIME_SCALE=simulated  sleeps return at once
+TIME_SCALE_ENV = "OPHYD_ADDON_TIME_SCALE"
+
+
+class RealClock:
+    """
+    Sleep in real time.
+
+    Clocks sleep with the sleep function of whichever async library is
+    running, for example async_lib.library.sleep in a caproto IOC or
+    asyncio.sleep in a RunEngine.
+    """
+
+    time_scale = 1.0
+
+    def monotonic(self):
+        """
+        Return the virtual time in seconds.
+        """
+        return time.monotonic()
+
+    async def sleep_until(self, async_sleep, deadline):
+        """
+        Sleep until monotonic() reaches deadline, return at once if it has passed.
+        """
+        delay = deadline - self.monotonic()
+        if delay > 0:
+            await async_sleep(delay / self.time_scale)
+
+    async def sleep(self, async_sleep, seconds):
+        await self.sleep_until(async_sleep, self.monotonic() + seconds)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}()"
+
+
+class ScaledClock(RealClock):
+    """
+    Virtual time runs time_scale times faster than real time.
+
+    A 60 second sleep takes one real second with time_scale=60, so the
+    relative timing of everything that sleeps on this clock is kept.
+    """
+
+    def __init__(self, time_scale):
+        if not time_scale > 0:
+            raise ValueError(f"time_scale must be positive, not {time_scale}")
+        self.time_scale = time_scale
+        self._real_start = time.monotonic()
+
+    def monotonic(self):
+        return (time.monotonic() - self._real_start) * self.time_scale
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(time_scale={self.time_scale})"
+
+
+class SimulatedClock(RealClock):
+    """
+    Virtual time only advances when something sleeps.
+
+    Every sleep returns after yielding to the event loop once and moves
+    virtual time forward to its deadline. Concurrent sleepers each move
+    the clock to their own deadline, which keeps time monotonic but is not
+    a full discrete event simulation.
+    """
+
+    time_scale = math.inf
+
+    def __init__(self, start=0.0):
+        self._now = start
+
+    def monotonic(self):
+        return self._now
+
+    async def sleep_until(self, async_sleep, deadline):
+        self._now = max(self._now, deadline)
+        await async_sleep(0)
+
+
+def make_clock(time_scale=1.0):
+    """
+    Return a clock for time_scale, a number or "simulated".
+    """
+    if time_scale == "simulated":
+        return SimulatedClock()
+    time_scale = float(time_scale)
+    if time_scale == 1.0:
+        return RealClock()
+    return ScaledClock(time_scale)
+
+
+def clock_from_environment():
+    """
+    Return the clock specified by OPHYD_ADDON_TIME_SCALE, a RealClock if it is not set.
+    """
+    return make_clock(os.environ.get(TIME_SCALE_ENV, 1.0))
+
+
+def install_clock(RE, clock):
+    """
+    Make bps.sleep() in plans run by RE sleep on clock.
+    """
+
+    async def _sleep(msg):
+        await clock.sleep(asyncio.sleep, *msg.args)
+
+    RE.register_command(name="sleep", func=_sleep)